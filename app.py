@@ -1,17 +1,20 @@
 # import libraries
-import pandas as pd
-import csv
 import dash
 import dash_bootstrap_components as dbc
 from dash.dependencies import Output, Input
 from dash import dash_table
 from dash import dcc
 from dash import html
-from datetime import datetime
-from flask_caching import Cache
 from configparser import ConfigParser
-import time
-from function_folder import *
+from function_folder import dataset
+from function_folder import facet
+from function_folder import figure
+from function_folder import images
+from function_folder import jobs
+from function_folder import map_index
+from function_folder import memo
+from function_folder import metrics
+from function_folder import result_store
 # ----------------------------------------------------------------------------------------------------
 
 # load config
@@ -19,18 +22,14 @@ config = ConfigParser()
 config.read('config/config.ini')
 
 # define variables
-# dfine path mangrove_ts.csv
-PATH_TS = config['path']['path_ts']
 # define status button update
 UPDATE_STATUS = config['update']['status']
 if UPDATE_STATUS == 'True':
     UPDATE_STATUS = True
 else:
     UPDATE_STATUS = False
-# define timeout for memoize function
-TIMEOUT = int(config['timeout']['timeout_memoize'])
-# define timeout fpr updating data
-TIMEOUT_UPDATE = int(config['timeout']['timeout_update'])
+# define polling interval of the update status (ms)
+JOB_POLL = int(config['job']['poll'])
 # define Link GitHub
 LINK_GITHUB = config['link']['github']
 # define Link MANGROVE
@@ -44,48 +43,112 @@ FILTER_STATE = config['filter']['state']
 # ----------------------------------------------------------------------------------------------------
 
 
-# create app & cache
+# create app
 app = dash.Dash(external_stylesheets=[dbc.themes.SUPERHERO],
                 meta_tags=[{"name": "viewport",
                             "content": "width=device-width, initial-scale=1"}])
-# CACHE_DIR saves file
-cache = Cache(app.server, config={
-    'CACHE_TYPE': 'filesystem',
-    'CACHE_DIR': 'cache_directory'
-})
+# route for word cloud images
+images.register(app.server)
 # ----------------------------------------------------------------------------------------------------
 
 
 # functions
-# memoize data (kpi + business)
-@cache.memoize(timeout=TIMEOUT)
-def memoize_data():
-    return data_import.load_data()
-
-
 # load data business
 def business():
-    datasets = memoize_data()
-    return pd.read_json(datasets['business'], orient='split')
+    return dataset.holder.get()['business']
 
 
-# load data kpi
-def kpi():
-    datasets = memoize_data()
-    return pd.read_json(datasets['kpi'], orient='split')
+# load data kpi (cumulative series per review subject)
+def kpi_series():
+    return dataset.holder.get()['kpi_series']
 
 
-# load data similarity
+# load data similarity (top-k similarity index)
 def similarity():
-    datasets = memoize_data()
-    return pd.read_json(datasets['similarity'], orient='split')
+    return dataset.holder.get()['similarity']
+
+
+# load facet index (category -> country -> state)
+def facets(state=None):
+    return dataset.holder.get_derived('facet', facet.build_facet_index, state)
+
+
+# data version of a key of store_business (tuple -> list in the browser)
+def key_version(key):
+    version = key.get('version')
+    return tuple(version) if isinstance(version, list) else version
+
+
+# key of store_business -> (key, filtered business dataframe) (dataframe stays on the server)
+# result of the version of the key while it is stored, otherwise (e.g. after a reload) the filter is computed
+# again on the current datasets and the key of the current version is returned
+def resolve_business(key):
+    filter_key = (key_version(key), key['category'], key['country'], key['state'])
+    df = result_store.store.get(filter_key)
+    if df is not None:
+        return key, df
+    state = dataset.holder.state()
+    key = dict(key, version=state[0])
+    filter_key = (state[0],) + filter_key[1:]
+    return key, result_store.store.get_or_compute(filter_key, lambda: facets(state).take(key['category'],
+                                                                                         key['country'],
+                                                                                         key['state']))
+
+
+# filtered business dataframe to key of store_business
+def filtered_business(key):
+    return resolve_business(key)[1]
+
+
+# key of store_business -> (key, map index of the filtered business dataframe)
+# (grid of clusters, built once per version and filter)
+def map_index_business(key):
+    key, df = resolve_business(key)
+    map_key = (key_version(key), key['category'], key['country'], key['state'], 'map')
+    return key, result_store.store.get_or_compute(map_key, lambda: map_index.build_map_index(df))
+
+
+# key of store_business -> name and rating per sub of the filtered business dataframe
+# (lookups of a subject click, built once per version and filter)
+def subjects_business(key):
+    key, df = resolve_business(key)
+    lookup_key = (key_version(key), key['category'], key['country'], key['state'], 'subjects')
+    return result_store.store.get_or_compute(lookup_key, lambda: figure.SubjectLookup(df))
+
+
+# map of a filter (memoised by data version and filter, see memo.Memo)
+def fig_map_filter(key):
+    key = resolve_business(key)[0]
+
+    def compute():
+        with metrics.phase('data'):
+            index = map_index_business(key)[1]
+            view = index.fit()
+            points, clusters = index.query(view)
+        with metrics.phase('figure'):
+            # plain dict -> cheap to unpickle from the disk tier
+            return figure.map(points, clusters, view).to_dict()
+    return memo.memo.get_or_compute('fig_map', key_version(key),
+                                    [key['category'], key['country'], key['state']], compute)
+
+
+# numbers of a filter (lookup in the kpi cube of the facet index)
+def kpi_filter(key):
+    return figure.kpi_numbers(*facets().kpi(key['category'], key['country'], key['state']))
+
+
+# compute results of a facet after a new snapshot (see jobs.run_refresh)
+def warm_facet(category, country, state):
+    key = {'category': category, 'country': country, 'state': state, 'version': dataset.holder.version}
+    fig_map_filter(key)
+
+
+memo.memo.register_warmer(warm_facet)
 
 
 # create dropdown options for categories
 def options_category():
-    df = business()
-    df.sort_values(by=['category'], inplace=True)
-    return [{'label': i, 'value': i} for i in df['category'].unique()]
+    return [{'label': i, 'value': i} for i in facets().options_category()]
 # ----------------------------------------------------------------------------------------------------
 
 
@@ -98,6 +161,9 @@ style_div = {'padding': '10px',
 # css style dropdown box
 style_button = {'margin-top': '15px'}
 
+# css style update status
+style_job = {'margin-left': '15px'}
+
 # css style dropdown box
 style_box = {'margin-top': '15px'}
 
@@ -121,158 +187,185 @@ style_slider = {'color': '#ffffff',
                 'font-size': 'medium'}
 
 # part of layout
-controls = dbc.Card(
-    [
-        html.Div(
-            [
-                dbc.Label("Select category:"),
-                dcc.Dropdown(id='dropdown_category',
-                             options=options_category(),
-                             # default value
-                             value=FILTER_CATEGORY, style=style_dropdown)
-            ]
-        ),
-        html.Div(
-            [
-                dbc.Label("Select country:"),
-                dcc.Dropdown(id='dropdown_country',
-                             # options -> output from def
-                             # default value
-                             value=FILTER_COUNTRY, style=style_dropdown)
-            ]
-        ),
-        html.Div(
-            [
-                dbc.Label("Select state:"),
-                dcc.Dropdown(id='dropdown_state',
-                             # options -> output from def
-                             # default value
-                             value=FILTER_STATE, style=style_dropdown)
-            ]
-        ),
-    ],
-    body=True,
-    style=style_box
-)
-
-# layout
-app.layout = dbc.Container(
-    [
-        dcc.Store(id='store_business'),
-        dcc.Store(id='store_subject'),
-        dcc.Store(id='store_placeholder'),
-        # html.P -> Paragraph / Spacing
-        html.P(),
-        html.H1("Visualizing MANGROVE review subjects"),
-        dbc.Button("View on GitHub", outline=True, color="primary", className="me-1", href=LINK_GITHUB,
-                   style=style_button),
-        dbc.Button("Write Review", outline=True, color="primary", className="me-1", href=LINK_MANGROVE,
-                   style=style_button),
-        dbc.Button("Update Data", id='update_data_mangrove', outline=True, color="primary", className="me-1",
-                   n_clicks=0, disabled=UPDATE_STATUS, style=style_button),
-        html.Hr(),
-        dbc.Row(
-            [
-                dbc.Col(controls, md=2),
-                dbc.Col([dbc.Row([dbc.Col(html.Div([html.H5('Total number of review subjects:'),
-                                                    html.H6(id='text_filter_subject')], style=style_div), md=4),
-                                  dbc.Col(html.Div([html.H5('Total number of reviews:'),
-                                                    html.H6(id='text_filter_review')], style=style_div), md=4),
-                                  dbc.Col(html.Div([html.H5('Average rating (0 lowest - 100 highest):'),
-                                                    html.H6(id='text_filter_stars')], style=style_div), md=4)
-                                  ]),
-                         dbc.Row(dcc.Graph(id='fig_map'), style={'margin-top': '15px',
-                                                                 'margin-bottom': '15px'}),
-                         dbc.Row([dbc.Col(html.Div([html.H5('Name review subject:'),
-                                                    html.H6(id='name_subject')], style=style_div), md=3),
-                                  dbc.Col(html.Div([html.H5('Rating review subject:'),
-                                                    html.H6(id='rating_subject')], style=style_div), md=3),
-                                  dbc.Col(html.Div([html.H5('Number of reviews:'),
-                                                    html.H6(id='reviews_subject')], style=style_div), md=3),
-                                  dbc.Col(html.Div([html.H5('Review subject id:'),
-                                                    html.H6(id='text_subject_id')], style=style_div), md=3)
-                                  ]),
-                         dbc.Row(dbc.Col(html.Div([html.H5('Cumulative average rating & cumulative sum of all reviews of review subject over time'),
-                                                   dcc.Graph(id='fig_subject_kpi')], style=style_div))),
-                         dbc.Row([dbc.Col(html.Div([html.H5('Similarity table'),
-                                                    html.H6('Based on the selected review subject, \
-                                                    review subjects similar in content are suggested here.'),
-                                                    dash_table.DataTable(id='table',
-                                                                         style_cell_conditional=table_alignment,
-                                                                         style_as_list_view=table_view,
-                                                                         style_header=table_header,
-                                                                         style_data=table_data
-                                                                         ),
-                                                    html.P(),
-                                                    html.H5('Rating filter'),
-                                                    html.H6('Use the rating filter to customize the suggestion.'),
-                                                    html.P(),
-                                                    dcc.RangeSlider(id='range_slider',
-                                                                    min=0,
-                                                                    max=100,
-                                                                    marks={0: {'label': '0', 'style': style_slider},
-                                                                           20: {'label': '20', 'style': style_slider},
-                                                                           40: {'label': '40', 'style': style_slider},
-                                                                           60: {'label': '60', 'style': style_slider},
-                                                                           80: {'label': '80', 'style': style_slider},
-                                                                           100: {'label': '100', 'style': style_slider}},
-                                                                    step=10,
-                                                                    value=[0,100],
-                                                                    dots=True,
-                                                                    allowCross=False,
-                                                                    updatemode='mouseup',
-                                                                    tooltip={'always visible': False,
-                                                                             'placement': 'bottom'})], style=style_div), md=6),
-                                  dbc.Col(html.Div([html.H5('Word cloud'),
-                                                    html.Img(id='image', style=style_wordcloud)], style=style_div), md=6)
-                                  ])
-                         ], md=10)
-             ],
-            # filter menu in center -> by uncomment
-            #align="center",
-        ),
-    ],
-    fluid=True,
-)
+def controls():
+    return dbc.Card(
+        [
+            html.Div(
+                [
+                    dbc.Label("Select category:"),
+                    dcc.Dropdown(id='dropdown_category',
+                                 # options -> output from def
+                                 # default value
+                                 value=FILTER_CATEGORY, style=style_dropdown)
+                ]
+            ),
+            html.Div(
+                [
+                    dbc.Label("Select country:"),
+                    dcc.Dropdown(id='dropdown_country',
+                                 # options -> output from def
+                                 # default value
+                                 value=FILTER_COUNTRY, style=style_dropdown)
+                ]
+            ),
+            html.Div(
+                [
+                    dbc.Label("Select state:"),
+                    dcc.Dropdown(id='dropdown_state',
+                                 # options -> output from def
+                                 # default value
+                                 value=FILTER_STATE, style=style_dropdown)
+                ]
+            ),
+        ],
+        body=True,
+        style=style_box
+    )
+
+
+# layout (no data -> dash builds it while the app is imported, the data is loaded by the first callback)
+def serve_layout():
+    return dbc.Container(
+        [
+            dcc.Store(id='store_business'),
+            dcc.Store(id='store_subject'),
+            dcc.Store(id='store_job'),
+            dcc.Store(id='store_version'),
+            dcc.Interval(id='interval_job', interval=JOB_POLL, disabled=True),
+            # html.P -> Paragraph / Spacing
+            html.P(),
+            html.H1("Visualizing MANGROVE review subjects"),
+            dbc.Button("View on GitHub", outline=True, color="primary", className="me-1", href=LINK_GITHUB,
+                       style=style_button),
+            dbc.Button("Write Review", outline=True, color="primary", className="me-1", href=LINK_MANGROVE,
+                       style=style_button),
+            dbc.Button("Update Data", id='update_data_mangrove', outline=True, color="primary", className="me-1",
+                       n_clicks=0, disabled=UPDATE_STATUS, style=style_button),
+            html.Span(id='text_job', style=style_job),
+            html.Hr(),
+            dbc.Row(
+                [
+                    dbc.Col(controls(), md=2),
+                    dbc.Col([dbc.Row([dbc.Col(html.Div([html.H5('Total number of review subjects:'),
+                                                        html.H6(id='text_filter_subject')], style=style_div), md=4),
+                                      dbc.Col(html.Div([html.H5('Total number of reviews:'),
+                                                        html.H6(id='text_filter_review')], style=style_div), md=4),
+                                      dbc.Col(html.Div([html.H5('Average rating (0 lowest - 100 highest):'),
+                                                        html.H6(id='text_filter_stars')], style=style_div), md=4)
+                                      ]),
+                             dbc.Row(dcc.Graph(id='fig_map'), style={'margin-top': '15px',
+                                                                     'margin-bottom': '15px'}),
+                             dbc.Row([dbc.Col(html.Div([html.H5('Name review subject:'),
+                                                        html.H6(id='name_subject')], style=style_div), md=3),
+                                      dbc.Col(html.Div([html.H5('Rating review subject:'),
+                                                        html.H6(id='rating_subject')], style=style_div), md=3),
+                                      dbc.Col(html.Div([html.H5('Number of reviews:'),
+                                                        html.H6(id='reviews_subject')], style=style_div), md=3),
+                                      dbc.Col(html.Div([html.H5('Review subject id:'),
+                                                        html.H6(id='text_subject_id')], style=style_div), md=3)
+                                      ]),
+                             dbc.Row(dbc.Col(html.Div([html.H5('Cumulative average rating & cumulative sum of all reviews of review subject over time'),
+                                                       dcc.Graph(id='fig_subject_kpi')], style=style_div))),
+                             dbc.Row([dbc.Col(html.Div([html.H5('Similarity table'),
+                                                        html.H6('Based on the selected review subject, \
+                                                        review subjects similar in content are suggested here.'),
+                                                        dash_table.DataTable(id='table',
+                                                                             style_cell_conditional=table_alignment,
+                                                                             style_as_list_view=table_view,
+                                                                             style_header=table_header,
+                                                                             style_data=table_data
+                                                                             ),
+                                                        html.P(),
+                                                        html.H5('Rating filter'),
+                                                        html.H6('Use the rating filter to customize the suggestion.'),
+                                                        html.P(),
+                                                        dcc.RangeSlider(id='range_slider',
+                                                                        min=0,
+                                                                        max=100,
+                                                                        marks={0: {'label': '0', 'style': style_slider},
+                                                                               20: {'label': '20', 'style': style_slider},
+                                                                               40: {'label': '40', 'style': style_slider},
+                                                                               60: {'label': '60', 'style': style_slider},
+                                                                               80: {'label': '80', 'style': style_slider},
+                                                                               100: {'label': '100', 'style': style_slider}},
+                                                                        step=10,
+                                                                        value=[0,100],
+                                                                        dots=True,
+                                                                        allowCross=False,
+                                                                        updatemode='mouseup',
+                                                                        tooltip={'always visible': False,
+                                                                                 'placement': 'bottom'})], style=style_div), md=6),
+                                      dbc.Col(html.Div([html.H5('Word cloud'),
+                                                        html.Img(id='image', style=style_wordcloud)], style=style_div), md=6)
+                                      ])
+                             ], md=10)
+                 ],
+                # filter menu in center -> by uncomment
+                #align="center",
+            ),
+        ],
+        fluid=True,
+    )
+
+
+app.layout = serve_layout
 
 # ----------------------------------------------------------------------------------------------------
 
 
 # callbakcs to update data
-# callback to update data by hitting button
-@app.callback(Output('store_placeholder', 'data'),
+# callback to update data by hitting button (refresh runs in the background, see jobs.request_refresh)
+@app.callback(Output('store_job', 'data'),
               [Input('update_data_mangrove', 'n_clicks')])
 def update_data_mangrove(n):
     if n > 0:
-        now = datetime.now()
-        ts = now.timestamp()
-        with open(PATH_TS, 'r', encoding='UTF8', newline='') as f:
-            reader = csv.reader(f)
-            ts_old = float(next(reader)[0])
-        if ts - ts_old > TIMEOUT_UPDATE:
-            print(TIMEOUT_UPDATE)
-            print(ts_old)
-            print(ts)
-            list_ts = [ts]
-            with open(PATH_TS, 'w', encoding='UTF8', newline='') as f:
-                writer = csv.writer(f)
-                writer.writerow(list_ts)
-            source.get_new_data()
-            time.sleep(2)
-            preprocess.nlp_function()
-    return {}
+        return jobs.request_refresh()
+    return jobs.read_state()
+
+
+# data version of this worker (checked again -> a refresh which just finished in another worker is loaded)
+def data_version():
+    dataset.holder.refresh()
+    return str(dataset.holder.version)
+
+
+# callback to show the progress of the update (polling just while it runs)
+# not running (first page request, update finished) -> data version for the dropdowns
+@app.callback(Output('text_job', 'children'),
+              Output('interval_job', 'disabled'),
+              Output('store_version', 'data'),
+              [Input('interval_job', 'n_intervals'),
+               Input('store_job', 'data')])
+def cb_text_job(n, state_click):
+    state = jobs.read_state()
+    if state['status'] == 'running':
+        return 'Update running: ' + state['stage'] + ' ' + state['message'], False, dash.no_update
+    if state_click is not None and state_click.get('message') == 'data is up to date':
+        return 'Data is up to date', True, data_version()
+    if state['status'] == 'done':
+        return 'Last update finished', True, data_version()
+    if state['status'] in ['failed', 'interrupted']:
+        return 'Last update ' + state['status'] + ' ' + state.get('message', ''), True, data_version()
+    return '', True, data_version()
 # ----------------------------------------------------------------------------------------------------
 
 
 # callbacks dropdowns
+# callback to fill dropdown_category (first page request and when an update finished -> new data version)
+@app.callback(Output('dropdown_category', 'options'),
+              [Input('store_version', 'data')])
+def cb_dropdown_category(version):
+    with metrics.phase('data'):
+        return options_category()
+
+
 # callback to make dropdown_country dependent
 @app.callback(Output('dropdown_country', 'options'),
               [Input('dropdown_category', 'value')])
 def cb_dropdown_country(selected_category):
     # create options for country
-    df = business()
-    df.sort_values(by=['country'], inplace=True)
-    filtered_country = df[df['category'] == selected_category]['country'].unique()
+    with metrics.phase('data'):
+        filtered_country = facets().options_country(selected_category)
     # return options
     return [{'label': i, 'value': i} for i in filtered_country]
 
@@ -283,9 +376,8 @@ def cb_dropdown_country(selected_category):
                Input('dropdown_country', 'value')])
 def cb_dropdown_state(selected_category, selected_country):
     # create options for state
-    df = business()
-    df.sort_values(by=['state'], inplace=True)
-    filtered_state = df[(df['category'] == selected_category) & (df['country'] == selected_country)]['state'].unique()
+    with metrics.phase('data'):
+        filtered_state = facets().options_state(selected_category, selected_country)
     # return options
     return [{'label': i, 'value': i} for i in filtered_state]
 # ----------------------------------------------------------------------------------------------------
@@ -298,17 +390,27 @@ def cb_dropdown_state(selected_category, selected_country):
                Input('dropdown_country', 'value'),
                Input('dropdown_state', 'value')])
 def cb_store_business(selected_category, selected_country, selected_state):
-    # create filtered df
-    df = business()
-    filtered_df = df[(df['category'] == selected_category) & (df['country'] == selected_country) & (df['state'] == selected_state)]
-    # return filtered df
-    return filtered_df.to_json(orient='split')
+    # key of filtered df (filter + data version) -> df is resolved on the server
+    key = {'category': selected_category,
+           'country': selected_country,
+           'state': selected_state,
+           'version': dataset.holder.version}
+    # create filtered df (stored on the server)
+    with metrics.phase('data'):
+        filtered_business(key)
+    # popular facets are computed in advance after an update
+    memo.memo.count_facet(selected_category, selected_country, selected_state)
+    # return key
+    return key
 
 
 # callback store subject
 @app.callback(Output('store_subject', 'data'),
               [Input('fig_map', 'clickData')])
 def cb_store_subject(clickData):
+    # click on a cluster -> map zooms in, selected subject stays
+    if figure.is_cluster_click(clickData):
+        return dash.no_update
     # return data (json)
     return clickData
 # ----------------------------------------------------------------------------------------------------
@@ -316,12 +418,32 @@ def cb_store_subject(clickData):
 
 # callbacks figures
 # callback to update map
+# new filter -> whole filter, pan/zoom -> subjects of the viewport, cluster click -> zoom into cluster
 @app.callback(Output('fig_map', 'figure'),
-              [Input('store_business', 'data')])
-def cb_fig_map(store_browser_value):
-    store_browser_df = pd.read_json(store_browser_value, orient='split')
+              [Input('store_business', 'data'),
+               Input('fig_map', 'relayoutData'),
+               Input('fig_map', 'clickData')])
+def cb_fig_map(store_browser_value, relayout_data, click_data):
+    with metrics.phase('data'):
+        store_browser_value, index = map_index_business(store_browser_value)
+    triggered = [i['prop_id'] for i in dash.callback_context.triggered]
+    view = None
+    if 'fig_map.clickData' in triggered:
+        if figure.is_cluster_click(click_data) == False:
+            return dash.no_update
+        view = figure.cluster_view(click_data)
+        view['bounds'] = map_index.viewport_bounds(view['center'], view['zoom'])
+    elif 'fig_map.relayoutData' in triggered:
+        view = map_index.viewport(relayout_data)
+        if view is None:
+            return dash.no_update
+    if view is None:
+        return fig_map_filter(store_browser_value)
+    with metrics.phase('data'):
+        points, clusters = index.query(view)
     # return figure
-    return figure.map(store_browser_df)
+    with metrics.phase('figure'):
+        return figure.map(points, clusters, view)
 
 
 # callback to update info selected subject
@@ -337,9 +459,23 @@ def cb_fig_map(store_browser_value):
                Input('store_business', 'data'),
                Input('range_slider', 'value')])
 def cb_fig_subject(clickData_dccstore, store_browser_value2, list_slider):
-    df_kpi = kpi()
-    df_similarity = similarity()
-    return figure.kpi_review_subject(clickData_dccstore, store_browser_value2, list_slider, df_kpi, df_similarity)
+    store_browser_value2 = resolve_business(store_browser_value2)[0]
+
+    def compute():
+        with metrics.phase('data'):
+            series_kpi = kpi_series()
+            index_similarity = similarity()
+            df_filtered_business = filtered_business(store_browser_value2)
+            lookup = subjects_business(store_browser_value2)
+        with metrics.phase('figure'):
+            result = figure.kpi_review_subject(clickData_dccstore, df_filtered_business, list_slider, series_kpi,
+                                               index_similarity, lookup)
+            # figure as plain dict -> cheap to unpickle from the disk tier
+            return result[:4] + (result[4].to_dict(),) + result[5:]
+    # memoised by data version, subject, filter and slider
+    inputs = [clickData_dccstore['points'][0]['hovertext'], store_browser_value2['category'],
+              store_browser_value2['country'], store_browser_value2['state'], list_slider]
+    return memo.memo.get_or_compute('kpi_review_subject', key_version(store_browser_value2), inputs, compute)
 
 
 # callback to update info filter (sum rs / sum r / average stars)
@@ -348,7 +484,13 @@ def cb_fig_subject(clickData_dccstore, store_browser_value2, list_slider):
               Output('text_filter_stars', 'children'),
               [Input('store_business', 'data')])
 def cb_fig_filter(store_browser_value1):
-    return figure.kpi_filter(store_browser_value1)
+    with metrics.phase('data'):
+        return kpi_filter(store_browser_value1)
+# ----------------------------------------------------------------------------------------------------
+
+
+# latency, phases and payload size of all callbacks (see metrics.instrument)
+metrics.instrument(app)
 
 
 if __name__ == '__main__':
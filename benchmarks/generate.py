@@ -0,0 +1,110 @@
+import argparse
+import json
+import random
+from urllib.parse import quote
+
+# synthetic mangrove reviews (same json structure as api.mangrove.reviews/reviews)
+# subjects are spread over countries/states, opinions are built from a small english vocabulary
+
+# first iat of the synthetic reviews (after the default gt_iat of the pipeline)
+START_IAT = 1600000000
+# mean seconds between two reviews
+IAT_STEP = 600
+# share of reviews without opinion / with german opinion (filtered by the language check)
+SHARE_EMPTY = 0.2
+SHARE_GERMAN = 0.05
+
+COUNTRIES = {'Switzerland': (46.8, 8.2, ['Grisons', 'Zurich', 'Bern', 'Valais', 'Ticino']),
+             'Germany': (51.1, 10.4, ['Bavaria', 'Berlin', 'Hesse', 'Saxony', 'Hamburg']),
+             'United States': (39.8, -98.6, ['California', 'Texas', 'New York', 'Florida', 'Oregon']),
+             'France': (46.2, 2.2, ['Brittany', 'Normandy', 'Occitania', 'Grand Est']),
+             'Argentina': (-38.4, -63.6, ['Buenos Aires', 'Cordoba', 'Mendoza'])}
+CATEGORIES = ['restaurant', 'cafe', 'hotel', 'bar', 'museum', 'park', 'supermarket', 'bakery']
+NAME_WORDS = ['Golden', 'Blue', 'Old', 'Little', 'Royal', 'Green', 'Corner', 'River', 'Mountain', 'City',
+              'Garden', 'House', 'Kitchen', 'Lodge', 'Market', 'Square', 'Station', 'View']
+ADJECTIVES = ['great', 'friendly', 'slow', 'expensive', 'cheap', 'delicious', 'noisy', 'quiet', 'clean', 'cozy',
+              'crowded', 'amazing', 'average', 'terrible', 'lovely', 'fresh', 'cold', 'warm', 'helpful', 'rude']
+NOUNS = ['food', 'service', 'staff', 'view', 'coffee', 'room', 'price', 'atmosphere', 'location', 'beer', 'bread',
+         'music', 'terrace', 'breakfast', 'parking', 'selection', 'waiter', 'menu', 'garden', 'exhibition']
+GERMAN = ['Sehr gutes Essen und freundliche Bedienung', 'Leider etwas teuer aber schön gelegen',
+          'Wir kommen gerne wieder, tolles Frühstück']
+
+
+# review subjects -> list of dicts (sub, name, lat, lon, category, country, state)
+def generate_subjects(n_subjects, rng):
+    subjects = []
+    countries = list(COUNTRIES)
+    for i in range(n_subjects):
+        country = countries[i % len(countries)]
+        lat_center, lon_center, states = COUNTRIES[country]
+        # subjects cluster around a few places per country
+        state = rng.randrange(len(states))
+        lat = round(lat_center + (state - len(states) / 2) * 0.8 + rng.gauss(0, 0.3), 7)
+        lon = round(lon_center + (state - len(states) / 2) * 1.1 + rng.gauss(0, 0.4), 7)
+        name = '{} {} {}'.format(rng.choice(NAME_WORDS), rng.choice(NAME_WORDS), i)
+        sub = 'geo:{},{}?q={}&u=30'.format(lat, lon, quote(name))
+        subjects.append({'sub': sub, 'name': name, 'lat': lat, 'lon': lon, 'category': CATEGORIES[i % len(CATEGORIES)],
+                         'country': country, 'state': states[state]})
+    return subjects
+
+
+# opinion text of a review
+def generate_opinion(rng):
+    draw = rng.random()
+    if draw < SHARE_EMPTY:
+        return ''
+    if draw < SHARE_EMPTY + SHARE_GERMAN:
+        return rng.choice(GERMAN)
+    sentences = []
+    for i in range(rng.randint(1, 4)):
+        sentences.append('The {} was {} and the {} was {}.'.format(rng.choice(NOUNS), rng.choice(ADJECTIVES),
+                                                                    rng.choice(NOUNS), rng.choice(ADJECTIVES)))
+    return ' '.join(sentences)
+
+
+# reviews -> list of dicts in the format of the mangrove api (sorted by iat)
+# popular subjects get more reviews (zipf-like distribution)
+def generate_reviews(n_reviews, n_subjects=None, seed=0):
+    rng = random.Random(seed)
+    if n_subjects is None:
+        n_subjects = max(1, n_reviews // 10)
+    subjects = generate_subjects(n_subjects, rng)
+    weights = [1.0 / (i + 1) ** 0.8 for i in range(n_subjects)]
+    chosen = rng.choices(range(n_subjects), weights=weights, k=n_reviews)
+    reviews = []
+    iat = START_IAT
+    for i, position in enumerate(chosen):
+        subject = subjects[position]
+        iat += rng.randint(0, 2 * IAT_STEP)
+        reviews.append({'signature': 'synthetic{}'.format(i),
+                        'scheme': 'geo',
+                        'payload': {'sub': subject['sub'],
+                                    'rating': rng.choice([20, 40, 60, 80, 100, 100]),
+                                    'iat': iat,
+                                    'opinion': generate_opinion(rng)},
+                        'geo': {'coordinates': {'lat': subject['lat'], 'lon': subject['lon']}}})
+    return reviews, subjects
+
+
+# write reviews as json lines
+def write_reviews(reviews, path):
+    with open(path, 'w', encoding='UTF8') as f:
+        for review in reviews:
+            f.write(json.dumps(review, ensure_ascii=False) + '\n')
+
+
+def read_reviews(path):
+    with open(path, 'r', encoding='UTF8') as f:
+        return [json.loads(line) for line in f]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='generate synthetic mangrove reviews')
+    parser.add_argument('--reviews', type=int, default=10000)
+    parser.add_argument('--subjects', type=int, default=None)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', default='reviews.jsonl')
+    args = parser.parse_args()
+    reviews, subjects = generate_reviews(args.reviews, args.subjects, args.seed)
+    write_reviews(reviews, args.out)
+    print(str(len(reviews)) + ' reviews of ' + str(len(subjects)) + ' subjects written to ' + args.out)
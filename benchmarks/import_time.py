@@ -0,0 +1,82 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+# cold start of the web app: import of app.py in a new process (like a new or respawned worker)
+# fails (exit code 1) if the median is above the budget, if a pipeline module was imported
+# or if the import or the layout loaded the data (holder -> the first callback loads it)
+# usage: python benchmarks/import_time.py --runs 5 --budget 1.0
+
+PATH_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# maximum median import time (s)
+BUDGET = 1.0
+
+# modules of the pipeline (refresh) which the web app must not import
+MODULES_PIPELINE = ['nltk', 'sklearn', 'wordcloud', 'langdetect', 'scipy', 'function_folder.preprocess',
+                    'function_folder.source']
+
+# runs in the new process -> json with seconds of the import, the first layout and the first page
+# (layout and page with the data not loaded) and the steps which loaded the data
+CODE = '''
+import json, sys, time
+loaded = []
+start = time.perf_counter()
+import app
+from function_folder import dataset
+seconds_import = time.perf_counter() - start
+if dataset.holder.current is not None:
+    loaded.append('import')
+    dataset.holder.current = None
+start = time.perf_counter()
+app.serve_layout()
+seconds_layout = time.perf_counter() - start
+if dataset.holder.current is not None:
+    loaded.append('layout')
+    dataset.holder.current = None
+client = app.app.server.test_client()
+start = time.perf_counter()
+client.get('/')
+client.get('/_dash-layout')
+seconds_page = time.perf_counter() - start
+if dataset.holder.current is not None:
+    loaded.append('first_page')
+print(json.dumps({'import': seconds_import, 'layout': seconds_layout, 'first_page': seconds_page,
+                  'modules': [m for m in MODULES if m in sys.modules], 'loaded': loaded}))
+'''
+
+
+def run_once():
+    code = 'MODULES = ' + json.dumps(MODULES_PIPELINE) + '\n' + CODE
+    output = subprocess.run([sys.executable, '-c', code], cwd=PATH_REPO, check=True, capture_output=True,
+                            text=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='measure the cold start of the web app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--budget', type=float, default=BUDGET, help='maximum median import time (s)')
+    args = parser.parse_args()
+    results = [run_once() for i in range(args.runs)]
+    for name in ['import', 'layout', 'first_page']:
+        values = [result[name] for result in results]
+        print('{:<12} median {:.3f} s   min {:.3f} s   max {:.3f} s'.format(name, statistics.median(values),
+                                                                          min(values), max(values)))
+    modules = sorted(set(m for result in results for m in result['modules']))
+    loaded = sorted(set(step for result in results for step in result['loaded']))
+    median_import = statistics.median([result['import'] for result in results])
+    failed = False
+    if len(modules) > 0:
+        print('pipeline modules imported by the web app: ' + ', '.join(modules))
+        failed = True
+    if len(loaded) > 0:
+        print('data loaded by: ' + ', '.join(loaded))
+        failed = True
+    if median_import > args.budget:
+        print('import slower than the budget of ' + str(args.budget) + ' s')
+        failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,156 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import sys
+import time
+import tracemalloc
+from configparser import ConfigParser
+
+# benchmark of the pipeline and the web app on synthetic reviews
+# runs in its own workspace (config + data), the mangrove api and nominatim are local stand-ins
+# usage: python benchmarks/run.py --reviews 10000 100000 1000000
+
+PATH_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(PATH_REPO, 'benchmarks'))
+
+import generate
+import stand_in
+
+
+# workspace -> config with the stand-ins, empty data folders and the start images
+def create_workspace(path, url_mangrove, url_nominatim):
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.makedirs(os.path.join(path, 'config'))
+    config = ConfigParser()
+    config.read(os.path.join(PATH_REPO, 'config', 'config.ini'))
+    config['mangrove']['url'] = url_mangrove + '/reviews'
+    config['nominatim']['url'] = url_nominatim + '/search'
+    config['nominatim']['rate'] = '100000'
+    config['nominatim']['workers'] = '8'
+    config['geocode']['mode'] = 'nominatim'
+    with open(os.path.join(path, 'config', 'config.ini'), 'w', encoding='UTF8') as f:
+        config.write(f)
+    path_image = os.path.join(path, config['path']['path_image_start'])
+    os.makedirs(os.path.join(path_image, 'thumb'))
+    shutil.copy(os.path.join(PATH_REPO, 'data', 'mangrove_image', '_no_word_cloud.png'), path_image)
+    shutil.copy(os.path.join(PATH_REPO, 'data', 'mangrove_image', 'thumb', '_no_word_cloud.webp'),
+                os.path.join(path_image, 'thumb'))
+    os.makedirs(os.path.join(path, 'data', 'cache'), exist_ok=True)
+
+
+# peak resident memory of the process (mb)
+def max_rss():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux -> kb, macos -> bytes
+    if sys.platform == 'darwin':
+        return rss / 1024 / 1024
+    return rss / 1024
+
+
+# run fn and measure it -> (result, dict with seconds, peak of python allocations, peak rss)
+def measure(name, fn, memory=False):
+    if memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    seconds = time.perf_counter() - start
+    row = {'stage': name, 'seconds': round(seconds, 4), 'max_rss_mb': round(max_rss(), 1)}
+    if memory:
+        row['peak_alloc_mb'] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+        tracemalloc.stop()
+    print('{:<28} {:>10.3f} s'.format(name, seconds))
+    return result, row
+
+
+# callbacks of the web app for the default facet (cold -> computed, warm -> memo)
+def bench_app(rows, memory):
+    import app
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    # callbacks with callback_context need the triggering input
+    def trig(prop):
+        context_value.set(AttributeDict(triggered_inputs=[{'prop_id': prop, 'value': None}]))
+
+    category, country, state = app.FILTER_CATEGORY, app.FILTER_COUNTRY, app.FILTER_STATE
+    for run in ['cold', 'warm']:
+        _, row = measure('app dropdown ' + run, lambda: (app.cb_dropdown_country(category),
+                                                         app.cb_dropdown_state(category, country)), memory)
+        rows.append(row)
+        key, row = measure('app filter ' + run, lambda: app.cb_store_business(category, country, state), memory)
+        rows.append(row)
+        _, row = measure('app kpi ' + run, lambda: app.cb_fig_filter(key), memory)
+        rows.append(row)
+        trig('store_business.data')
+        _, row = measure('app map ' + run, lambda: app.cb_fig_map(key, None, None), memory)
+        rows.append(row)
+        # small datasets can have no subject in the default facet -> subject of all facets
+        key_subject = key
+        if len(app.filtered_business(key_subject)) == 0:
+            key_subject = app.cb_store_business('All', 'All', 'All')
+        sub = app.filtered_business(key_subject)['sub'].iloc[0]
+        _, row = measure('app subject ' + run,
+                         lambda: app.cb_fig_subject({'points': [{'hovertext': sub}]}, key_subject, [0, 100]), memory)
+        rows.append(row)
+    # whole world -> clusters
+    trig('fig_map.relayoutData')
+    relayout = {'mapbox.center': {'lon': 0, 'lat': 0}, 'mapbox.zoom': 1,
+                'mapbox._derived': {'coordinates': [[-180, 85], [180, 85], [180, -85], [-180, -85]]}}
+    key = app.cb_store_business('All', 'All', 'All')
+    _, row = measure('app map all', lambda: app.cb_fig_map(key, relayout, None), memory)
+    rows.append(row)
+
+
+# one benchmark run in a new process state (modules read the config of the workspace on import)
+def bench(n_reviews, seed, path_workspace, memory):
+    rows = []
+    print('--- ' + str(n_reviews) + ' reviews')
+    (reviews, subjects), row = measure('generate', lambda: generate.generate_reviews(n_reviews, seed=seed))
+    url_mangrove = stand_in.start(stand_in.mangrove_handler(reviews))
+    url_nominatim = stand_in.start(stand_in.nominatim_handler(subjects))
+    create_workspace(path_workspace, url_mangrove, url_nominatim)
+    os.chdir(path_workspace)
+    sys.path.insert(0, PATH_REPO)
+    from function_folder import data_import
+    from function_folder import preprocess
+    from function_folder import snapshot
+    from function_folder import source
+    _, row = measure('reviews + geocode', source.get_new_data, memory)
+    rows.append(row)
+    _, row = measure('nlp', preprocess.nlp_function, memory)
+    rows.append(row)
+    _, row = measure('snapshot', snapshot.write_snapshot, memory)
+    rows.append(row)
+    _, row = measure('load data', lambda: data_import.load_data(data_import.data_version()), memory)
+    rows.append(row)
+    bench_app(rows, memory)
+    return {'reviews': n_reviews, 'subjects': len(subjects), 'seed': seed, 'stages': rows}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='benchmark the pipeline and the web app on synthetic reviews')
+    parser.add_argument('--reviews', type=int, nargs='+', default=[10000])
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workspace', default=os.path.join(PATH_REPO, 'benchmarks', 'workspace'))
+    parser.add_argument('--memory', action='store_true', help='peak python allocations (tracemalloc, slower)')
+    parser.add_argument('--out', default=os.path.join(PATH_REPO, 'benchmarks', 'results.json'))
+    args = parser.parse_args()
+    if len(args.reviews) > 1:
+        # one process per size (imported modules keep the config and data of their workspace)
+        import subprocess
+        results = []
+        for n in args.reviews:
+            out = os.path.join(args.workspace, 'results_' + str(n) + '.json')
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--reviews', str(n), '--seed', str(args.seed),
+                            '--workspace', os.path.join(args.workspace, str(n)), '--out', out] +
+                           (['--memory'] if args.memory else []), check=True)
+            with open(out, 'r', encoding='UTF8') as f:
+                results.extend(json.load(f))
+    else:
+        results = [bench(args.reviews[0], args.seed, os.path.abspath(args.workspace), args.memory)]
+    with open(args.out, 'w', encoding='UTF8') as f:
+        json.dump(results, f, indent=2)
+    print('results written to ' + args.out)
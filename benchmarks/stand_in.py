@@ -0,0 +1,64 @@
+import bisect
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# local stand-ins for the mangrove api and nominatim (benchmarks never call the real services)
+
+
+# mangrove reviews endpoint -> reviews with iat > gt_iat, oldest first, at most limit
+def mangrove_handler(reviews):
+    reviews = sorted(reviews, key=lambda review: review['payload']['iat'])
+    iats = [review['payload']['iat'] for review in reviews]
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            start = bisect.bisect_right(iats, int(query.get('gt_iat', ['0'])[0]))
+            limit = int(query.get('limit', ['0'])[0])
+            stop = start + limit if limit > 0 else len(reviews)
+            body = json.dumps({'reviews': reviews[start:stop]}).encode('UTF8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler
+
+
+# nominatim search endpoint -> place of the subject at the center of the viewbox (category, state, country)
+def nominatim_handler(subjects):
+    places = {(round(subject['lon'], 7), round(subject['lat'], 7)): subject for subject in subjects}
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            lon_min, lat_min, lon_max, lat_max = [float(i) for i in query['viewbox'][0].split(',')]
+            position = (round((lon_min + lon_max) / 2, 7), round((lat_min + lat_max) / 2, 7))
+            subject = places.get(position)
+            result = []
+            if subject is not None:
+                result.append({'lat': str(subject['lat']), 'lon': str(subject['lon']), 'type': subject['category'],
+                               'address': {'state': subject['state'], 'country': subject['country']}})
+            body = json.dumps(result).encode('UTF8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+    return Handler
+
+
+# start server in a daemon thread -> base url
+def start(handler):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return 'http://127.0.0.1:{}'.format(server.server_address[1])
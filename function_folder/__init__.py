@@ -1 +1,13 @@
-__all__ = ['data_import', 'figure', 'source', 'preprocess']
+import importlib
+
+__all__ = ['data_import', 'dataset', 'facet', 'figure', 'geocode', 'images', 'ingest_store', 'jobs', 'kpi_series',
+           'language', 'map_index', 'mangrove_api', 'memo', 'metrics', 'source', 'preprocess', 'profiler',
+           'result_store', 'reverse_geocode', 'similarity_index', 'similarity_model', 'snapshot', 'sqlite_cache',
+           'text_store', 'tokens']
+
+
+# modules are imported on first use (web app -> no nltk, sklearn, wordcloud and langdetect)
+def __getattr__(name):
+    if name in __all__:
+        return importlib.import_module('.' + name, __name__)
+    raise AttributeError("module '" + __name__ + "' has no attribute '" + name + "'")
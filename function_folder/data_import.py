@@ -1,5 +1,9 @@
+import os
 import pandas as pd
 from configparser import ConfigParser
+from function_folder import similarity_index
+from function_folder import snapshot
+from function_folder import kpi_series
 
 # load config
 config = ConfigParser()
@@ -8,17 +12,50 @@ config.read('config/config.ini')
 # load path
 path_business = config['path']['path_business']
 path_kpi = config['path']['path_kpi']
-path_similarity = config['path']['path_similarity']
+path_similarity_index = config['path']['path_similarity_index']
+path_kpi_series = config['path']['path_kpi_series']
 
 
-# import data
-def load_data():
-    # load dataset
-    business = pd.read_csv(path_business)
-    kpi = pd.read_csv(path_kpi)
-    similarity = pd.read_csv(path_similarity, index_col=0)
-    # datasets to json
-    datasets = {'business': business.to_json(orient='split'),
-                'kpi': kpi.to_json(orient='split'),
-                'similarity': similarity.to_json(orient='split')}
+# data version
+# snapshot -> ('snapshot', name of the current version), switched atomically by snapshot.write_snapshot
+# no snapshot -> ('csv', modification time of all data files)
+def data_version():
+    version = snapshot.current_version()
+    if version is not None:
+        return ('snapshot', version)
+    version = ['csv']
+    for path in [path_business,
+                 path_kpi,
+                 os.path.join(path_similarity_index, similarity_index.FILE_SCORES),
+                 os.path.join(path_kpi_series, kpi_series.FILE_SUBJECTS)]:
+        if os.path.exists(path):
+            version.append(os.stat(path).st_mtime_ns)
+        else:
+            version.append(None)
+    return tuple(version)
+
+
+# import data of a version (see data_version)
+def load_data(version):
+    # columnar snapshot -> memory-mapped (shared by all workers), version directories never change
+    if version[0] == 'snapshot':
+        business = snapshot.read_dataset('business', version[1])
+        kpi = snapshot.read_dataset('kpi', version[1])
+        similarity = snapshot.read_similarity(version[1])
+        series = snapshot.read_kpi_series(version[1])
+    # no snapshot -> csv files (data before the first update, every update publishes a snapshot)
+    else:
+        business = pd.read_csv(path_business)
+        kpi = pd.read_csv(path_kpi)
+        similarity = similarity_index.load_index()
+        # series not written by the pipeline yet -> build from kpi
+        if kpi_series.series_exists():
+            series = kpi_series.load_series()
+        else:
+            series = kpi_series.build_series(kpi)
+    # parsed datasets (kept in process memory -> see dataset.holder)
+    datasets = {'business': business,
+                'kpi': kpi,
+                'similarity': similarity,
+                'kpi_series': series}
     return datasets
@@ -0,0 +1,95 @@
+import os
+import threading
+import time
+from configparser import ConfigParser
+from function_folder import data_import
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# seconds between two checks for changed data files (0 -> check on every call)
+RELOAD_INTERVAL = float(config['reload']['interval'])
+
+
+# parsed datasets of one data version, shared by all callbacks of the process
+# datasets are read-only -> callbacks must not change them in place (no copy is made)
+# load(version) -> datasets of exactly this version, caches keyed by version are never stale
+class DatasetHolder:
+    def __init__(self, load, get_version, interval=RELOAD_INTERVAL):
+        self.load = load
+        self.get_version = get_version
+        self.interval = interval
+        # current -> (version, datasets, derived), replaced as a whole on reload
+        # derived -> structures built from the datasets (e.g. facet index), rebuilt per version
+        self.current = None
+        self.lock = threading.Lock()
+        self.thread_pid = None
+
+    # version of the current datasets
+    @property
+    def version(self):
+        return self.state()[0]
+
+    # datasets of the current version (parsed just once per version)
+    def get(self):
+        return self.state()[1]
+
+    # structure derived from the datasets of the current version (build(datasets) is called once per version)
+    # state: (version, datasets, derived) of self.state() -> structure of exactly that version
+    def get_derived(self, name, build, state=None):
+        version, datasets, derived = self.state() if state is None else state
+        if name not in derived:
+            with self.lock:
+                if name not in derived:
+                    derived[name] = build(datasets)
+        return derived[name]
+
+    def state(self):
+        if self.interval <= 0 and self.current is not None:
+            self.refresh()
+        current = self.current
+        if current is None:
+            with self.lock:
+                if self.current is None:
+                    self.reload()
+                current = self.current
+        self.start()
+        return current
+
+    # parse datasets of the version and switch to them (old datasets stay valid for running callbacks)
+    def reload(self, version=None):
+        if version is None:
+            version = self.get_version()
+        datasets = self.load(version)
+        self.current = (version, datasets, {})
+
+    # check version -> reload if data files changed
+    def refresh(self):
+        version = self.get_version()
+        if self.current is None or version != self.current[0]:
+            with self.lock:
+                if self.current is None or version != self.current[0]:
+                    self.reload(version)
+
+    # background thread to reload changed data (one per process -> started again after fork)
+    def start(self):
+        if self.interval <= 0 or self.thread_pid == os.getpid():
+            return
+        self.thread_pid = os.getpid()
+        thread = threading.Thread(target=self.watch, daemon=True)
+        thread.start()
+
+    def watch(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.refresh()
+            except Exception as e:
+                # files can be in the middle of an update -> try again next time
+                print('reload of datasets failed')
+                print(e)
+
+
+# holder for the mangrove datasets
+holder = DatasetHolder(data_import.load_data, data_import.data_version)
@@ -0,0 +1,74 @@
+import itertools
+import numpy as np
+
+# option for all values of a level (category, country or state)
+ALL = 'All'
+
+
+# facet index category -> country -> state, built once per data version
+# dropdown options are sorted lists, filters are row positions into the business dataframe
+# cube -> (number of subjects, number of reviews, sum of ratings) per facet, also for ALL on every level
+class FacetIndex:
+    def __init__(self, df):
+        # df -> business dataframe the row positions refer to
+        self.df = df
+        # (category, country, state) -> row positions
+        self.rows = {}
+        groups = df.groupby(['category', 'country', 'state'], sort=False, observed=True).indices
+        for key, positions in groups.items():
+            self.rows[key] = np.sort(positions)
+        # kpi cube with rollups (every key with each level replaced by ALL or not)
+        review_count = df['review_count'].to_numpy()
+        rating = df['rating'].to_numpy(dtype=np.float64)
+        self.cube = {}
+        for key, positions in self.rows.items():
+            values = np.array([len(positions), review_count[positions].sum(), rating[positions].sum()])
+            for mask in itertools.product([False, True], repeat=3):
+                key_rollup = tuple(ALL if m else k for k, m in zip(key, mask))
+                self.cube[key_rollup] = self.cube.get(key_rollup, 0) + values
+        # sorted options per level
+        self.categories = sorted({key[0] for key in self.rows})
+        countries = {}
+        states = {}
+        for category, country, state in self.rows:
+            countries.setdefault(category, set()).add(country)
+            states.setdefault((category, country), set()).add(state)
+        self.countries = {key: sorted(value) for key, value in countries.items()}
+        self.states = {key: sorted(value) for key, value in states.items()}
+
+    # options dropdown category
+    def options_category(self):
+        return [ALL] + self.categories
+
+    # options dropdown country
+    def options_country(self, category):
+        if category == ALL:
+            return [ALL] + sorted({key[1] for key in self.rows})
+        return [ALL] + self.countries.get(category, [])
+
+    # options dropdown state
+    def options_state(self, category, country):
+        if category != ALL and country != ALL:
+            return [ALL] + self.states.get((category, country), [])
+        return [ALL] + sorted({key[2] for key in self.rows if category in [ALL, key[0]] and country in [ALL, key[1]]})
+
+    # number of subjects, number of reviews, sum of ratings of a facet (lookup in the cube)
+    def kpi(self, category, country, state):
+        values = self.cube.get((category, country, state))
+        if values is None:
+            return 0, 0, 0.0
+        return int(values[0]), int(values[1]), float(values[2])
+
+    # filtered business dataframe (ALL -> every value of the level)
+    def take(self, category, country, state):
+        if ALL in [category, country, state]:
+            keys = [key for key in self.rows if all(i in [ALL, j] for i, j in zip([category, country, state], key))]
+            positions = np.sort(np.concatenate([self.rows[key] for key in keys] + [np.empty(0, dtype=np.intp)]))
+        else:
+            positions = self.rows.get((category, country, state), np.empty(0, dtype=np.intp))
+        return self.df.take(positions)
+
+
+# build facet index from datasets (see dataset.holder.get_derived)
+def build_facet_index(datasets):
+    return FacetIndex(datasets['business'])
@@ -1,20 +1,17 @@
 import plotly.graph_objs as go
-import plotly.express as px
 from plotly.subplots import make_subplots
 import pandas as pd
 import numpy as np
-import base64
-from configparser import ConfigParser
+from function_folder import images
 
-# load config
-config = ConfigParser()
-config.read('config/config.ini')
-
-# load path
-path_image_start = config['path']['path_image_start']
+# marker of cluster points in customdata
+CLUSTER = 'cluster'
 
 # map
-def map(df):
+# view -> {'center', 'zoom'} of the map, clusters -> dataframe with lat, lon, count, rating, zoom (see map_index)
+def map(df, clusters=None, view=None):
+    # plotly.express (+ pillow) is imported with the first map, not when the web app starts
+    import plotly.express as px
     df_new = df.copy()
     # dummy column for size
     # df_new['dummy_column_for_size'] = 15
@@ -37,46 +34,81 @@ def map(df):
     fig.update_layout(margin={'r': 0, 't': 0, 'l': 0, 'b': 0})
     # change marker size
     fig.update_traces(marker={'size': 20})
+    # clusters -> bigger markers with number of subjects, colored by mean rating
+    if clusters is not None and clusters.shape[0] > 0:
+        fig.add_trace(go.Scattermapbox(lat=clusters['lat'],
+                                       lon=clusters['lon'],
+                                       mode='markers+text',
+                                       text=clusters['count'].astype(str),
+                                       hovertext=['{} review subjects, average rating {:.0f}'.format(i, j)
+                                                  for i, j in zip(clusters['count'], clusters['rating'])],
+                                       hoverinfo='text',
+                                       customdata=[[CLUSTER, i, j, k] for i, j, k in zip(clusters['lat'],
+                                                                                         clusters['lon'],
+                                                                                         clusters['zoom'])],
+                                       marker={'size': 20 + 6 * np.log2(clusters['count']),
+                                               'color': clusters['rating'],
+                                               'coloraxis': 'coloraxis'},
+                                       showlegend=False))
+    # view of the map (viewport of the user, cluster or whole filter)
+    if view is not None:
+        fig.update_layout(mapbox={'center': view['center'], 'zoom': view['zoom']})
     # return figure
     return fig
 
 
+# check if a click on the map hit a cluster
+def is_cluster_click(click_data):
+    if not click_data:
+        return False
+    custom_data = click_data['points'][0].get('customdata')
+    return isinstance(custom_data, list) and len(custom_data) == 4 and custom_data[0] == CLUSTER
+
+
+# view of a clicked cluster (zoom into it)
+def cluster_view(click_data):
+    cluster, lat, lon, zoom = click_data['points'][0]['customdata']
+    return {'center': {'lat': lat, 'lon': lon}, 'zoom': zoom}
+
+
 # kpi numbers filter
-def kpi_filter(df):
-    df_pandas = pd.read_json(df, orient='split')
-    sum_rs = df_pandas.shape[0]
-    sum_r = df_pandas['review_count'].sum()
-    average_stars = df_pandas['rating'].sum()/sum_rs
+def kpi_filter(df_pandas):
+    return kpi_numbers(df_pandas.shape[0], df_pandas['review_count'].sum(), df_pandas['rating'].sum())
+
+
+# kpi numbers from number of subjects, number of reviews and sum of ratings (see facet.FacetIndex.kpi)
+def kpi_numbers(sum_rs, sum_r, sum_rating):
+    average_stars = sum_rating / sum_rs if sum_rs > 0 else float('nan')
     return '{}'.format(sum_rs), '{}'.format(sum_r), '{:.0f}'.format(average_stars)
 
 
+# name and rating per sub of a filtered business dataframe (built once per data version and filter)
+# duplicated subs -> first row
+class SubjectLookup:
+    def __init__(self, df_filtered_business):
+        df = df_filtered_business[['sub', 'name', 'rating']].drop_duplicates('sub')
+        self.names = dict(zip(df['sub'], df['name']))
+        self.ratings = dict(zip(df['sub'], df['rating']))
+        # size in the result store
+        self.nbytes = int(df.memory_usage(index=False, deep=True).sum())
+
+
 # kpi selected review subject
-def kpi_review_subject(click_data, df_filtered_business, list_slider, df_kpi, df_similarity):
+# lookup -> SubjectLookup of df_filtered_business (None -> built for this call)
+def kpi_review_subject(click_data, df_filtered_business, list_slider, series_kpi, index_similarity, lookup=None):
     # function to get 3 similar review subjects
-    def get_3_similar_subjects(sub, list_slider, df_similarity):
+    def get_3_similar_subjects(sub, list_slider, index_similarity):
         # filter out subjects which are to small or to big (slider)
-        # but selected subject should not be filtered out -> this happens later
+        # subjects without comments are not in the similarity index -> query returns nothing
         f_small = int(list_slider[0])
         f_big = int(list_slider[1])
-        df_pd_filtered_slider = df_pd_filtered_business[((df_pd_filtered_business['rating'] >= f_small) & (df_pd_filtered_business['rating'] <= f_big)) |
-                                                        (df_pd_filtered_business['sub'] == sub)]
-        list_filtered_business = df_pd_filtered_slider.loc[:, 'sub'].tolist()
-        list_similarity_index = df_similarity.index.tolist()
-        # filter out subjects without comments (subjects without comments are not in similarity matrix)
-        list_filter = [i for i in list_filtered_business if i in list_similarity_index]
-        # check if sub has reviews
-        if sub in list_filter:
-            df_filter = df_similarity.loc[list_filter, [sub]]
-            df_most_similar = df_filter.nlargest(4, sub, keep='first')
-            # drop first row (similarity 1, to be investigated review subject)
-            df_most_similar.drop(index=df_most_similar.index[0], axis=0, inplace=True)
-            df_most_similar = pd.merge(df_most_similar, df_pd_filtered_business, left_index=True, right_on='sub', how='left')
-            df_most_similar_final = df_most_similar[['name', 'rating', sub]].rename(columns={sub: "similarity"})
-            df_most_similar_final.rating = df_most_similar_final.rating.round()
-            df_most_similar_final.similarity = df_most_similar_final.similarity.round(decimals=2)
-            return df_most_similar_final
-        else:
-            return df_pd_filtered_slider[['name', 'rating', 'sub']].iloc[0:0].rename(columns={'sub': "similarity"})
+        list_similar = index_similarity.query(sub, n=3, ratings=lookup.ratings, rating_range=(f_small, f_big))
+        df_most_similar_final = pd.DataFrame([(lookup.names[i], lookup.ratings[i], similarity)
+                                              for i, similarity in list_similar],
+                                             columns=['name', 'rating', 'similarity'])
+        df_most_similar_final.rating = df_most_similar_final.rating.round()
+        df_most_similar_final.similarity = df_most_similar_final.similarity.round(decimals=2)
+        return df_most_similar_final
 
     # function to create figure kpis
     def line_charts(df):
@@ -129,17 +161,10 @@ def kpi_review_subject(click_data, df_filtered_business, list_slider, df_kpi, df
         # return
         return fig
 
-    # function to load word cloud
-    def load_word_cloud():
-        try:
-            encoded_image = base64.b64encode(open(path_image, 'rb').read())
-        except FileNotFoundError:
-            path_error = path_image_start + '_no_word_cloud.png'
-            encoded_image = base64.b64encode(open(path_error, 'rb').read())
-        return encoded_image
-
-    # get pandas dataframe
-    df_pd_filtered_business = pd.read_json(df_filtered_business, orient='split')
+    # filtered business dataframe (shared -> no inplace changes)
+    df_pd_filtered_business = df_filtered_business
+    if lookup is None:
+        lookup = SubjectLookup(df_pd_filtered_business)
     # problem with the programm
     # business_id = clickData_dccstore['points'][0]['customdata'][3]
     # workaround
@@ -154,25 +179,14 @@ def kpi_review_subject(click_data, df_filtered_business, list_slider, df_kpi, df
     rating_subject = round(df_pd_filtered_business[df_pd_filtered_business['sub'] == sub]['rating'])
     # get review count
     reviews_subject = df_pd_filtered_business[df_pd_filtered_business['sub'] == sub]['review_count']
-    # filter by sub
-    df_kpi_f = df_kpi[df_kpi['sub'] == sub]
-    # mangrove-dataset is not sorted by date
-    if 'iat_original' in df_kpi_f.columns:
-        df_kpi_f = df_kpi_f.sort_values(by=['iat_original'])
-    # add new column -> number of reviews
-    df_kpi_f.insert(loc=3, column='review_n', value=np.arange(1, len(df_kpi_f)+1))
-    # add new column -> cum mean of stars_review
-    df_kpi_f.insert(loc=4, column='stars_review_cm', value=df_kpi_f.rating.cumsum()/df_kpi_f['review_n'])
+    # cumulative series of sub (pre-sorted by iat -> slice lookup, downsampled if too long)
+    df_kpi_f = series_kpi.get(sub)
     # create figure
     fig = line_charts(df_kpi_f)
     # get the three most similar review subjects
-    df_most_similar_final = get_3_similar_subjects(sub, list_slider, df_similarity)
+    df_most_similar_final = get_3_similar_subjects(sub, list_slider, index_similarity)
     columns = [{"name": i, "id": i} for i in df_most_similar_final.columns]
     data = df_most_similar_final.to_dict('records')
-    # workaround needed -> normal approach does not work
-    list_sub = list([i for i in sub if i.isalnum()])
-    sub_path = "".join(list_sub)
-    path_image = path_image_start + sub_path + '.png'
-    encoded_image = load_word_cloud()
-    src_image = 'data:image/png;base64,{}'.format(encoded_image.decode())
+    # url of word cloud (served by images.register -> cached by the browser)
+    src_image = images.image_url(sub)
     return sub, name_subject, rating_subject, reviews_subject, fig, columns, data, src_image
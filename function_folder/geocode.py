@@ -0,0 +1,142 @@
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+from math import cos
+from math import radians
+import requests
+from requests.adapters import HTTPAdapter
+from function_folder.sqlite_cache import SqliteCache
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+file_path_geocode_cache = config['path']['path_geocode_cache']
+# nominatim search endpoint (can point to a local stand-in server)
+NOMINATIM_URL = config['nominatim']['url']
+# allowed requests per second (usage policy of nominatim.openstreetmap.org -> 1)
+RATE = float(config['nominatim']['rate'])
+# number of concurrent requests
+WORKERS = int(config['nominatim']['workers'])
+# timeout of one request in seconds
+TIMEOUT = float(config['nominatim']['timeout'])
+# seconds until misses and client errors are asked again
+NEGATIVE_TTL = float(config['nominatim']['negative_ttl'])
+USER_AGENT = config['nominatim']['user_agent']
+
+
+# token bucket -> requests are spread exactly to the allowed rate (no worst-case sleeps)
+class TokenBucket:
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    # wait until a token is available
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.last) * self.rate)
+                self.last = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+# error which can go away on the next request (timeout, connection error, rate limit, server error)
+def is_transient(error):
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code == 429 or response.status_code >= 500
+    return True
+
+
+# bounding box of ~30 meters around a point
+def bounding_box(lon, lat):
+    # ~ 30 meters in lat
+    lat_30 = 1/3710
+    grad_lon_1 = 40075 * cos(radians(lat)) / 30 * 1000
+    helper_division = grad_lon_1 / 30
+    # ~ 30 meters in lon
+    lon_30 = 1 / helper_division
+    return str(lon-lon_30)+','+str(lat-lat_30)+','+str(lon+lon_30)+','+str(lat+lat_30)
+
+
+# nominatim client with pooled http session, rate limiter and persistent cache
+class Geocoder:
+    def __init__(self, url=NOMINATIM_URL, rate=RATE, workers=WORKERS, path_cache=file_path_geocode_cache):
+        self.url = url
+        self.workers = workers
+        self.limiter = TokenBucket(rate)
+        self.cache = SqliteCache(path_cache, 'geocode')
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(workers, 1))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # query parameters of a review subject
+    @staticmethod
+    def query(name, lon, lat):
+        return {'q': name,
+                'viewbox': bounding_box(lon, lat),
+                'bounded': '1',
+                'format': 'jsonv2',
+                'accept-language': 'en',
+                'addressdetails': '1'}
+
+    # cache key -> the query itself
+    @staticmethod
+    def cache_key(name, lon, lat):
+        return json.dumps([name, round(lon, 7), round(lat, 7)], ensure_ascii=False)
+
+    # search one review subject -> {'result': list of places} or {'error': text}
+    def search(self, name, lon, lat):
+        key = self.cache_key(name, lon, lat)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        self.limiter.acquire()
+        try:
+            r = self.session.get(self.url, params=self.query(name, lon, lat), timeout=TIMEOUT)
+            r.raise_for_status()
+            answer = {'result': r.json()}
+        except Exception as e:
+            answer = {'error': str(e)}
+            # transient errors -> not cached (asked again with the next update)
+            if is_transient(e):
+                return answer
+        # misses and client errors -> negative cache entry which expires
+        if 'error' in answer or len(answer['result']) == 0:
+            self.cache.set(key, answer, ttl=NEGATIVE_TTL)
+        else:
+            self.cache.set(key, answer)
+        return answer
+
+    # search many review subjects concurrently (list of (name, lon, lat)) -> answers in the same order
+    def search_many(self, queries):
+        if len(queries) == 0:
+            return []
+        with ThreadPoolExecutor(max_workers=max(self.workers, 1)) as executor:
+            return list(executor.map(lambda q: self.search(*q), queries))
+
+
+# geocoder of the process (created on first use)
+geocoder_instance = None
+geocoder_lock = threading.Lock()
+
+
+def geocoder():
+    global geocoder_instance
+    with geocoder_lock:
+        if geocoder_instance is None:
+            geocoder_instance = Geocoder()
+    return geocoder_instance
@@ -0,0 +1,126 @@
+import hashlib
+import os
+import threading
+from configparser import ConfigParser
+from flask import Response, abort, request
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+path_image_start = config['path']['path_image_start']
+# size variant used by the web app (full -> png 1600x800, thumb -> webp)
+IMAGE_SIZE = config['image']['size']
+# width of the thumbnails
+THUMB_WIDTH = int(config['image']['thumb_width'])
+# browser cache lifetime (urls contain the content hash -> files never change behind a url)
+MAX_AGE = 31536000
+
+# url of the word cloud route
+URL_START = '/wordcloud/'
+# image shown if there is no word cloud
+NAME_NO_WORD_CLOUD = '_no_word_cloud'
+# size variants -> (sub directory, file extension, mimetype)
+SIZES = {'full': ('', '.png', 'image/png'),
+         'thumb': ('thumb/', '.webp', 'image/webp')}
+
+# path -> (mtime, size, content hash)
+etags = {}
+etags_lock = threading.Lock()
+
+
+# file name of the word cloud of sub (just letters and digits)
+def sub_name(sub):
+    list_sub = list([i for i in sub if i.isalnum()])
+    return "".join(list_sub)
+
+
+# path of a word cloud
+def image_path(name, size='full'):
+    directory, extension, mimetype = SIZES[size]
+    return str(path_image_start) + directory + name + extension
+
+
+# existing word cloud file -> (path, mimetype), missing thumbnails fall back to the full image
+def find_image(name, size):
+    for size_try in [size, 'full']:
+        path = image_path(name, size_try)
+        if os.path.exists(path):
+            return path, SIZES[size_try][2]
+    return None, None
+
+
+# content hash of a file (computed again just if the file changed)
+def content_hash(path):
+    stat = os.stat(path)
+    with etags_lock:
+        cached = etags.get(path)
+    if cached is not None and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+        return cached[2]
+    with open(path, 'rb') as f:
+        etag = hashlib.sha1(f.read()).hexdigest()
+    with etags_lock:
+        etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+    return etag
+
+
+# url of the word cloud of sub (content hash in the url -> browser cache can keep it forever)
+def image_url(sub, size=IMAGE_SIZE):
+    name = sub_name(sub)
+    path, mimetype = find_image(name, size)
+    if path is None:
+        name = NAME_NO_WORD_CLOUD
+        path, mimetype = find_image(name, size)
+    return '{}{}/{}?v={}'.format(URL_START, size, name, content_hash(path)[:16])
+
+
+# flask route for word clouds
+def register(server):
+    @server.route(URL_START + '<size>/<name>')
+    def word_cloud_image(size, name):
+        # just names of word cloud files (letters, digits, _) -> no paths
+        if size not in SIZES or not all(i.isalnum() or i == '_' for i in name):
+            abort(404)
+        path, mimetype = find_image(name, size)
+        if path is None:
+            abort(404)
+        etag = content_hash(path)
+        # matching etag -> 304 without body
+        if etag in request.if_none_match:
+            response = Response(status=304)
+        else:
+            with open(path, 'rb') as f:
+                response = Response(f.read(), mimetype=mimetype)
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'public, max-age={}, immutable'.format(MAX_AGE)
+        return response
+
+
+# save pil image atomically (readers never see half-written files)
+def save_image(image, path, image_format, **options):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    path_tmp = path + '.tmp'
+    image.save(path_tmp, image_format, **options)
+    os.replace(path_tmp, path)
+
+
+# save full word cloud image (pil image)
+def save_full(image, name):
+    save_image(image, image_path(name), 'PNG', optimize=True)
+
+
+# smaller variant of a word cloud image (pil image)
+def save_thumbnail(image, name):
+    height = round(image.height * THUMB_WIDTH / image.width)
+    save_image(image.resize((THUMB_WIDTH, height)), image_path(name, 'thumb'), 'WEBP', quality=80)
+
+
+# create missing thumbnails for existing word clouds
+if __name__ == '__main__':
+    from PIL import Image
+    for file_name in sorted(os.listdir(path_image_start)):
+        if file_name.endswith('.png'):
+            name = file_name[:-len('.png')]
+            if os.path.exists(image_path(name, 'thumb')) == False:
+                save_thumbnail(Image.open(image_path(name)), name)
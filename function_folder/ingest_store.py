@@ -0,0 +1,171 @@
+import json
+import os
+import sqlite3
+import pandas as pd
+from configparser import ConfigParser
+from function_folder import profiler
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+# sqlite store of review subjects and kpi rows (pipeline and snapshot read it, the csv files are the data before
+# the first update and an export on request: python -m function_folder.ingest_store)
+file_path_ingest_store = config['path']['path_ingest_store']
+file_path_rs = config['path']['path_business']
+file_path_kpi = config['path']['path_kpi']
+
+# columns of the csv files
+COLUMNS_RS = ['sub', 'name', 'category', 'city', 'state', 'country', 'lat', 'lon', 'review_count', 'rating']
+COLUMNS_KPI = ['sub', 'rating', 'iat_original', 'iat']
+# details of a review subject (kept from the first ingest)
+COLUMNS_DETAILS = ['name', 'category', 'city', 'state', 'country', 'lat', 'lon']
+
+SCHEMA = ['CREATE TABLE IF NOT EXISTS subject (sub TEXT PRIMARY KEY, name TEXT, category TEXT, city TEXT, state TEXT, '
+          'country TEXT, lat REAL, lon REAL, review_count INTEGER, total_rating REAL)',
+          'CREATE INDEX IF NOT EXISTS subject_facet ON subject (category, country, state)',
+          'CREATE TABLE IF NOT EXISTS kpi (sub TEXT, rating REAL, iat_original INTEGER, iat TEXT)',
+          'CREATE INDEX IF NOT EXISTS kpi_sub ON kpi (sub, iat_original)',
+          'CREATE INDEX IF NOT EXISTS kpi_iat ON kpi (iat_original)',
+          'CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)']
+
+
+# review subjects + kpi rows
+# every page of reviews is one transaction (kpi rows, running sums per subject, watermark)
+class IngestStore:
+    def __init__(self, path=file_path_ingest_store):
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            for statement in SCHEMA:
+                self.connection.execute(statement)
+
+    def close(self):
+        self.connection.close()
+
+    def get_meta(self, key):
+        row = self.connection.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set_meta(self, key, value):
+        self.connection.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, json.dumps(value)))
+
+    # check if the store has data
+    def is_empty(self):
+        return self.connection.execute('SELECT COUNT(*) FROM meta WHERE key = ?', ('version',)).fetchone()[0] == 0
+
+    # details of existing review subjects (dataframe with COLUMNS_RS, just subs)
+    def subjects(self, subs):
+        rows = []
+        subs = list(subs)
+        # sqlite limits the number of variables per statement
+        for start in range(0, len(subs), 500):
+            chunk = subs[start:start + 500]
+            rows += self.connection.execute('SELECT sub, name, category, city, state, country, lat, lon, review_count, '
+                                            'total_rating / review_count FROM subject WHERE sub IN ({})'
+                                            .format(','.join('?' * len(chunk))), chunk).fetchall()
+        return pd.DataFrame(rows, columns=COLUMNS_RS)
+
+    # add kpi rows + review subjects of one page in a single transaction
+    # existing subjects -> review_count and total_rating are added up, details are kept
+    # empty page (e.g. no english review) -> just the watermark, the version stays (nothing to export)
+    @profiler.stage('ingest', arg=1)
+    def ingest(self, df_kpi, df_rs, watermark=None):
+        kpi_rows = list(df_kpi[COLUMNS_KPI].itertuples(index=False, name=None))
+        rs_rows = [(sub, name, category, city, state, country, float(lat), float(lon), int(review_count),
+                    float(review_count * rating))
+                   for sub, name, category, city, state, country, lat, lon, review_count, rating
+                   in df_rs[COLUMNS_RS].itertuples(index=False, name=None)]
+        with self.connection:
+            if len(kpi_rows) > 0 or len(rs_rows) > 0:
+                self.connection.executemany('INSERT INTO kpi (sub, rating, iat_original, iat) VALUES (?, ?, ?, ?)',
+                                            kpi_rows)
+                self.connection.executemany('INSERT INTO subject (sub, name, category, city, state, country, lat, '
+                                            'lon, review_count, total_rating) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?) '
+                                            'ON CONFLICT(sub) DO UPDATE SET '
+                                            'review_count = review_count + excluded.review_count, '
+                                            'total_rating = total_rating + excluded.total_rating', rs_rows)
+                self.set_meta('version', (self.get_meta('version') or 0) + 1)
+            if watermark is not None:
+                self.set_meta('watermark', watermark)
+
+    # import existing csv files (first use)
+    def import_csv(self):
+        if os.path.exists(file_path_rs):
+            df_rs = pd.read_csv(file_path_rs)
+        else:
+            df_rs = pd.DataFrame(columns=COLUMNS_RS)
+        if os.path.exists(file_path_kpi):
+            df_kpi = pd.read_csv(file_path_kpi)
+        else:
+            df_kpi = pd.DataFrame(columns=COLUMNS_KPI)
+        self.ingest(df_kpi, df_rs)
+        # csv files are up to date (no csv files -> empty store of version 0)
+        with self.connection:
+            if self.get_meta('version') is None:
+                self.set_meta('version', 0)
+            self.set_meta('exported', self.get_meta('version'))
+        print('csv files imported into the ingest store')
+
+    # write csv files if the store changed since the last export (whole store -> not part of an update)
+    # temporary file + rename -> readers never see half-written csv files
+    def export_csv(self):
+        version = self.get_meta('version')
+        if version == self.get_meta('exported'):
+            return False
+        for df, path in [(self.business(), file_path_rs), (self.kpi(), file_path_kpi)]:
+            path_tmp = path + '.tmp'
+            df.to_csv(path_tmp, index=False)
+            os.replace(path_tmp, path)
+        with self.connection:
+            self.set_meta('exported', version)
+        return True
+
+    # kpi rows after a row of the store (rows of the last pages) -> (dataframe with COLUMNS_KPI, last row)
+    def kpi_after(self, rowid):
+        df = pd.read_sql_query('SELECT rowid, sub, rating, iat_original, iat FROM kpi WHERE rowid > ? ORDER BY rowid',
+                               self.connection, params=(int(rowid),))
+        if len(df) > 0:
+            rowid = int(df['rowid'].iloc[-1])
+        return df[COLUMNS_KPI], rowid
+
+    # all review subjects (dataframe with COLUMNS_RS, sorted by sub)
+    def business(self):
+        return pd.read_sql_query('SELECT sub, name, category, city, state, country, lat, lon, review_count, '
+                                 'total_rating / review_count AS rating FROM subject ORDER BY sub', self.connection)
+
+    # kpi rows (dataframe with COLUMNS_KPI), gt_iat -> just rows of reviews after this iat
+    def kpi(self, gt_iat=None):
+        if gt_iat is None:
+            return pd.read_sql_query('SELECT sub, rating, iat_original, iat FROM kpi ORDER BY rowid', self.connection)
+        return pd.read_sql_query('SELECT sub, rating, iat_original, iat FROM kpi WHERE iat_original > ? ORDER BY rowid',
+                                 self.connection, params=(int(gt_iat),))
+
+
+# check if store exists
+def store_exists(path=file_path_ingest_store):
+    return os.path.exists(path)
+
+
+# open store (first use -> existing csv files are imported)
+def open_store(path=file_path_ingest_store):
+    store = IngestStore(path)
+    if store.is_empty():
+        store.import_csv()
+    return store
+
+
+# csv export of the store
+if __name__ == '__main__':
+    store = open_store()
+    try:
+        store.export_csv()
+    finally:
+        store.close()
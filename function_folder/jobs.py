@@ -0,0 +1,162 @@
+import csv
+import fcntl
+import json
+import os
+import threading
+import time
+import traceback
+from configparser import ConfigParser
+from datetime import datetime
+from function_folder import dataset
+from function_folder import memo
+from function_folder import profiler
+from function_folder import snapshot
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+PATH_TS = config['path']['path_ts']
+# lock file (held by the process which runs the refresh)
+file_path_job_lock = config['path']['path_job_lock']
+# state of the last refresh (status, stage, message, times)
+file_path_job_state = config['path']['path_job_state']
+# seconds between two refreshes
+TIMEOUT_UPDATE = int(config['timeout']['timeout_update'])
+# default facet of the web app (always warmed)
+FILTER_CATEGORY = config['filter']['category']
+FILTER_COUNTRY = config['filter']['country']
+FILTER_STATE = config['filter']['state']
+
+# stages of a refresh
+STAGES = ['reviews', 'nlp', 'snapshot', 'warm']
+
+# thread of the refresh in this process
+job_thread = None
+job_thread_lock = threading.Lock()
+
+
+# read state of the last refresh (running, but its process is gone -> process was stopped)
+# no lock is taken here -> polling workers never block a click in another worker (see request_refresh)
+def read_state():
+    if os.path.exists(file_path_job_state) == False:
+        return {'status': 'idle'}
+    with open(file_path_job_state, 'r', encoding='UTF8') as f:
+        state = json.load(f)
+    if state['status'] == 'running' and is_alive(state.get('pid')) == False:
+        state['status'] = 'interrupted'
+    return state
+
+
+# save state atomically (read by all web workers)
+def write_state(state):
+    os.makedirs(os.path.dirname(file_path_job_state), exist_ok=True)
+    path_tmp = file_path_job_state + '.' + str(os.getpid()) + '.tmp'
+    with open(path_tmp, 'w', encoding='UTF8') as f:
+        json.dump(state, f)
+    os.replace(path_tmp, file_path_job_state)
+
+
+# try to get the cross-process lock -> open file or None (another process runs a refresh)
+def acquire_lock():
+    os.makedirs(os.path.dirname(file_path_job_lock), exist_ok=True)
+    f = open(file_path_job_lock, 'a')
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+
+# check if the process of a refresh (pid of the state file) still exists
+def is_alive(pid):
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    # process of another user
+    except PermissionError:
+        return True
+    return True
+
+
+# time of the last refresh (mangrove_ts.csv)
+def last_refresh():
+    if os.path.exists(PATH_TS) == False:
+        return 0.0
+    with open(PATH_TS, 'r', encoding='UTF8', newline='') as f:
+        reader = csv.reader(f)
+        return float(next(reader)[0])
+
+
+def save_last_refresh(ts):
+    with open(PATH_TS, 'w', encoding='UTF8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow([ts])
+
+
+# refresh (runs in a thread, lock is held until the end)
+def run_refresh(lock_file):
+    # pipeline modules (nltk, sklearn, wordcloud, langdetect) are imported by the refresh, not by the web app
+    from function_folder import preprocess
+    from function_folder import source
+    state = {'status': 'running', 'stage': STAGES[0], 'message': '', 'started': time.time(), 'pid': os.getpid()}
+
+    # progress of the pipeline -> state file (polled by the web app)
+    def report(stage, message=''):
+        state['stage'] = stage
+        state['message'] = message
+        write_state(state)
+    try:
+        # one record per refresh in the run ledger (see profiler.run)
+        with profiler.run('refresh'):
+            report('reviews', 'loading new reviews')
+            source.get_new_data(report)
+            report('nlp', 'similarities and word clouds')
+            preprocess.nlp_function(report)
+            report('snapshot', 'publishing data')
+            # publish columnar snapshot for the web app
+            snapshot.write_snapshot()
+            # results of the most requested facets for the new version (web app registers the warmers)
+            report('warm', 'computing popular views')
+            dataset.holder.refresh()
+            memo.memo.warm(default=(FILTER_CATEGORY, FILTER_COUNTRY, FILTER_STATE))
+        state['status'] = 'done'
+        state['message'] = ''
+    except Exception:
+        traceback.print_exc()
+        state['status'] = 'failed'
+        state['message'] = traceback.format_exc(limit=1).strip().splitlines()[-1]
+    finally:
+        state['finished'] = time.time()
+        write_state(state)
+        lock_file.close()
+
+
+# start a refresh in the background -> state
+# running refresh (any process) -> clicks are merged into it, refresh just after timeout_update seconds
+def request_refresh():
+    global job_thread
+    with job_thread_lock:
+        if job_thread is not None and job_thread.is_alive():
+            return read_state()
+        lock_file = acquire_lock()
+        if lock_file is None:
+            return read_state()
+        # time check under the lock -> one refresh even with many workers
+        ts = datetime.now().timestamp()
+        if ts - last_refresh() <= TIMEOUT_UPDATE:
+            lock_file.close()
+            state = read_state()
+            state['message'] = 'data is up to date'
+            return state
+        save_last_refresh(ts)
+        write_state({'status': 'running', 'stage': STAGES[0], 'message': 'starting', 'started': time.time(),
+                     'pid': os.getpid()})
+        job_thread = threading.Thread(target=run_refresh, args=(lock_file,), daemon=True)
+        job_thread.start()
+        return read_state()
@@ -0,0 +1,190 @@
+import json
+import os
+import shutil
+import numpy as np
+import pandas as pd
+from configparser import ConfigParser
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+path_kpi_series = config['path']['path_kpi_series']
+# maximum number of points per series in the figure (0 -> no downsampling)
+MAX_POINTS = int(config['kpi_series']['max_points'])
+
+# file names inside the series directory
+FILE_SUBJECTS = 'subjects.json'
+FILE_META = 'meta.json'
+ARRAYS = ['offsets', 'iat_original', 'rating', 'review_n', 'stars_review_cm']
+
+
+# cumulative kpi series of all review subjects, rows of a subject sorted by iat
+# series of subject i -> rows offsets[i]:offsets[i + 1] of all arrays
+# kpi_rowid -> last row of the ingest store in the series (None -> unknown, series are built again)
+class KpiSeries:
+    def __init__(self, subjects, arrays, kpi_rowid=None):
+        self.subjects = list(subjects)
+        self.kpi_rowid = kpi_rowid
+        self.position = {sub: i for i, sub in enumerate(self.subjects)}
+        self.offsets = arrays['offsets']
+        self.iat_original = arrays['iat_original']
+        self.rating = arrays['rating']
+        self.review_n = arrays['review_n']
+        self.stars_review_cm = arrays['stars_review_cm']
+
+    def __contains__(self, sub):
+        return sub in self.position
+
+    # series of one subject (slice lookup), max_points > 0 -> downsampled with lttb
+    def get(self, sub, max_points=MAX_POINTS):
+        row = self.position.get(sub)
+        if row is None:
+            start, stop = 0, 0
+        else:
+            start, stop = self.offsets[row], self.offsets[row + 1]
+        iat_original = self.iat_original[start:stop]
+        review_n = self.review_n[start:stop]
+        stars_review_cm = self.stars_review_cm[start:stop]
+        if max_points > 0 and len(iat_original) > max_points:
+            keep = lttb(iat_original, stars_review_cm, max_points)
+            iat_original = iat_original[keep]
+            review_n = review_n[keep]
+            stars_review_cm = stars_review_cm[keep]
+        # copy of the slice (memory-mapped arrays are read-only)
+        return pd.DataFrame({'iat': pd.to_datetime(np.array(iat_original), unit='s'),
+                             'review_n': review_n,
+                             'stars_review_cm': stars_review_cm})
+
+
+# largest triangle three buckets -> indices of n_out points which keep the shape of the line
+def lttb(x, y, n_out):
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    keep = np.zeros(n_out, dtype=np.int64)
+    # first and last point are always kept, the rest is split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    selected = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        # average point of next bucket
+        next_start, next_stop = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        x_avg = x[next_start:next_stop].mean()
+        y_avg = y[next_start:next_stop].mean()
+        # point with the largest triangle (selected point, candidate, average next bucket)
+        area = np.abs((x[selected] - x_avg) * (y[start:stop] - y[selected]) -
+                      (x[selected] - x[start:stop]) * (y_avg - y[selected]))
+        selected = start + int(np.argmax(area))
+        keep[i + 1] = selected
+    keep[-1] = n - 1
+    return keep
+
+
+# build series from kpi dataframe (columns sub, rating, iat_original)
+def build_series(df_kpi, kpi_rowid=None):
+    # mangrove-dataset is not sorted by date
+    df = df_kpi[['sub', 'rating', 'iat_original']].sort_values(by=['sub', 'iat_original'], kind='mergesort')
+    subs = df['sub'].astype(str).to_numpy()
+    rating = df['rating'].to_numpy(dtype=np.float64)
+    # start of each subject
+    if len(subs) == 0:
+        starts = np.empty(0, dtype=np.int64)
+    else:
+        starts = np.flatnonzero(np.r_[True, subs[1:] != subs[:-1]])
+    offsets = np.r_[starts, len(subs)].astype(np.int64)
+    lengths = np.diff(offsets)
+    # number of reviews + cumulative mean of rating per subject
+    review_n = np.arange(1, len(subs) + 1, dtype=np.int64) - np.repeat(starts, lengths)
+    cumsum = np.cumsum(rating)
+    cumsum_before = np.repeat(np.r_[0.0, cumsum][starts], lengths)
+    stars_review_cm = (cumsum - cumsum_before) / review_n
+    arrays = {'offsets': offsets,
+              'iat_original': df['iat_original'].to_numpy(dtype=np.int64),
+              'rating': rating,
+              'review_n': review_n,
+              'stars_review_cm': stars_review_cm}
+    return KpiSeries(subs[starts].tolist(), arrays, kpi_rowid)
+
+
+# splice the complete series of some subjects (part) into the series
+# rows of changed subjects are replaced, new subjects are appended (untouched rows are copied as blocks)
+def splice_series(series, part, kpi_rowid=None):
+    replaced = sorted((series.position[sub], i) for i, sub in enumerate(part.subjects) if sub in series.position)
+    added = [i for i, sub in enumerate(part.subjects) if sub not in series.position]
+    lengths_part = np.diff(part.offsets)
+    lengths = np.concatenate([np.diff(series.offsets), lengths_part[added]])
+    for row, i in replaced:
+        lengths[row] = lengths_part[i]
+    arrays = {'offsets': np.r_[0, np.cumsum(lengths)].astype(np.int64)}
+    for name in ARRAYS[1:]:
+        old, new = getattr(series, name), getattr(part, name)
+        chunks = []
+        position = 0
+        for row, i in replaced:
+            chunks.append(old[position:series.offsets[row]])
+            chunks.append(new[part.offsets[i]:part.offsets[i + 1]])
+            position = series.offsets[row + 1]
+        chunks.append(old[position:])
+        chunks += [new[part.offsets[i]:part.offsets[i + 1]] for i in added]
+        arrays[name] = np.concatenate(chunks).astype(new.dtype, copy=False)
+    return KpiSeries(series.subjects + [part.subjects[i] for i in added], arrays, kpi_rowid)
+
+
+# add new kpi rows (columns sub, rating, iat_original) -> series of the affected subjects are computed again
+# cost scales with the new rows + the rows of their subjects
+def update_series(series, df_kpi, kpi_rowid=None):
+    subs = [sub for sub in df_kpi['sub'].astype(str).unique() if sub in series.position]
+    slices = [slice(series.offsets[series.position[sub]], series.offsets[series.position[sub] + 1]) for sub in subs]
+    df_old = pd.DataFrame({'sub': np.repeat(np.array(subs, dtype=object), [i.stop - i.start for i in slices]),
+                           'rating': np.concatenate([series.rating[i] for i in slices] + [np.empty(0)]),
+                           'iat_original': np.concatenate([series.iat_original[i] for i in slices] +
+                                                          [np.empty(0, dtype=np.int64)])})
+    # old rows first -> same order as a build over all rows (stable sort by iat)
+    part = build_series(pd.concat([df_old, df_kpi[['sub', 'rating', 'iat_original']]], ignore_index=True))
+    return splice_series(series, part, kpi_rowid)
+
+
+# save series (temporary directory, then swapped -> an interrupted save leaves the old series or none)
+def save_series(series, path=path_kpi_series):
+    path = os.path.normpath(path)
+    path_tmp = path + '.tmp'
+    if os.path.exists(path_tmp):
+        shutil.rmtree(path_tmp)
+    os.makedirs(path_tmp)
+    for name in ARRAYS:
+        np.save(os.path.join(path_tmp, name + '.npy'), getattr(series, name))
+    with open(os.path.join(path_tmp, FILE_META), 'w', encoding='UTF8') as f:
+        json.dump({'kpi_rowid': series.kpi_rowid}, f)
+    with open(os.path.join(path_tmp, FILE_SUBJECTS), 'w', encoding='UTF8') as f:
+        json.dump(series.subjects, f, ensure_ascii=False)
+    if os.path.exists(path):
+        path_old = path + '.old'
+        if os.path.exists(path_old):
+            shutil.rmtree(path_old)
+        os.rename(path, path_old)
+        os.rename(path_tmp, path)
+        shutil.rmtree(path_old)
+    else:
+        os.rename(path_tmp, path)
+
+
+# check if series exist
+def series_exists(path=path_kpi_series):
+    return os.path.exists(os.path.join(path, FILE_SUBJECTS))
+
+
+# load series (mmap=True -> arrays are memory-mapped, read-only)
+def load_series(path=path_kpi_series, mmap=False):
+    with open(os.path.join(path, FILE_SUBJECTS), 'r', encoding='UTF8') as f:
+        subjects = json.load(f)
+    mmap_mode = 'r' if mmap and len(subjects) > 0 else None
+    arrays = {name: np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS}
+    kpi_rowid = None
+    if os.path.exists(os.path.join(path, FILE_META)):
+        with open(os.path.join(path, FILE_META), 'r', encoding='UTF8') as f:
+            kpi_rowid = json.load(f)['kpi_rowid']
+    return KpiSeries(subjects, arrays, kpi_rowid)
@@ -0,0 +1,91 @@
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from configparser import ConfigParser
+from langdetect import DetectorFactory
+from langdetect import detect
+from langdetect.lang_detect_exception import LangDetectException
+from function_folder.sqlite_cache import SqliteCache
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+file_path_language_cache = config['path']['path_language_cache']
+# number of processes for detection (0 -> number of cpus, 1 -> no pool)
+WORKERS = int(config['language']['workers'])
+# smaller batches are detected in the process (starting a pool costs more)
+MIN_BATCH = int(config['language']['min_batch'])
+# texts with fewer letters are not detected (langdetect is unreliable for e.g. 'ok!' or 'Top')
+MIN_LETTERS = int(config['language']['min_letters'])
+# language of these short texts -> english like empty text fields (the rating of the review is kept)
+SHORT_LANGUAGE = 'en'
+
+# langdetect is random -> fixed seed, the same text always gets the same language
+DetectorFactory.seed = 0
+
+# cache of the process (created on first use)
+cache_instance = None
+
+
+def cache():
+    global cache_instance
+    if cache_instance is None:
+        cache_instance = SqliteCache(file_path_language_cache, 'language')
+    return cache_instance
+
+
+# cache key of a text
+def text_hash(text):
+    return hashlib.sha1(text.encode('UTF8')).hexdigest()
+
+
+# language of a text without detection (None -> detection needed)
+# empty text fields count as english, texts without letters can not be detected,
+# texts with less than MIN_LETTERS letters get SHORT_LANGUAGE
+def short_circuit(text):
+    if text == '':
+        return 'en'
+    letters = sum(1 for i in text if i.isalpha())
+    if letters == 0:
+        return 'Other'
+    if letters < MIN_LETTERS:
+        return SHORT_LANGUAGE
+    return None
+
+
+# recognize language (when there is a 'LangDetectException' error, term 'Other' will be inserted)
+def check_language(text):
+    language = short_circuit(text)
+    if language is not None:
+        return language
+    try:
+        return detect(text)
+    except LangDetectException:
+        return 'Other'
+
+
+# languages of many texts (list) -> list in the same order
+# known texts come from the cache, new texts are detected (in a process pool for large batches)
+def detect_many(texts):
+    languages = [short_circuit(text) for text in texts]
+    keys = {}
+    for i, text in enumerate(texts):
+        if languages[i] is None:
+            keys.setdefault(text_hash(text), []).append(i)
+    cached = cache().get_many(keys)
+    todo = [key for key in keys if key not in cached]
+    todo_texts = [texts[keys[key][0]] for key in todo]
+    if len(todo_texts) >= MIN_BATCH and WORKERS != 1:
+        with ProcessPoolExecutor(max_workers=WORKERS or None) as executor:
+            detected = list(executor.map(check_language, todo_texts, chunksize=64))
+    else:
+        detected = [check_language(text) for text in todo_texts]
+    new = dict(zip(todo, detected))
+    cache().set_many(new)
+    cached.update(new)
+    for key, positions in keys.items():
+        for i in positions:
+            languages[i] = cached[key]
+    print(str(len(todo)) + ' text(s) detected, ' + str(len(keys) - len(todo)) + ' from cache')
+    return languages
@@ -0,0 +1,126 @@
+import json
+import os
+from configparser import ConfigParser
+import pandas as pd
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from function_folder import profiler
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+file_path_kpi = config['path']['path_kpi']
+# reviews endpoint (can point to a local stand-in server)
+MANGROVE_URL = config['mangrove']['url']
+# reviews per request (0 -> everything in one request)
+PAGE_SIZE = int(config['mangrove']['page_size'])
+# retries of failed requests (connection errors, 429, 5xx) with exponential backoff
+RETRIES = int(config['mangrove']['retries'])
+BACKOFF = float(config['mangrove']['backoff'])
+TIMEOUT = float(config['mangrove']['timeout'])
+
+# iat of the first review in the dataset
+START_IAT = 1580915880
+# fields of a review -> columns of the reviews dataframe
+FIELDS = {'payload.sub': ('payload', 'sub'),
+          'scheme': ('scheme',),
+          'payload.rating': ('payload', 'rating'),
+          'geo.coordinates.lon': ('geo', 'coordinates', 'lon'),
+          'geo.coordinates.lat': ('geo', 'coordinates', 'lat'),
+          'payload.iat': ('payload', 'iat'),
+          'payload.opinion': ('payload', 'opinion')}
+
+
+# value of a nested field (None if missing)
+def field(review, keys):
+    value = review
+    for key in keys:
+        if isinstance(value, dict) == False:
+            return None
+        value = value.get(key)
+    return value
+
+
+# id of a review (signature, payload if there is no signature)
+def review_id(review):
+    signature = review.get('signature')
+    if signature is None:
+        return json.dumps(review.get('payload'), sort_keys=True)
+    return signature
+
+
+# watermark -> {'iat': iat, 'signatures': ids of the reviews with this iat}
+# first update -> newest review in mangrove_kpi.csv (later the watermark is saved in the ingest store)
+def load_watermark():
+    if os.path.exists(file_path_kpi):
+        return {'iat': int(pd.read_csv(file_path_kpi, usecols=['iat_original'])['iat_original'].max()),
+                'signatures': []}
+    return {'iat': START_IAT, 'signatures': []}
+
+
+# one page of reviews -> (dataframe with FIELDS columns + review_id, watermark after this page)
+def page_frame(reviews, watermark):
+    reviews = sorted(reviews, key=lambda review: field(review, ('payload', 'iat')))
+    df = pd.DataFrame({column: [field(review, keys) for review in reviews] for column, keys in FIELDS.items()},
+                      columns=list(FIELDS))
+    df['review_id'] = [review_id(review) for review in reviews]
+    if len(reviews) == 0:
+        return df, watermark
+    iat = reviews[-1]['payload']['iat']
+    signatures = [review_id(review) for review in reviews if review['payload']['iat'] == iat]
+    # reviews with the same iat on the page before are kept
+    if iat == watermark['iat']:
+        signatures = watermark['signatures'] + signatures
+    return df, {'iat': iat, 'signatures': signatures}
+
+
+# mangrove api client with pooled http session and retries
+class MangroveClient:
+    def __init__(self, url=MANGROVE_URL, page_size=PAGE_SIZE):
+        self.url = url
+        self.page_size = page_size
+        self.session = requests.Session()
+        retry = Retry(total=RETRIES, backoff_factor=BACKOFF, status_forcelist=[429, 500, 502, 503, 504],
+                      allowed_methods=['GET'])
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1, max_retries=retry)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # reviews with iat > gt_iat (at most page_size, oldest first)
+    @profiler.stage('fetch')
+    def fetch(self, gt_iat):
+        params = {'gt_iat': str(gt_iat), 'q': 'geo:'}
+        if self.page_size > 0:
+            params['limit'] = str(self.page_size)
+        r = self.session.get(self.url, params=params, timeout=TIMEOUT)
+        r.raise_for_status()
+        return r.json().get('reviews', [])
+
+    # pages of new reviews -> (dataframe, watermark after the page)
+    # the caller saves the watermark with the data of the page, a restart continues after it
+    def pages(self, watermark):
+        while True:
+            # signatures at the watermark -> ask again for this second, known reviews are skipped
+            if len(watermark['signatures']) > 0:
+                gt_iat = watermark['iat'] - 1
+            else:
+                gt_iat = watermark['iat']
+            reviews = self.fetch(gt_iat)
+            last_page = self.page_size == 0 or len(reviews) < self.page_size
+            seen = set(watermark['signatures'])
+            reviews_new = [review for review in reviews
+                           if review['payload']['iat'] > watermark['iat'] or review_id(review) not in seen]
+            if len(reviews_new) == 0:
+                if last_page:
+                    return
+                # full page of known reviews with the same iat -> continue after this second
+                print('page with known reviews only -> continue after iat ' + str(watermark['iat']))
+                watermark = {'iat': watermark['iat'], 'signatures': []}
+                continue
+            df, watermark = page_frame(reviews_new, watermark)
+            yield df, watermark
+            if last_page:
+                return
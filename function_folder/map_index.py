@@ -0,0 +1,161 @@
+import math
+import numpy as np
+import pandas as pd
+from configparser import ConfigParser
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# maximum number of subjects drawn as single points (more in the viewport -> clusters)
+MAX_POINTS = int(config['map']['max_points'])
+# size of a cluster cell on the screen (px)
+CELL_PX = int(config['map']['cell_px'])
+
+# mapbox tiles are 512 px -> world width at zoom z is 512 * 2 ** z px
+TILE_PX = 512
+# finest grid level
+MAX_LEVEL = 24
+# pre-aggregated levels (coarse levels -> many subjects in the viewport)
+MAX_LEVEL_INDEX = 12
+# default zoom of the map (small filters)
+ZOOM_DEFAULT = 7
+# from this zoom on there are no clusters (subjects at the same place can not be split)
+ZOOM_POINTS = 16
+# latitude limit of web mercator
+LAT_MAX = 85.05112878
+
+
+# web mercator position in [0, 1)
+def mercator(lat, lon):
+    lat = np.clip(np.asarray(lat, dtype=np.float64), -LAT_MAX, LAT_MAX)
+    lon = np.asarray(lon, dtype=np.float64)
+    x = (lon + 180.0) / 360.0
+    y = (1.0 - np.log(np.tan(np.radians(lat)) + 1.0 / np.cos(np.radians(lat))) / math.pi) / 2.0
+    return np.clip(x, 0.0, 1.0 - 1e-12), np.clip(y, 0.0, 1.0 - 1e-12)
+
+
+# grid level for a zoom (cells of about CELL_PX px)
+def level_for_zoom(zoom):
+    return int(min(MAX_LEVEL, max(0, math.floor(zoom) + round(math.log2(TILE_PX / CELL_PX)))))
+
+
+# zoom which shows a cluster cell of level on the screen (cluster click)
+def zoom_for_level(level):
+    return level - round(math.log2(TILE_PX / CELL_PX)) + 2
+
+
+# viewport (lon_min, lat_min, lon_max, lat_max) + zoom of the map from relayoutData (None -> no viewport)
+def viewport(relayout_data):
+    if not relayout_data or 'mapbox.zoom' not in relayout_data:
+        return None
+    zoom = float(relayout_data['mapbox.zoom'])
+    derived = relayout_data.get('mapbox._derived')
+    if derived is not None and 'coordinates' in derived:
+        lons = [i[0] for i in derived['coordinates']]
+        lats = [i[1] for i in derived['coordinates']]
+        bounds = (min(lons), min(lats), max(lons), max(lats))
+    else:
+        # no corners -> viewport of the whole world at this zoom (clusters are still bounded by the level)
+        bounds = (-180.0, -90.0, 180.0, 90.0)
+    center = relayout_data.get('mapbox.center', {'lat': (bounds[1] + bounds[3]) / 2, 'lon': (bounds[0] + bounds[2]) / 2})
+    return {'bounds': bounds, 'zoom': zoom, 'center': center}
+
+
+# approximate viewport around a center (map of about 1200 x 500 px) -> bounds
+def viewport_bounds(center, zoom, width=1200, height=500):
+    n = TILE_PX * 2 ** zoom
+    x, y = mercator(center['lat'], center['lon'])
+    x_min, x_max = x - width / 2 / n, x + width / 2 / n
+    y_min, y_max = y - height / 2 / n, y + height / 2 / n
+    lat_max, lat_min = [math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * i)))) for i in (y_min, y_max)]
+    return (x_min * 360.0 - 180.0, lat_min, x_max * 360.0 - 180.0, lat_max)
+
+
+# aggregate points to the cells of a level -> dict of arrays (cell position, count, mean rating, centroid, first row)
+def aggregate(x, y, lat, lon, rating, level):
+    n = 2 ** level
+    cell = np.floor(x * n).astype(np.int64) * n + np.floor(y * n).astype(np.int64)
+    cells, first, inverse, count = np.unique(cell, return_index=True, return_inverse=True, return_counts=True)
+    return {'ix': (cells // n).astype(np.int32),
+            'iy': (cells % n).astype(np.int32),
+            'count': count.astype(np.int32),
+            'rating': (np.bincount(inverse, rating, len(cells)) / count).astype(np.float32),
+            'lat': np.bincount(inverse, lat, len(cells)) / count,
+            'lon': np.bincount(inverse, lon, len(cells)) / count,
+            'first': first.astype(np.int32)}
+
+
+# multi-resolution grid over the subjects of a filter, built once per data version and filter
+# level l -> 2 ** l x 2 ** l cells in web mercator, per cell count, mean rating, centroid and first row
+# levels up to MAX_LEVEL_INDEX are pre-aggregated, finer levels are aggregated from the subjects of the viewport
+class MapIndex:
+    def __init__(self, df):
+        self.df = df
+        self.lat = df['lat'].to_numpy(dtype=np.float64)
+        self.lon = df['lon'].to_numpy(dtype=np.float64)
+        self.rating = df['rating'].to_numpy(dtype=np.float64)
+        self.x, self.y = mercator(self.lat, self.lon)
+        self.levels = [aggregate(self.x, self.y, self.lat, self.lon, self.rating, level)
+                       for level in range(MAX_LEVEL_INDEX + 1)]
+        self.nbytes = (sum(array.nbytes for level in self.levels for array in level.values()) +
+                       5 * self.lat.nbytes)
+
+    # cells of a level (mask -> just these subjects, positions stay positions of df)
+    def cells(self, level, mask):
+        if level <= MAX_LEVEL_INDEX:
+            return self.levels[level]
+        positions = np.flatnonzero(mask)
+        cells = aggregate(self.x[positions], self.y[positions], self.lat[positions], self.lon[positions],
+                          self.rating[positions], level)
+        cells['first'] = positions[cells['first']]
+        return cells
+
+    # start view of the map (all subjects visible)
+    def fit(self):
+        if len(self.df) == 0:
+            return {'bounds': (-180.0, -90.0, 180.0, 90.0), 'center': {'lat': 0.0, 'lon': 0.0}, 'zoom': 1}
+        lat_min, lat_max = self.lat.min(), self.lat.max()
+        lon_min, lon_max = self.lon.min(), self.lon.max()
+        span = max(lon_max - lon_min, (lat_max - lat_min) * 2, 1e-9)
+        zoom = min(ZOOM_DEFAULT, max(0.0, math.log2(360.0 / span)))
+        return {'bounds': (lon_min, lat_min, lon_max, lat_max),
+                'center': {'lat': float((lat_min + lat_max) / 2), 'lon': float((lon_min + lon_max) / 2)},
+                'zoom': zoom}
+
+    # subjects inside bounds -> mask
+    def inside(self, bounds):
+        lon_min, lat_min, lon_max, lat_max = bounds
+        return (self.lat >= lat_min) & (self.lat <= lat_max) & (self.lon >= lon_min) & (self.lon <= lon_max)
+
+    # what to draw for a view -> (points dataframe, clusters dataframe or None)
+    # few subjects inside -> all of them as points, otherwise clusters (single subjects stay points)
+    def query(self, view):
+        mask = self.inside(view['bounds'])
+        if mask.sum() <= MAX_POINTS:
+            return self.df[mask], None
+        if view['zoom'] >= ZOOM_POINTS:
+            return self.df[mask].head(MAX_POINTS), None
+        level = level_for_zoom(view['zoom'])
+        cells = self.cells(level, mask)
+        n = 2 ** level
+        lon_min, lat_min, lon_max, lat_max = view['bounds']
+        # cells of the viewport (y of mercator grows to the south)
+        x_min, y_max = mercator(lat_min, lon_min)
+        x_max, y_min = mercator(lat_max, lon_max)
+        keep = ((cells['ix'] >= math.floor(x_min * n)) & (cells['ix'] <= math.floor(x_max * n)) &
+                (cells['iy'] >= math.floor(y_min * n)) & (cells['iy'] <= math.floor(y_max * n)))
+        single = keep & (cells['count'] == 1)
+        multiple = keep & (cells['count'] > 1)
+        points = self.df.take(cells['first'][single])
+        clusters = pd.DataFrame({'lat': cells['lat'][multiple],
+                                 'lon': cells['lon'][multiple],
+                                 'count': cells['count'][multiple],
+                                 'rating': cells['rating'][multiple]})
+        clusters['zoom'] = zoom_for_level(level)
+        return points, clusters
+
+
+# build map index of a filtered business dataframe
+def build_map_index(df):
+    return MapIndex(df)
@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from configparser import ConfigParser
+from function_folder import profiler
+from function_folder.result_store import ResultStore
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+# on-disk tier (shared by all workers of the server)
+file_path_memo = config['path']['path_memo']
+# maximum size of the in-process tier
+MAX_BYTES_MEMORY = int(float(config['memo']['memory_mb']) * 1024 * 1024)
+# maximum size of the on-disk tier
+MAX_BYTES_DISK = int(float(config['memo']['disk_mb']) * 1024 * 1024)
+# number of facets (category, country, state) which are computed after a new snapshot
+WARM_FACETS = int(config['memo']['warm_facets'])
+
+
+# key of a call -> sha1 of function name, data version and normalised inputs
+def memo_key(name, version, inputs):
+    content = json.dumps([name, version, inputs], sort_keys=True, default=str)
+    return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+
+# on-disk tier -> pickled results in a sqlite file, least recently used results are removed above max_bytes
+class DiskTier:
+    def __init__(self, path=file_path_memo, max_bytes=MAX_BYTES_DISK):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS memo (key TEXT PRIMARY KEY, value BLOB, size INTEGER, '
+                               'atime REAL)')
+            connection.execute('CREATE INDEX IF NOT EXISTS memo_atime ON memo (atime)')
+            connection.execute('CREATE TABLE IF NOT EXISTS facet (category TEXT, country TEXT, state TEXT, '
+                               'n INTEGER, PRIMARY KEY (category, country, state))')
+
+    # one connection per thread and process
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    # pickled result or None
+    def get(self, key):
+        connection = self.connection()
+        row = connection.execute('SELECT value FROM memo WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        with connection:
+            connection.execute('UPDATE memo SET atime = ? WHERE key = ?', (time.time(), key))
+        return row[0]
+
+    def put(self, key, value):
+        with self.connection() as connection:
+            connection.execute('INSERT OR REPLACE INTO memo (key, value, size, atime) VALUES (?, ?, ?, ?)',
+                               (key, value, len(value), time.time()))
+            total = connection.execute('SELECT COALESCE(SUM(size), 0) FROM memo').fetchone()[0]
+            # evict least recently used results
+            while total > self.max_bytes:
+                row = connection.execute('SELECT key, size FROM memo WHERE key != ? ORDER BY atime LIMIT 1',
+                                         (key,)).fetchone()
+                if row is None:
+                    break
+                connection.execute('DELETE FROM memo WHERE key = ?', (row[0],))
+                total -= row[1]
+
+    # count a request of a facet (popular facets are warmed after a new snapshot)
+    def count_facet(self, category, country, state):
+        with self.connection() as connection:
+            connection.execute('INSERT INTO facet (category, country, state, n) VALUES (?, ?, ?, 1) '
+                               'ON CONFLICT(category, country, state) DO UPDATE SET n = n + 1',
+                               (str(category), str(country), str(state)))
+
+    def popular_facets(self, n):
+        return self.connection().execute('SELECT category, country, state FROM facet ORDER BY n DESC LIMIT ?',
+                                         (n,)).fetchall()
+
+
+# two-tier memoisation of pure functions (results depend just on data version + inputs)
+# memory tier (lru by size, per process) -> disk tier (shared) -> compute
+class Memo:
+    def __init__(self, max_bytes_memory=MAX_BYTES_MEMORY, path=file_path_memo, max_bytes_disk=MAX_BYTES_DISK):
+        self.memory = ResultStore(max_bytes_memory)
+        self.path = path
+        self.max_bytes_disk = max_bytes_disk
+        self.disk_tier = None
+        self.lock = threading.Lock()
+        # function name -> counters
+        self.counters = {}
+        # functions called with a facet after a new snapshot
+        self.warmers = []
+
+    # disk tier (created on first use)
+    def disk(self):
+        if self.disk_tier is None:
+            with self.lock:
+                if self.disk_tier is None:
+                    self.disk_tier = DiskTier(self.path, self.max_bytes_disk)
+        return self.disk_tier
+
+    def count(self, name, counter, seconds=0.0):
+        with self.lock:
+            counters = self.counters.setdefault(name, {'hit_memory': 0, 'hit_disk': 0, 'miss': 0, 'seconds': 0.0})
+            counters[counter] += 1
+            counters['seconds'] += seconds
+
+    # result of compute(), looked up by name, version and inputs (inputs must be json-like)
+    def get_or_compute(self, name, version, inputs, compute):
+        start = time.perf_counter()
+        key = memo_key(name, version, inputs)
+        result = self.memory.get(key)
+        if result is not None:
+            self.count(name, 'hit_memory', time.perf_counter() - start)
+            return result
+        value = self.disk().get(key)
+        if value is not None:
+            result = pickle.loads(value)
+            self.memory.put(key, result, len(value))
+            self.count(name, 'hit_disk', time.perf_counter() - start)
+            return result
+        result = compute()
+        value = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        self.memory.put(key, result, len(value))
+        self.disk().put(key, value)
+        self.count(name, 'miss', time.perf_counter() - start)
+        return result
+
+    # counters per function (hits, misses, hit rate, mean latency in ms)
+    def stats(self):
+        with self.lock:
+            stats = {}
+            for name, counters in self.counters.items():
+                calls = counters['hit_memory'] + counters['hit_disk'] + counters['miss']
+                stats[name] = dict(counters,
+                                   calls=calls,
+                                   hit_rate=(calls - counters['miss']) / calls if calls > 0 else 0.0,
+                                   mean_ms=1000 * counters['seconds'] / calls if calls > 0 else 0.0)
+            return stats
+
+    # warm(category, country, state) is called for popular facets after a new snapshot
+    def register_warmer(self, warm):
+        self.warmers.append(warm)
+
+    def count_facet(self, category, country, state):
+        self.disk().count_facet(category, country, state)
+
+    # compute results of the most requested facets (default facet first)
+    @profiler.stage('warm')
+    def warm(self, default=None, n=WARM_FACETS):
+        facets = self.disk().popular_facets(n)
+        if default is not None and default not in facets:
+            facets = [default] + facets[:max(n - 1, 0)]
+        for category, country, state in facets:
+            for warm in self.warmers:
+                try:
+                    warm(category, country, state)
+                except Exception as e:
+                    print('warming failed')
+                    print(e)
+        print(str(len(facets)) + ' facet(s) warmed')
+
+
+# memo for the callbacks of the web app
+memo = Memo()
@@ -0,0 +1,175 @@
+import bisect
+import functools
+import threading
+import time
+from configparser import ConfigParser
+from contextlib import nullcontext
+from dash.exceptions import PreventUpdate
+from flask import Response
+from function_folder import memo
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# instrumentation of the callbacks (False -> callbacks are not wrapped, phases are no-ops, no endpoint)
+ENABLED = config['metrics']['enabled'] == 'True'
+# url of the text endpoint (prometheus text format)
+URL_METRICS = config['metrics']['url']
+# upper bounds of the latency buckets (s) and of the payload buckets (bytes)
+BUCKETS_SECONDS = [float(i) for i in config['metrics']['buckets_seconds'].split(',')]
+BUCKETS_BYTES = [float(i) for i in config['metrics']['buckets_bytes'].split(',')]
+
+# phase of a callback which is not inside phase() (callback_context, memo lookup, json serialisation)
+PHASE_OTHER = 'other'
+# shared no-op context (phases when the instrumentation is off)
+NO_PHASE = nullcontext()
+
+
+# cumulative histogram (prometheus semantics: bucket le -> number of observations <= le)
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    # text lines of the histogram
+    def lines(self, name, labels):
+        lines = []
+        cumulative = 0
+        for le, count in zip(self.buckets + [float('inf')], self.counts):
+            cumulative += count
+            bound = '+Inf' if le == float('inf') else repr(le)
+            lines.append(name + '_bucket{' + labels + ',le="' + bound + '"} ' + str(cumulative))
+        lines.append(name + '_sum{' + labels + '} ' + repr(self.sum))
+        lines.append(name + '_count{' + labels + '} ' + str(self.count))
+        return lines
+
+
+# metrics of the callbacks in this process (each worker of the server has its own)
+class Metrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        # (metric, labels) -> histogram
+        self.histograms = {}
+        # (callback, status) -> number of calls
+        self.calls = {}
+        # phases of the running callback of a thread -> seconds
+        self.local = threading.local()
+
+    def observe(self, metric, labels, value, buckets):
+        with self.lock:
+            histogram = self.histograms.get((metric, labels))
+            if histogram is None:
+                histogram = self.histograms[(metric, labels)] = Histogram(buckets)
+            histogram.observe(value)
+
+    def count(self, callback, status):
+        with self.lock:
+            self.calls[(callback, status)] = self.calls.get((callback, status), 0) + 1
+
+    # time a part of a callback (e.g. data, figure), nested phases count to the outer phase
+    def phase(self, name):
+        phases = getattr(self.local, 'phases', None)
+        if phases is None or self.local.running is not None:
+            return NO_PHASE
+        return Phase(self.local, name)
+
+    # wrap the callback of dash (returns the json response -> payload size)
+    def wrap(self, name, callback):
+        @functools.wraps(callback)
+        def timed(*args, **kwargs):
+            self.local.phases = {}
+            self.local.running = None
+            status = 'ok'
+            start = time.perf_counter()
+            try:
+                response = callback(*args, **kwargs)
+            except PreventUpdate:
+                status = 'no_update'
+                raise
+            except Exception:
+                status = 'error'
+                raise
+            finally:
+                seconds = time.perf_counter() - start
+                phases = self.local.phases
+                self.local.phases = None
+                labels = 'callback="' + name + '"'
+                self.count(name, status)
+                self.observe('callback_seconds', labels, seconds, BUCKETS_SECONDS)
+                for phase, phase_seconds in phases.items():
+                    self.observe('callback_phase_seconds', labels + ',phase="' + phase + '"', phase_seconds,
+                                 BUCKETS_SECONDS)
+                self.observe('callback_phase_seconds', labels + ',phase="' + PHASE_OTHER + '"',
+                             max(seconds - sum(phases.values()), 0.0), BUCKETS_SECONDS)
+            self.observe('callback_response_bytes', labels, len(response), BUCKETS_BYTES)
+            return response
+        return timed
+
+    # prometheus text format (callbacks + memo counters)
+    def text(self):
+        lines = ['# TYPE callback_calls_total counter']
+        with self.lock:
+            for (callback, status), n in sorted(self.calls.items()):
+                lines.append('callback_calls_total{callback="' + callback + '",status="' + status + '"} ' + str(n))
+            for metric in ['callback_seconds', 'callback_phase_seconds', 'callback_response_bytes']:
+                lines.append('# TYPE ' + metric + ' histogram')
+                for (name, labels), histogram in sorted(self.histograms.items()):
+                    if name == metric:
+                        lines.extend(histogram.lines(metric, labels))
+        lines.append('# TYPE memo_calls_total counter')
+        stats = memo.memo.stats()
+        for name in sorted(stats):
+            for tier in ['hit_memory', 'hit_disk', 'miss']:
+                lines.append('memo_calls_total{function="' + name + '",result="' + tier + '"} ' +
+                             str(stats[name][tier]))
+        lines.append('# TYPE memo_seconds_total counter')
+        for name in sorted(stats):
+            lines.append('memo_seconds_total{function="' + name + '"} ' + repr(stats[name]['seconds']))
+        return '\n'.join(lines) + '\n'
+
+
+# running phase of a callback
+class Phase:
+    def __init__(self, local, name):
+        self.local = local
+        self.name = name
+
+    def __enter__(self):
+        self.local.running = self.name
+        self.start = time.perf_counter()
+
+    def __exit__(self, *args):
+        phases = self.local.phases
+        phases[self.name] = phases.get(self.name, 0.0) + time.perf_counter() - self.start
+        self.local.running = None
+
+
+metrics = Metrics()
+
+
+# time a part of a callback -> context manager
+def phase(name):
+    if ENABLED == False:
+        return NO_PHASE
+    return metrics.phase(name)
+
+
+# wrap all callbacks of a dash app and add the text endpoint (call after the last callback)
+def instrument(app):
+    if ENABLED == False:
+        return
+    for callback_id, callback in app.callback_map.items():
+        name = getattr(callback['callback'], '__name__', callback_id)
+        callback['callback'] = metrics.wrap(name, callback['callback'])
+
+    @app.server.route(URL_METRICS)
+    def metrics_text():
+        return Response(metrics.text(), mimetype='text/plain; version=0.0.4')
@@ -1,20 +1,19 @@
 from configparser import ConfigParser
 import pandas as pd
 import numpy as np
-import nltk
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-from nltk import WordNetLemmatizer
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import linear_kernel
 from wordcloud import WordCloud
-from unidecode import unidecode
-from collections import Counter
-import itertools
 import os.path
-nltk.download('punkt')
-nltk.download('stopwords')
-nltk.download('wordnet')
+import hashlib
+import json
+from concurrent.futures import ProcessPoolExecutor
+from function_folder import similarity_index
+from function_folder import similarity_model
+from function_folder import images
+from function_folder import ingest_store
+from function_folder import profiler
+from function_folder import text_store
+from function_folder import tokens
 
 # load config
 config = ConfigParser()
@@ -22,27 +21,48 @@ config.read('config/config.ini')
 
 # load path
 file_path_last_change = config['path']['path_change']
-file_path_kpi = config['path']['path_kpi']
-file_path_text = config['path']['path_text']
-file_path_similarity = config['path']['path_similarity']
-start_file_path_image = config['path']['path_image_start']
+file_path_manifest = config['path']['path_image_manifest']
+# load similarity mode
+similarity_mode = config['similarity']['mode']
+# number of processes for word clouds (0 -> number of cpus)
+word_cloud_workers = int(config['word_cloud']['workers'])
 
+# settings of the word clouds (part of the manifest hash -> changed settings render everything again)
+WORD_CLOUD_SETTINGS = {'width': 1600, 'height': 800, 'max_font_size': 200, 'background_color': 'white'}
 
-# get data
-def get_mangrove_rs():
+
+# get reviews since last change
+def get_new_kpi():
     # check for last change
     if os.path.exists(file_path_last_change) == False:
         gt_iat = 1580915880
     else:
         gt_iat = pd.read_csv(file_path_last_change).iat[0, 2]
-    # filter by gt_iat
-    df_mangrove_kpi = pd.read_csv(file_path_kpi)
-    df_mangrove_kpi = df_mangrove_kpi[df_mangrove_kpi['iat_original'] > gt_iat]
+    # filter by gt_iat (kpi rows of the ingest store, index on iat -> just the new rows are read)
+    store = ingest_store.open_store()
+    try:
+        df_mangrove_kpi = store.kpi(gt_iat)
+    finally:
+        store.close()
+    return df_mangrove_kpi
+
+
+# get data
+@profiler.stage('load')
+def get_mangrove_rs():
+    df_mangrove_kpi = get_new_kpi()
     list_check = df_mangrove_kpi['sub'].unique().tolist()
     # check if there are new reviews
     if len(list_check) != 0:
-        # import text
-        df_mangrove_text = pd.read_csv(file_path_text)
+        # incremental mode -> just subjects with new reviews (all subjects if there is no model yet)
+        store = text_store.open_store()
+        try:
+            if similarity_mode == 'incremental' and similarity_model.model_exists():
+                df_mangrove_text = store.read(list_check)
+            else:
+                df_mangrove_text = store.read()
+        finally:
+            store.close()
         # r'^\s*$' regular expression -> matches one or many white spaces
         df_filtered = df_mangrove_text.replace(r'^\s*$', np.nan, regex=True)
         # drop all review subjects without comments
@@ -52,80 +72,109 @@ def get_mangrove_rs():
 
 
 # normalise function
-def normalise(df_org):
+# filter_once=False -> words which occur just once are not dropped here (incremental mode drops them in the model)
+# partial=True -> df holds just the changed subjects, term counts of the other subjects are kept
+# tokens are cached by text (see tokens.TokenStore) -> just changed opinions are normalised again
+@profiler.stage('normalise')
+def normalise(df_org, filter_once=True, partial=False):
     # copy() -> creates a deep copy of the object (needed otherwise there will be some duplicates)
     df = df_org.copy()
-    # normalise opinion
-    def normalise_opinion(text):
-        # text to lower
-        text = text.lower()
-        # unidecode
-        text = unidecode(text)
-        # tokenize opinion
-        words = word_tokenize(text)
-        # just keep words with letters (no punctuation, numbers, etc.)
-        words = [i for i in words if i.isalpha()]
-        # remove stopwords
-        stop_words = set(stopwords.words('english'))
-        words = [j for j in words if not j in stop_words]
-        # lemmatizer
-        lemmatizer = WordNetLemmatizer()
-        words = [lemmatizer.lemmatize(k) for k in words]
-        return words
-    # function to filter out elements which occure just once
-    def occure_once(text):
-        words = [i for i in text if not i in hash_list_occure_once]
-        return words
-    # normalize text
-    df['opinion'] = df['opinion'].apply(normalise_opinion)
-    # create list with elements which occure just once
-    list_words = list(itertools.chain.from_iterable(df['opinion']))
-    hash_counter = Counter(list_words)
-    hash_list_occure_once = {k for k, v in hash_counter.items() if v == 1}
+    store = tokens.TokenStore()
+    try:
+        # normalize text
+        list_tokens, list_hash = store.tokens(df['opinion'].astype(str).tolist())
+        df['opinion'] = list_tokens
+        if filter_once == False:
+            return df
+        # elements which occure just once (term counts are updated with the changed subjects)
+        store.sync(df['sub'].tolist(), list_hash, partial)
+        hash_list_occure_once = store.occurring_once()
+    finally:
+        store.close()
     print(str(len(hash_list_occure_once))+' words (fetures) occure just once in the whole corpus, those words \
 (features) will be dropped')
     # filter out elements which occure just once
-    df['opinion'] = df['opinion'].apply(occure_once)
+    df['opinion'] = [[i for i in words if not i in hash_list_occure_once] for words in df['opinion']]
     return df
 
 
+# hash of the input of a word cloud (text + settings)
+def word_cloud_hash(text):
+    settings = dict(WORD_CLOUD_SETTINGS, thumb_width=images.THUMB_WIDTH)
+    content = json.dumps([text, settings], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf8')).hexdigest()
+
+
+# load manifest (file name -> hash of rendered input)
+def load_manifest():
+    if os.path.exists(file_path_manifest) == False:
+        return {}
+    with open(file_path_manifest, 'r', encoding='UTF8') as f:
+        return json.load(f)
+
+
+# save manifest atomically
+def save_manifest(manifest):
+    path_tmp = file_path_manifest + '.tmp'
+    with open(path_tmp, 'w', encoding='UTF8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=0, sort_keys=True)
+    os.replace(path_tmp, file_path_manifest)
+
+
+# render one word cloud (runs in a worker process)
+def render_word_cloud(name, text):
+    try:
+        wordcloud = WordCloud(**WORD_CLOUD_SETTINGS).generate(text)
+    # no words -> no word cloud (web app shows _no_word_cloud)
+    except ValueError:
+        return name
+    image = wordcloud.to_image()
+    images.save_full(image, name)
+    # smaller variant for the web app
+    images.save_thumbnail(image, name)
+    return name
+
+
 # word cloud function
+@profiler.stage('word_cloud')
 def word_cloud(df_org):
     # copy() -> creates a deep copy of the object (needed otherwise there will be some duplicates)
     df = df_org.copy()
-    # check for last change
-    if os.path.exists(file_path_last_change) == False:
-        gt_iat = 1580915880
-    else:
-        gt_iat = pd.read_csv(file_path_last_change).iat[0, 2]
-    # filter by gt_iat
-    df_mangrove_kpi = pd.read_csv(file_path_kpi)
-    df_mangrove_kpi = df_mangrove_kpi[df_mangrove_kpi['iat_original']>gt_iat]
+    # filter by last change
+    df_mangrove_kpi = get_new_kpi()
     list_check = df_mangrove_kpi['sub'].unique().tolist()
     # filter df
     df_filtered = df[df["sub"].isin(list_check)]
-    # create word clouds
-    count = 0
-    for index, row in df_filtered.iterrows():
-        # create output path by sub
-        sub_full = row['sub']
-        list_sub = list([i for i in sub_full if i.isalnum()])
-        sub = "".join(list_sub)
-        path = str(start_file_path_image)+str(sub)+'.png'
+    # skip word clouds with unchanged input (same tokens + settings as in manifest)
+    manifest = load_manifest()
+    tasks = {}
+    for sub_full, opinion in zip(df_filtered['sub'], df_filtered['opinion']):
+        # create output name by sub
+        sub = images.sub_name(sub_full)
         # join list to text
-        opinion = row['opinion']
         text = ' '.join([i for i in opinion])
-        # create wordcloud
-        wordcloud = WordCloud(width=1600, height=800, max_font_size=200, background_color="white").generate(text)
-        print(str(count))
-        wordcloud.to_file(path)
-        count += 1
+        text_hash = word_cloud_hash(text)
+        if manifest.get(sub) != text_hash:
+            tasks[sub] = (text, text_hash)
+    print(str(len(tasks)) + ' word cloud(s) to create, ' + str(df_filtered.shape[0] - len(tasks)) + ' unchanged')
+    # create word clouds (process pool -> scales with number of cpus)
+    names = list(tasks)
+    texts = [tasks[i][0] for i in names]
+    if len(names) > 1 and word_cloud_workers != 1:
+        with ProcessPoolExecutor(max_workers=word_cloud_workers or None) as executor:
+            results = list(executor.map(render_word_cloud, names, texts, chunksize=4))
+    else:
+        results = [render_word_cloud(i, j) for i, j in zip(names, texts)]
+    for name in results:
+        manifest[name] = tasks[name][1]
+    save_manifest(manifest)
     # write last change
     gt_iat_max = df_mangrove_kpi['iat_original'].max()
     df_mangrove_kpi[df_mangrove_kpi['iat_original'] == gt_iat_max].to_csv(file_path_last_change, index=False)
 
 
 # function feature extraction
+@profiler.stage('tfidf')
 def feature_extraction(df_org):
     # copy() -> creates a deep copy of the object (needed otherwise there will be some duplicates)
     df = df_org.copy()
@@ -139,24 +188,37 @@ def feature_extraction(df_org):
 
 
 # function cosine similarities
+# just the top-k neighbours per review subject are kept (file grows linear with the number of subjects)
+@profiler.stage('similarity')
 def cosine_similarities(matrix, df):
-    cosine_similarities = linear_kernel(matrix, matrix)
-    cosine_similarities = np.around(cosine_similarities, decimals=3)
-    df_cosine_similarities = pd.DataFrame(data=cosine_similarities,
-                                          columns=df['sub'],
-                                          index=df['sub'])
-    df_cosine_similarities.rename_axis(None, axis=1, inplace=True)
-    df_cosine_similarities.rename_axis(None, inplace=True)
-    df_cosine_similarities.to_csv(file_path_similarity, index=True)
+    index = similarity_index.build_index(matrix, df['sub'].tolist())
+    similarity_index.save_index(index)
 
 
 # nlp function
-def nlp_function():
-    a = get_mangrove_rs()
-    if a is None:
-        print('no changes for similarities and wordclouds (no new reviews)')
-    else:
-        b = normalise(a)
-        word_cloud(b)
-        c = feature_extraction(b)
-        cosine_similarities(c, b)
+# report(stage, message) -> progress of the update (see jobs.run_refresh)
+def nlp_function(report=None):
+    with profiler.run('nlp'):
+        if report is None:
+            report = lambda stage, message='': None
+        a = get_mangrove_rs()
+        if a is None:
+            print('no changes for similarities and wordclouds (no new reviews)')
+        elif similarity_mode == 'incremental':
+            tokens.ensure_nltk_data()
+            report('nlp', 'normalising ' + str(a.shape[0]) + ' review subject(s)')
+            b = normalise(a, filter_once=False)
+            report('nlp', 'word clouds')
+            # same word clouds as in full mode -> words which occur just once in the corpus are dropped
+            word_cloud(normalise(a, partial=True))
+            report('nlp', 'similarities')
+            similarity_model.update(b)
+        else:
+            tokens.ensure_nltk_data()
+            report('nlp', 'normalising ' + str(a.shape[0]) + ' review subject(s)')
+            b = normalise(a)
+            report('nlp', 'word clouds')
+            word_cloud(b)
+            report('nlp', 'similarities')
+            c = feature_extraction(b)
+            cosine_similarities(c, b)
@@ -0,0 +1,233 @@
+import functools
+import json
+import os
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+from configparser import ConfigParser
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+# run ledger (one json line per run of the pipeline)
+file_path_run_ledger = config['path']['path_run_ledger']
+# profile the stages of the pipeline (False -> stages are called without wrapper)
+ENABLED = config['profiler']['enabled'] == 'True'
+# peak of python allocations per stage (tracemalloc -> the pipeline runs slower)
+TRACEMALLOC = config['profiler']['tracemalloc'] == 'True'
+
+# size of a memory page (rss from /proc/self/statm)
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+
+# resident memory of the process now (mb), without /proc -> peak
+def rss_mb():
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 1024 / 1024
+    except OSError:
+        return max_rss_mb()
+
+
+# peak resident memory of the process (mb, linux -> kb, macos -> bytes)
+def max_rss_mb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return rss / 1024 / 1024
+    return rss / 1024
+
+
+# number of rows of a dataframe, matrix or list (None -> no rows)
+def rows(value):
+    if hasattr(value, 'shape') and len(value.shape) > 0:
+        return int(value.shape[0])
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    return None
+
+
+# running stage (seconds, rows and memory are summed up / maximised over all calls of a run)
+class Stage:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.seconds = 0.0
+        self.rows_in = None
+        self.rows_out = None
+        self.peak_alloc = 0
+        self.rss_delta = 0.0
+        # high-water mark of the process after the stage (a jump -> this stage raised the peak)
+        self.max_rss = 0.0
+
+    def add_rows(self, attribute, value):
+        if value is not None:
+            setattr(self, attribute, (getattr(self, attribute) or 0) + value)
+
+    def record(self):
+        record = {'stage': self.name,
+                  'calls': self.calls,
+                  'seconds': round(self.seconds, 4),
+                  'rows_in': self.rows_in,
+                  'rows_out': self.rows_out,
+                  'rss_delta_mb': round(self.rss_delta, 1),
+                  'max_rss_mb': round(self.max_rss, 1)}
+        if TRACEMALLOC:
+            record['peak_alloc_mb'] = round(self.peak_alloc / 1024 / 1024, 1)
+        return record
+
+
+# stages of one run of the pipeline (refresh, get_new_data, nlp_function)
+class Run:
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.stages = {}
+        # open stages (nested stages -> peak of the outer stage includes the inner one)
+        self.open = []
+        self.rss_start = rss_mb()
+        self.thread = threading.current_thread()
+
+    # stage in order of the first call
+    def stage(self, name):
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(name)
+        return stage
+
+    def record(self, status):
+        return {'run': self.name,
+                'status': status,
+                'started': datetime.fromtimestamp(self.started, timezone.utc).isoformat(),
+                'seconds': round(time.time() - self.started, 3),
+                'pid': os.getpid(),
+                'rss_start_mb': round(self.rss_start, 1),
+                'rss_end_mb': round(rss_mb(), 1),
+                'max_rss_mb': round(max_rss_mb(), 1),
+                'stages': [stage.record() for stage in self.stages.values()]}
+
+
+# run of this process (one refresh at a time, see jobs.acquire_lock)
+current = None
+current_lock = threading.Lock()
+
+
+# append a run to the ledger
+def save_record(record):
+    directory = os.path.dirname(file_path_run_ledger)
+    if directory != '':
+        os.makedirs(directory, exist_ok=True)
+    with open(file_path_run_ledger, 'a', encoding='UTF8') as f:
+        f.write(json.dumps(record) + '\n')
+
+
+# read the ledger -> list of runs (oldest first)
+def read_ledger(path=file_path_run_ledger):
+    if os.path.exists(path) == False:
+        return []
+    with open(path, 'r', encoding='UTF8') as f:
+        return [json.loads(line) for line in f if line.strip() != '']
+
+
+# print stages of a run
+def print_record(record):
+    print('run ' + record['run'] + ' ' + record['status'] + ' in ' + str(record['seconds']) + ' s')
+    for stage in record['stages']:
+        line = '  {:<12} {:>9.3f} s {:>9} -> {:<9} rows {:>+8.1f} mb rss {:>8.1f} mb max'.format(
+            stage['stage'], stage['seconds'], str(stage['rows_in']), str(stage['rows_out']), stage['rss_delta_mb'],
+            stage['max_rss_mb'])
+        if 'peak_alloc_mb' in stage:
+            line += ' {:>8.1f} mb peak alloc'.format(stage['peak_alloc_mb'])
+        print(line)
+
+
+# profile a run of the pipeline -> record in the ledger when the outermost run ends
+# runs inside a run (get_new_data inside a refresh) are part of the outer run
+@contextmanager
+def run(name):
+    global current
+    if ENABLED == False:
+        yield
+        return
+    with current_lock:
+        outer = current is None
+        if outer:
+            current = Run(name)
+            if TRACEMALLOC:
+                tracemalloc.start()
+    if outer == False:
+        yield
+        return
+    status = 'done'
+    try:
+        yield
+    except BaseException:
+        status = 'failed'
+        raise
+    finally:
+        record = current.record(status)
+        if TRACEMALLOC:
+            tracemalloc.stop()
+        with current_lock:
+            current = None
+        save_record(record)
+        print_record(record)
+
+
+# profile calls of a pipeline stage (rows in -> argument at position arg, rows out -> result)
+# outside of a run the function is called as it is
+def stage(name, arg=0):
+    def decorator(fn):
+        if ENABLED == False:
+            return fn
+
+        @functools.wraps(fn)
+        def profiled(*args, **kwargs):
+            running = current
+            # web workers can call pipeline functions while a refresh runs in another thread
+            if running is None or running.thread is not threading.current_thread():
+                return fn(*args, **kwargs)
+            return call(running, name, arg, fn, args, kwargs)
+        return profiled
+    return decorator
+
+
+# call fn as a stage of a run
+def call(running, name, arg, fn, args, kwargs):
+    stage = running.stage(name)
+    stage.calls += 1
+    stage.add_rows('rows_in', rows(args[arg]) if len(args) > arg else None)
+    if TRACEMALLOC:
+        peak = tracemalloc.get_traced_memory()[1]
+        for outer in running.open:
+            outer.peak_alloc = max(outer.peak_alloc, peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+    running.open.append(stage)
+    rss_start = rss_mb()
+    start = time.perf_counter()
+    try:
+        result = fn(*args, **kwargs)
+    finally:
+        stage.seconds += time.perf_counter() - start
+        stage.rss_delta += rss_mb() - rss_start
+        stage.max_rss = max_rss_mb()
+        running.open.pop()
+        if TRACEMALLOC:
+            peak = tracemalloc.get_traced_memory()[1]
+            stage.peak_alloc = max(stage.peak_alloc, peak)
+            for outer in running.open:
+                outer.peak_alloc = max(outer.peak_alloc, peak)
+    stage.add_rows('rows_out', rows(result))
+    return result
+
+
+# print the last runs of the ledger (python -m function_folder.profiler)
+if __name__ == '__main__':
+    for record in read_ledger()[-5:]:
+        print_record(record)
@@ -0,0 +1,62 @@
+import threading
+from collections import OrderedDict
+from configparser import ConfigParser
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# maximum size of all stored results
+MAX_BYTES = int(float(config['store']['max_mb']) * 1024 * 1024)
+
+
+# size of a result in bytes (dataframes -> memory usage, objects with nbytes, everything else is counted as 1 kb)
+def result_size(result):
+    if hasattr(result, 'memory_usage'):
+        return int(result.memory_usage(index=True, deep=True).sum())
+    if hasattr(result, 'nbytes'):
+        return int(result.nbytes)
+    return 1024
+
+
+# server-side store for results (e.g. filtered business dataframe) with lru eviction by size
+# the browser just keeps the key (filter + data version)
+class ResultStore:
+    def __init__(self, max_bytes=MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.results = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.results:
+                return None
+            self.results.move_to_end(key)
+            return self.results[key][0]
+
+    # size -> bytes of the result if known (e.g. size of the pickled result)
+    def put(self, key, result, size=None):
+        if size is None:
+            size = result_size(result)
+        with self.lock:
+            if key in self.results:
+                self.size -= self.results.pop(key)[1]
+            self.results[key] = (result, size)
+            self.size += size
+            # evict least recently used results (newest result is always kept)
+            while self.size > self.max_bytes and len(self.results) > 1:
+                old_key, (old_result, old_size) = self.results.popitem(last=False)
+                self.size -= old_size
+
+    # result for key, computed just if it is not stored yet
+    def get_or_compute(self, key, compute):
+        result = self.get(key)
+        if result is None:
+            result = compute()
+            self.put(key, result)
+        return result
+
+
+# store for the filtered business dataframes
+store = ResultStore()
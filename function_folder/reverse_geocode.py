@@ -0,0 +1,76 @@
+import os
+import threading
+import numpy as np
+import pandas as pd
+from configparser import ConfigParser
+from sklearn.neighbors import BallTree
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+# gazetteer -> csv with one populated place per row (columns city, state, country, lat, lon),
+# e.g. exported from geonames cities500 with admin1 and country names
+file_path_gazetteer = config['path']['path_gazetteer']
+# places further away than this are not assigned (km)
+MAX_KM = float(config['geocode']['max_km'])
+
+# earth radius in km (haversine distances of BallTree are in radians)
+EARTH_RADIUS_KM = 6371.0088
+# columns assigned from the gazetteer
+COLUMNS = ['city', 'state', 'country']
+
+
+# spatial index over the places of a gazetteer
+class ReverseGeocoder:
+    def __init__(self, df_places):
+        df_places = df_places.dropna(subset=['lat', 'lon']).reset_index(drop=True)
+        self.places = df_places[COLUMNS].fillna('not_defined').astype(str)
+        coordinates = np.radians(df_places[['lat', 'lon']].to_numpy(dtype=np.float64))
+        self.tree = BallTree(coordinates, metric='haversine')
+
+    # nearest place for all points in one vectorised query -> dataframe with city, state, country
+    def lookup(self, lat, lon, max_km=MAX_KM):
+        points = np.radians(np.column_stack([np.asarray(lat, dtype=np.float64), np.asarray(lon, dtype=np.float64)]))
+        result = pd.DataFrame('not_defined', index=range(len(points)), columns=COLUMNS)
+        if len(points) == 0 or len(self.places) == 0:
+            return result
+        distance, position = self.tree.query(points, k=1)
+        found = distance[:, 0] * EARTH_RADIUS_KM <= max_km
+        result.loc[found, COLUMNS] = self.places.iloc[position[found, 0]].to_numpy()
+        return result
+
+
+# check if gazetteer exists
+def gazetteer_exists(path=file_path_gazetteer):
+    return os.path.exists(path)
+
+
+# reverse geocoder of the process (gazetteer is loaded on first use)
+reverse_geocoder_instance = None
+reverse_geocoder_lock = threading.Lock()
+
+
+def reverse_geocoder():
+    global reverse_geocoder_instance
+    with reverse_geocoder_lock:
+        if reverse_geocoder_instance is None:
+            reverse_geocoder_instance = ReverseGeocoder(pd.read_csv(file_path_gazetteer))
+    return reverse_geocoder_instance
+
+
+# assign city, state and country of review subjects without details (value 'empty') from lat/lon
+def assign(df):
+    review_subjects = df
+    todo = (review_subjects[COLUMNS] == 'empty').any(axis=1).to_numpy()
+    if todo.sum() == 0:
+        return review_subjects
+    places = reverse_geocoder().lookup(review_subjects['lat'][todo], review_subjects['lon'][todo])
+    for column in COLUMNS:
+        values = review_subjects.loc[todo, column].to_numpy()
+        empty = values == 'empty'
+        values[empty] = places[column].to_numpy()[empty]
+        review_subjects.loc[todo, column] = values
+    print(str(todo.sum()) + ' review subject(s) reverse geocoded with the gazetteer')
+    return review_subjects
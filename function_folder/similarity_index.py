@@ -0,0 +1,169 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+from configparser import ConfigParser
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+path_similarity_index = config['path']['path_similarity_index']
+# number of neighbours kept per review subject
+TOP_K = int(config['similarity']['top_k'])
+
+# file names inside the index directory
+FILE_SUBJECTS = 'subjects.json'
+FILE_NEIGHBOURS = 'neighbours.npy'
+FILE_SCORES = 'scores.npy'
+
+
+# top-k neighbour index (neighbour ids + float16 scores per review subject)
+class SimilarityIndex:
+    def __init__(self, subjects, neighbours, scores):
+        # subjects -> row order of the index
+        self.subjects = list(subjects)
+        # neighbours -> int32 array (n, k), -1 = empty slot
+        self.neighbours = neighbours
+        # scores -> float16 array (n, k), sorted descending per row
+        self.scores = scores
+        # sub -> row position (needed for lookups in O(1))
+        self.position = {sub: i for i, sub in enumerate(self.subjects)}
+
+    def __len__(self):
+        return len(self.subjects)
+
+    def __contains__(self, sub):
+        return sub in self.position
+
+    # best neighbours of sub, optionally only within allowed subjects and rating range
+    # ratings -> dict (sub -> rating) of the allowed subjects
+    def query(self, sub, n=3, ratings=None, rating_range=None):
+        row = self.position.get(sub)
+        if row is None:
+            return []
+        result = []
+        for neighbour, score in zip(self.neighbours[row], self.scores[row]):
+            # end of row (less than k neighbours)
+            if neighbour < 0:
+                break
+            neighbour_sub = self.subjects[neighbour]
+            if ratings is not None:
+                if neighbour_sub not in ratings:
+                    continue
+                if rating_range is not None:
+                    rating = ratings[neighbour_sub]
+                    if rating < rating_range[0] or rating > rating_range[1]:
+                        continue
+            result.append((neighbour_sub, float(score)))
+            if len(result) == n:
+                break
+        return result
+
+
+# keep the k best entries of every row of a dense similarity block
+# columns -> position of each row's own subject (subject should not be its own neighbour)
+def top_k_rows(block, columns, k):
+    n_rows, n_cols = block.shape
+    neighbours = np.full((n_rows, k), -1, dtype=np.int32)
+    scores = np.zeros((n_rows, k), dtype=np.float16)
+    block[np.arange(n_rows), columns] = -np.inf
+    k_row = min(k, n_cols - 1)
+    if k_row <= 0:
+        return neighbours, scores
+    # argpartition -> O(n) per row, just the k best entries get sorted
+    part = np.argpartition(-block, k_row - 1, axis=1)[:, :k_row]
+    part_scores = np.take_along_axis(block, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind='stable')
+    neighbours[:, :k_row] = np.take_along_axis(part, order, axis=1)
+    scores[:, :k_row] = np.take_along_axis(part_scores, order, axis=1)
+    return neighbours, scores
+
+
+# build index from tf-idf matrix (rows are l2 normalised -> dot product = cosine similarity)
+# similarities are computed in chunks -> memory O(chunk_size * n) instead of O(n * n)
+def build_index(matrix, subjects, k=TOP_K, chunk_size=1024):
+    n = matrix.shape[0]
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float16)
+    matrix_t = matrix.T
+    for start in range(0, n, chunk_size):
+        stop = min(start + chunk_size, n)
+        block = matrix[start:stop].dot(matrix_t)
+        if hasattr(block, 'toarray'):
+            block = block.toarray()
+        block = np.asarray(block, dtype=np.float64)
+        neighbours[start:stop], scores[start:stop] = top_k_rows(block, np.arange(start, stop), k)
+    return SimilarityIndex(subjects, neighbours, scores)
+
+
+# update index after the rows of some subjects changed
+# subjects -> all subjects (new subjects appended at the end), rows -> positions of changed subjects
+# block -> dense similarities of the changed subjects to all subjects (len(rows), len(subjects))
+# rows of unchanged subjects only get the scores to the changed subjects merged in,
+# entries which dropped out of a top-k list are not refilled from outside the list
+def update_index(index, subjects, rows, block, k=TOP_K):
+    n = len(subjects)
+    rows = np.asarray(rows, dtype=np.int32)
+    neighbours = np.full((n, k), -1, dtype=np.int32)
+    scores = np.zeros((n, k), dtype=np.float16)
+    neighbours[:len(index)] = index.neighbours
+    scores[:len(index)] = index.scores
+    # rows of changed subjects -> recompute completely
+    neighbours[rows], scores[rows] = top_k_rows(block.copy(), rows, k)
+    # columns of changed subjects -> merge new scores into the affected rows
+    changed = np.zeros(n, dtype=bool)
+    changed[rows] = True
+    referencing = np.isin(neighbours, rows).any(axis=1)
+    positive = (block > 0).any(axis=0)
+    for j in np.nonzero((referencing | positive) & ~changed)[0]:
+        keep = (neighbours[j] >= 0) & ~np.isin(neighbours[j], rows)
+        candidate_ids = np.concatenate([neighbours[j][keep], rows])
+        candidate_scores = np.concatenate([scores[j][keep].astype(np.float64), block[:, j]])
+        order = np.argsort(-candidate_scores, kind='stable')[:k]
+        neighbours[j] = -1
+        scores[j] = 0
+        neighbours[j, :len(order)] = candidate_ids[order]
+        scores[j, :len(order)] = candidate_scores[order]
+    return SimilarityIndex(subjects, neighbours, scores)
+
+
+# build index from a dense similarity dataframe (index = columns = sub)
+def index_from_dense(df_similarity, k=TOP_K):
+    block = df_similarity.to_numpy(dtype=np.float64, copy=True)
+    neighbours, scores = top_k_rows(block, np.arange(block.shape[0]), k)
+    return SimilarityIndex(df_similarity.index.tolist(), neighbours, scores)
+
+
+# save index
+def save_index(index, path=path_similarity_index):
+    os.makedirs(path, exist_ok=True)
+    with open(os.path.join(path, FILE_SUBJECTS), 'w', encoding='UTF8') as f:
+        json.dump(index.subjects, f, ensure_ascii=False)
+    np.save(os.path.join(path, FILE_NEIGHBOURS), index.neighbours)
+    np.save(os.path.join(path, FILE_SCORES), index.scores)
+
+
+# load index (mmap=True -> arrays are memory-mapped, read-only)
+def load_index(path=path_similarity_index, mmap=False):
+    # no index yet -> empty index (no similarities available)
+    if os.path.exists(os.path.join(path, FILE_SUBJECTS)) == False:
+        return SimilarityIndex([], np.empty((0, TOP_K), dtype=np.int32), np.empty((0, TOP_K), dtype=np.float16))
+    with open(os.path.join(path, FILE_SUBJECTS), 'r', encoding='UTF8') as f:
+        subjects = json.load(f)
+    mmap_mode = 'r' if mmap and len(subjects) > 0 else None
+    neighbours = np.load(os.path.join(path, FILE_NEIGHBOURS), mmap_mode=mmap_mode)
+    scores = np.load(os.path.join(path, FILE_SCORES), mmap_mode=mmap_mode)
+    return SimilarityIndex(subjects, neighbours, scores)
+
+
+# one-shot converter for an existing dense similarity csv
+def convert_dense_csv(path_csv, path=path_similarity_index, k=TOP_K):
+    df_similarity = pd.read_csv(path_csv, index_col=0)
+    save_index(index_from_dense(df_similarity, k), path)
+
+
+if __name__ == '__main__':
+    import sys
+    convert_dense_csv(sys.argv[1])
@@ -0,0 +1,305 @@
+import json
+import os
+import numpy as np
+import scipy.sparse as sp
+from configparser import ConfigParser
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from function_folder import profiler
+from function_folder import similarity_index
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+path_similarity_model = config['path']['path_similarity_model']
+# size of the hashed feature space (stable -> no refit when new words appear)
+N_FEATURES = int(config['similarity']['n_features'])
+# full rebuild when the number of subjects grew by more than this ratio since the last rebuild
+REBUILD_RATIO = float(config['similarity']['rebuild_ratio'])
+# changed rows are appended as delta files, the model is written again when they exceed this ratio of all subjects
+DELTA_RATIO = float(config['similarity']['delta_ratio'])
+
+# file names inside the model directory
+# whole model -> numbered files (meta.json names the current number, a new model never overwrites the current one)
+FILE_SUBJECTS = 'subjects_{:06d}.json'
+FILE_COUNTS = 'counts_{:06d}.npz'
+FILE_VECTORS = 'vectors_{:06d}.npz'
+FILE_META = 'meta.json'
+# changed rows of one update (uncompressed, listed in meta.json)
+FILE_DELTA = 'delta_{:06d}.npz'
+
+# tolerance compared to a full rebuild (preprocess.feature_extraction + cosine_similarities):
+# - rows of changed subjects are exact, scores of unchanged pairs keep the idf weights of their last update
+#   (idf drifts while the corpus grows -> bounded by REBUILD_RATIO, after that everything is recomputed)
+# - rows with a word which crossed the 'occurs just once' limit are weighted again (like changed rows)
+# - hashed features can collide (N_FEATURES = 2**22 -> rare for a vocabulary of some 10k words)
+# - similarities are stored as float16 (~3 significant digits)
+# top-k similarities differ by at most TOLERANCE from a full rebuild (checked in tests/test_similarity_model.py,
+# max 0.02 on synthetic corpora grown by up to REBUILD_RATIO, 0.011 on the bundled data)
+TOLERANCE = 0.025
+
+
+# per subject term counts (hashed features) + document frequency statistics
+class SimilarityModel:
+    def __init__(self, subjects, counts, vectors, doc_freq, total, n_docs_rebuild, deltas=None, base=0):
+        # subjects -> row order (same order as the similarity index)
+        self.subjects = list(subjects)
+        # counts -> raw term counts per subject (sparse, n x N_FEATURES)
+        self.counts = counts
+        # vectors -> tf-idf vectors (l2 normalised) per subject
+        self.vectors = vectors
+        # doc_freq -> number of subjects containing a feature
+        self.doc_freq = doc_freq
+        # total -> number of occurrences of a feature in the whole corpus
+        self.total = total
+        # n_docs_rebuild -> number of subjects at the last full rebuild
+        self.n_docs_rebuild = n_docs_rebuild
+        # deltas -> delta files on disk (number, rows), n_saved -> number of subjects on disk
+        self.deltas = deltas if deltas is not None else []
+        self.n_saved = len(self.subjects)
+        # base -> number of the whole model files on disk (0 -> not saved yet)
+        self.base = base
+        self.position = {sub: i for i, sub in enumerate(self.subjects)}
+
+    # idf like TfidfVectorizer (smooth_idf=True), words which occur just once in the corpus are dropped
+    def weights(self):
+        n = len(self.subjects)
+        idf = np.log((1 + n) / (1 + self.doc_freq)) + 1
+        idf[self.total <= 1] = 0
+        return idf
+
+    # tf-idf vectors for some rows
+    def weight_rows(self, rows):
+        counts = self.counts[rows]
+        vectors = counts.multiply(self.weights()).tocsr()
+        return normalize(vectors, norm='l2', copy=False)
+
+    # set counts of changed subjects (new subjects are appended) -> returns row positions to weight again
+    # (changed subjects + subjects with a word which now occurs more than once or just once in the corpus)
+    def set_counts(self, subjects, counts):
+        for sub in subjects:
+            if sub not in self.position:
+                self.position[sub] = len(self.subjects)
+                self.subjects.append(sub)
+        rows = np.array([self.position[sub] for sub in subjects], dtype=np.int32)
+        # new subjects -> empty rows (just indptr grows)
+        self.counts = splice_rows(self.counts, len(self.subjects), [], None)
+        self.vectors = splice_rows(self.vectors, len(self.subjects), [], None)
+        dropped = self.total <= 1
+        # remove old statistics of changed subjects
+        old = self.counts[rows]
+        self.doc_freq -= np.asarray((old > 0).sum(axis=0)).ravel().astype(self.doc_freq.dtype)
+        self.total -= np.asarray(old.sum(axis=0)).ravel().astype(self.total.dtype)
+        # add new statistics
+        self.doc_freq += np.asarray((counts > 0).sum(axis=0)).ravel().astype(self.doc_freq.dtype)
+        self.total += np.asarray(counts.sum(axis=0)).ravel().astype(self.total.dtype)
+        self.counts = splice_rows(self.counts, len(self.subjects), rows, counts)
+        # words which are dropped now or not anymore -> rows with these words get other vectors
+        flipped = dropped != (self.total <= 1)
+        if flipped.any():
+            positions = np.nonzero(flipped[self.counts.indices])[0]
+            rows_flipped = np.searchsorted(self.counts.indptr, positions, side='right') - 1
+            rows = np.union1d(rows, rows_flipped).astype(np.int32)
+        return rows
+
+    # set tf-idf vectors of some rows
+    def set_vectors(self, rows, vectors):
+        self.vectors = splice_rows(self.vectors, len(self.subjects), rows, vectors)
+
+    # rebuild needed -> corpus grew too much since the last rebuild (idf drift)
+    def needs_rebuild(self):
+        return len(self.subjects) > self.n_docs_rebuild * (1 + REBUILD_RATIO)
+
+
+# csr matrix with n_rows rows (missing rows are empty) where rows are replaced by the rows of new
+# arrays of the csr matrix are spliced: untouched runs of rows are copied as blocks, no conversion to another format
+def splice_rows(matrix, n_rows, rows, new):
+    indptr = matrix.indptr.astype(np.int64)
+    if n_rows > matrix.shape[0]:
+        indptr = np.concatenate([indptr, np.full(n_rows - matrix.shape[0], indptr[-1], dtype=np.int64)])
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) == 0:
+        return sp.csr_matrix((matrix.data, matrix.indices, indptr), shape=(n_rows, matrix.shape[1]))
+    # same row more than once -> last one wins
+    rows_unique, last = np.unique(rows[::-1], return_index=True)
+    new = new.tocsr()[len(rows) - 1 - last]
+    indices, data = [], []
+    position = 0
+    for i, row in enumerate(rows_unique):
+        indices.append(matrix.indices[position:indptr[row]])
+        data.append(matrix.data[position:indptr[row]])
+        indices.append(new.indices[new.indptr[i]:new.indptr[i + 1]])
+        data.append(new.data[new.indptr[i]:new.indptr[i + 1]])
+        position = indptr[row + 1]
+    indices.append(matrix.indices[position:])
+    data.append(matrix.data[position:])
+    lengths = np.diff(indptr)
+    lengths[rows_unique] = np.diff(new.indptr)
+    indptr_out = np.zeros(n_rows + 1, dtype=np.int64)
+    np.cumsum(lengths, out=indptr_out[1:])
+    return sp.csr_matrix((np.concatenate(data).astype(np.result_type(matrix.data.dtype, new.data.dtype), copy=False),
+                          np.concatenate(indices).astype(matrix.indices.dtype, copy=False),
+                          indptr_out), shape=(n_rows, matrix.shape[1]))
+
+
+# hashed term counts, same tokens as preprocess.feature_extraction
+def term_counts(list_opinion):
+    vectorizer = HashingVectorizer(n_features=N_FEATURES, preprocessor=' '.join, alternate_sign=False, norm=None)
+    return vectorizer.transform(list_opinion).tocsr()
+
+
+# empty model
+def empty_model():
+    return SimilarityModel([],
+                           sp.csr_matrix((0, N_FEATURES)),
+                           sp.csr_matrix((0, N_FEATURES)),
+                           np.zeros(N_FEATURES, dtype=np.int64),
+                           np.zeros(N_FEATURES, dtype=np.int64),
+                           0)
+
+
+# meta.json of the model (None -> no model or model of an older version / other feature space)
+def load_meta(path=path_similarity_model):
+    if os.path.exists(os.path.join(path, FILE_META)) == False:
+        return None
+    with open(os.path.join(path, FILE_META), 'r', encoding='UTF8') as f:
+        meta = json.load(f)
+    if meta['n_features'] != N_FEATURES or 'base' not in meta:
+        return None
+    return meta
+
+
+# check if a usable model exists (otherwise the next update starts with all subjects)
+def model_exists(path=path_similarity_model):
+    return load_meta(path) is not None
+
+
+# write meta.json atomically (names the model files and lists the delta files -> files without meta entry are ignored)
+def save_meta(model, path):
+    path_tmp = os.path.join(path, FILE_META + '.tmp')
+    with open(path_tmp, 'w', encoding='UTF8') as f:
+        json.dump({'n_features': N_FEATURES, 'n_docs_rebuild': model.n_docs_rebuild, 'base': model.base,
+                   'deltas': model.deltas}, f)
+    os.replace(path_tmp, os.path.join(path, FILE_META))
+
+
+# remove model and delta files which are not named in meta.json (older models, interrupted saves)
+def remove_unlisted(model, path):
+    listed = set(FILE_DELTA.format(number) for number, rows in model.deltas)
+    listed.update(name.format(model.base) for name in [FILE_SUBJECTS, FILE_COUNTS, FILE_VECTORS])
+    for name in os.listdir(path):
+        if name != FILE_META and name not in listed:
+            os.remove(os.path.join(path, name))
+
+
+# write a file of the model (write(path_tmp) -> complete file, then renamed)
+def write_file(path, name, write):
+    path_tmp = os.path.join(path, 'tmp_' + name)
+    write(path_tmp)
+    os.replace(path_tmp, os.path.join(path, name))
+
+
+# save whole model (after a rebuild or when the deltas grew too large)
+# new numbered files first, meta.json last -> a crash leaves the previous model and its deltas
+def save_model(model, path=path_similarity_model):
+    os.makedirs(path, exist_ok=True)
+    base = model.base + 1
+
+    def write_subjects(path_tmp):
+        with open(path_tmp, 'w', encoding='UTF8') as f:
+            json.dump(model.subjects, f, ensure_ascii=False)
+    write_file(path, FILE_SUBJECTS.format(base), write_subjects)
+    write_file(path, FILE_COUNTS.format(base), lambda path_tmp: sp.save_npz(path_tmp, model.counts))
+    write_file(path, FILE_VECTORS.format(base), lambda path_tmp: sp.save_npz(path_tmp, model.vectors))
+    model.base = base
+    model.deltas = []
+    model.n_saved = len(model.subjects)
+    save_meta(model, path)
+    remove_unlisted(model, path)
+
+
+# save changed rows + new subjects as a delta file (cost scales with the number of changed rows)
+def save_delta(model, rows, path=path_similarity_model):
+    if model_exists(path) == False or model.n_saved > len(model.subjects):
+        save_model(model, path)
+        return
+    rows = np.unique(np.asarray(rows, dtype=np.int64))
+    if sum(n for number, n in model.deltas) + len(rows) > DELTA_RATIO * len(model.subjects):
+        save_model(model, path)
+        return
+    number = model.deltas[-1][0] + 1 if len(model.deltas) > 0 else 1
+    counts = model.counts[rows]
+    vectors = model.vectors[rows]
+    write_file(path, FILE_DELTA.format(number), lambda path_tmp: np.savez(
+        path_tmp,
+        rows=rows,
+        subjects=np.array(model.subjects[model.n_saved:], dtype=str),
+        counts_data=counts.data, counts_indices=counts.indices, counts_indptr=counts.indptr,
+        vectors_data=vectors.data, vectors_indices=vectors.indices, vectors_indptr=vectors.indptr))
+    model.deltas.append([number, len(rows)])
+    model.n_saved = len(model.subjects)
+    save_meta(model, path)
+
+
+# load model (None -> no usable model, see load_meta)
+# delta files are applied in one splice (later deltas win), document frequencies are counted from the counts
+def load_model(path=path_similarity_model):
+    meta = load_meta(path)
+    if meta is None:
+        return None
+    base = meta['base']
+    with open(os.path.join(path, FILE_SUBJECTS.format(base)), 'r', encoding='UTF8') as f:
+        subjects = json.load(f)
+    counts = sp.load_npz(os.path.join(path, FILE_COUNTS.format(base))).tocsr()
+    vectors = sp.load_npz(os.path.join(path, FILE_VECTORS.format(base))).tocsr()
+    deltas = meta.get('deltas', [])
+    if len(deltas) > 0:
+        rows, new_counts, new_vectors = [], [], []
+        for number, n in deltas:
+            with np.load(os.path.join(path, FILE_DELTA.format(number))) as delta:
+                subjects.extend(delta['subjects'].tolist())
+                rows.append(delta['rows'])
+                shape = (len(delta['rows']), N_FEATURES)
+                new_counts.append(sp.csr_matrix((delta['counts_data'], delta['counts_indices'],
+                                                 delta['counts_indptr']), shape=shape))
+                new_vectors.append(sp.csr_matrix((delta['vectors_data'], delta['vectors_indices'],
+                                                  delta['vectors_indptr']), shape=shape))
+        rows = np.concatenate(rows)
+        counts = splice_rows(counts, len(subjects), rows, sp.vstack(new_counts, format='csr'))
+        vectors = splice_rows(vectors, len(subjects), rows, sp.vstack(new_vectors, format='csr'))
+    present = counts.indices[counts.data > 0]
+    doc_freq = np.bincount(present, minlength=N_FEATURES).astype(np.int64)
+    total = np.rint(np.bincount(counts.indices, weights=counts.data, minlength=N_FEATURES)).astype(np.int64)
+    return SimilarityModel(subjects, counts, vectors, doc_freq, total, meta['n_docs_rebuild'], deltas, base)
+
+
+# recompute all vectors + whole index (from stored counts -> no tokenisation needed)
+def rebuild(model):
+    model.vectors = model.weight_rows(np.arange(len(model.subjects)))
+    model.n_docs_rebuild = len(model.subjects)
+    return similarity_index.build_index(model.vectors, model.subjects)
+
+
+# update model with normalised opinions of changed subjects (df with columns sub + opinion)
+# cost scales with the number of changed subjects (+ their similarities to all subjects)
+@profiler.stage('similarity')
+def update(df, path=path_similarity_model, path_index=similarity_index.path_similarity_index):
+    model = load_model(path)
+    if model is None:
+        model = empty_model()
+    index = similarity_index.load_index(path_index)
+    rows = model.set_counts(df['sub'].tolist(), term_counts(df['opinion'].tolist()))
+    # index does not fit to model (e.g. written by full mode) or corpus grew too much -> rebuild
+    if index.subjects != model.subjects[:len(index)] or model.needs_rebuild():
+        index = rebuild(model)
+        save_model(model, path)
+    else:
+        vectors = model.weight_rows(rows)
+        model.set_vectors(rows, vectors)
+        block = vectors.dot(model.vectors.T).toarray()
+        index = similarity_index.update_index(index, model.subjects, rows, block)
+        save_delta(model, rows, path)
+    similarity_index.save_index(index, path_index)
+    return index
@@ -0,0 +1,187 @@
+import json
+import os
+import shutil
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from configparser import ConfigParser
+from function_folder import similarity_index
+from function_folder import kpi_series
+from function_folder import profiler
+from function_folder import text_store
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+path_snapshot = config['path']['path_snapshot']
+path_business = config['path']['path_business']
+path_kpi = config['path']['path_kpi']
+path_similarity_index = config['path']['path_similarity_index']
+path_kpi_series = config['path']['path_kpi_series']
+
+# csv datasets inside a snapshot (data before the first update, afterwards they come from the ingest store)
+DATASETS = {'business': path_business,
+            'kpi': path_kpi}
+# similarity index inside a snapshot
+DIR_SIMILARITY = 'similarity'
+# kpi series inside a snapshot
+DIR_KPI_SERIES = 'kpi_series'
+# column description of a dataset
+FILE_COLUMNS = 'columns.json'
+# name of the current version
+FILE_CURRENT = 'CURRENT'
+# number of versions which are kept
+KEEP_VERSIONS = int(config['snapshot']['keep'])
+
+
+# write dataframe as columnar files
+# numeric columns -> <n>.npy, string columns -> codes <n>.npy + string table <n>.strings.json
+def write_frame(df, path):
+    os.makedirs(path, exist_ok=True)
+    columns = []
+    for n, column in enumerate(df.columns):
+        values = df[column]
+        if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            np.save(os.path.join(path, '{}.npy'.format(n)), values.to_numpy())
+            columns.append({'name': column, 'kind': 'numeric'})
+        else:
+            # dictionary encoding (codes -> smallest int type, -1 = missing)
+            categorical = pd.Categorical(values.where(values.isna(), values.astype(str)))
+            np.save(os.path.join(path, '{}.npy'.format(n)), categorical.codes)
+            with open(os.path.join(path, '{}.strings.json'.format(n)), 'w', encoding='UTF8') as f:
+                json.dump(categorical.categories.tolist(), f, ensure_ascii=False)
+            columns.append({'name': column, 'kind': 'string'})
+    # column description last -> dataset is complete when it exists
+    with open(os.path.join(path, FILE_COLUMNS), 'w', encoding='UTF8') as f:
+        json.dump({'rows': int(df.shape[0]), 'columns': columns}, f, ensure_ascii=False)
+
+
+# read dataframe from columnar files
+# mmap=True -> arrays are memory-mapped (read-only, pages shared by all processes)
+def read_frame(path, mmap=True):
+    with open(os.path.join(path, FILE_COLUMNS), 'r', encoding='UTF8') as f:
+        meta = json.load(f)
+    # empty arrays can not be memory-mapped
+    mmap_mode = 'r' if mmap and meta['rows'] > 0 else None
+    data = {}
+    for n, column in enumerate(meta['columns']):
+        values = np.load(os.path.join(path, '{}.npy'.format(n)), mmap_mode=mmap_mode)
+        if column['kind'] == 'string':
+            with open(os.path.join(path, '{}.strings.json'.format(n)), 'r', encoding='UTF8') as f:
+                categories = json.load(f)
+            values = pd.Categorical.from_codes(values, categories)
+        data[column['name']] = values
+    # copy=False -> columns keep pointing to the memory-mapped arrays
+    return pd.DataFrame(data, columns=[c['name'] for c in meta['columns']], copy=False)
+
+
+# current version (name of the version directory) or None
+def current_version(path=path_snapshot):
+    path_current = os.path.join(path, FILE_CURRENT)
+    if os.path.exists(path_current) == False:
+        return None
+    with open(path_current, 'r', encoding='UTF8') as f:
+        return f.read().strip()
+
+
+# directory of a version (None -> current version)
+def version_path(version=None, path=path_snapshot):
+    if version is None:
+        version = current_version(path)
+    return os.path.join(path, version)
+
+
+# switch current version (temporary file + rename -> readers see the old or the new version)
+def set_current_version(version, path=path_snapshot):
+    path_tmp = os.path.join(path, FILE_CURRENT + '.tmp')
+    with open(path_tmp, 'w', encoding='UTF8') as f:
+        f.write(version)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path_tmp, os.path.join(path, FILE_CURRENT))
+
+
+# remove old versions (the newest KEEP_VERSIONS stay for workers which still read them)
+# files of the old layout without versions are removed as well
+def remove_old_versions(path=path_snapshot):
+    current = current_version(path)
+    versions = sorted(i for i in os.listdir(path) if i.isdigit())
+    keep = set(versions[-KEEP_VERSIONS:]) | {current, FILE_CURRENT}
+    for name in os.listdir(path):
+        if name not in keep and not name.endswith('.tmp'):
+            path_old = os.path.join(path, name)
+            if os.path.isdir(path_old):
+                shutil.rmtree(path_old)
+            else:
+                os.remove(path_old)
+
+
+# business + kpi datasets (ingest store, no store yet -> csv files)
+def read_datasets():
+    # ingest store is imported by the pipeline, not by the web app
+    from function_folder import ingest_store
+    if ingest_store.store_exists():
+        store = ingest_store.IngestStore()
+        try:
+            return {'business': store.business(), 'kpi': store.kpi()}
+        finally:
+            store.close()
+    return {name: pd.read_csv(path_csv) for name, path_csv in DATASETS.items() if os.path.exists(path_csv)}
+
+
+# write snapshot of all datasets (ingest store + text store + similarity index + kpi series)
+# every snapshot is a new immutable version directory, CURRENT points to the newest one
+@profiler.stage('snapshot')
+def write_snapshot(path=path_snapshot):
+    version = datetime.utcnow().strftime('%Y%m%d%H%M%S%f')
+    path_tmp = os.path.join(path, version + '.tmp')
+    if os.path.exists(path_tmp):
+        shutil.rmtree(path_tmp)
+    datasets = read_datasets()
+    for name, df in datasets.items():
+        write_frame(df, os.path.join(path_tmp, name))
+    # no text store yet -> created from the text csv
+    store = text_store.open_store()
+    try:
+        write_frame(store.read(), os.path.join(path_tmp, 'text'))
+    finally:
+        store.close()
+    similarity_index.save_index(similarity_index.load_index(path_similarity_index),
+                                os.path.join(path_tmp, DIR_SIMILARITY))
+    if kpi_series.series_exists(path_kpi_series):
+        series = kpi_series.load_series(path_kpi_series)
+    else:
+        series = kpi_series.build_series(datasets['kpi'])
+    kpi_series.save_series(series, os.path.join(path_tmp, DIR_KPI_SERIES))
+    # complete version directory, then switch
+    os.rename(path_tmp, os.path.join(path, version))
+    set_current_version(version, path)
+    remove_old_versions(path)
+    return version
+
+
+# check if snapshot exists
+def snapshot_exists(path=path_snapshot):
+    return current_version(path) is not None
+
+
+# read one dataset of a snapshot version (None -> current version)
+def read_dataset(name, version=None, path=path_snapshot, mmap=True):
+    return read_frame(os.path.join(version_path(version, path), name), mmap)
+
+
+# read similarity index of a snapshot version
+def read_similarity(version=None, path=path_snapshot, mmap=True):
+    return similarity_index.load_index(os.path.join(version_path(version, path), DIR_SIMILARITY), mmap)
+
+
+# read kpi series of a snapshot version
+def read_kpi_series(version=None, path=path_snapshot, mmap=True):
+    return kpi_series.load_series(os.path.join(version_path(version, path), DIR_KPI_SERIES), mmap)
+
+
+# one-shot converter for the existing csv files
+if __name__ == '__main__':
+    write_snapshot()
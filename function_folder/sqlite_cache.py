@@ -0,0 +1,61 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+# persistent key -> json value cache in a sqlite file (shared by threads and processes)
+# ttl -> entries older than ttl seconds are treated as missing (None -> never expire)
+class SqliteCache:
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.local = threading.local()
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        with self.connection() as connection:
+            connection.execute('CREATE TABLE IF NOT EXISTS {} (key TEXT PRIMARY KEY, value TEXT, ts REAL, ttl REAL)'
+                               .format(self.table))
+
+    # one connection per thread and process
+    def connection(self):
+        connection = getattr(self.local, 'connection', None)
+        if connection is None or self.local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self.local.connection = connection
+            self.local.pid = os.getpid()
+        return connection
+
+    def get(self, key, default=None):
+        return self.get_many([key]).get(key, default)
+
+    # values of all keys which are cached and not expired
+    def get_many(self, keys):
+        result = {}
+        now = time.time()
+        keys = list(keys)
+        connection = self.connection()
+        # sqlite limits the number of variables per statement
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = connection.execute('SELECT key, value, ts, ttl FROM {} WHERE key IN ({})'
+                                      .format(self.table, ','.join('?' * len(chunk))), chunk).fetchall()
+            for key, value, ts, ttl in rows:
+                if ttl is None or now - ts < ttl:
+                    result[key] = json.loads(value)
+        return result
+
+    def set(self, key, value, ttl=None):
+        self.set_many({key: value}, ttl)
+
+    # write values in one transaction
+    def set_many(self, values, ttl=None):
+        now = time.time()
+        rows = [(key, json.dumps(value, ensure_ascii=False), now, ttl) for key, value in values.items()]
+        with self.connection() as connection:
+            connection.executemany('INSERT OR REPLACE INTO {} (key, value, ts, ttl) VALUES (?, ?, ?, ?)'
+                                   .format(self.table), rows)
@@ -0,0 +1,226 @@
+import json
+import os
+import sqlite3
+import threading
+import pandas as pd
+from configparser import ConfigParser
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+# store directory -> append-only segments (segment_<n>.jsonl) + offset index (index.sqlite)
+path_text_store = config['path']['path_text_store']
+# old text csv (sub, opinion), imported once if the store does not exist
+file_path_text = config['path']['path_text']
+# a new segment is started when the active one is bigger (bytes)
+SEGMENT_BYTES = int(float(config['text_store']['segment_mb']) * 1024 * 1024)
+# compaction when there are more entries than compact_ratio * number of subjects
+COMPACT_RATIO = float(config['text_store']['compact_ratio'])
+
+FILE_INDEX = 'index.sqlite'
+
+# one writer/compaction at a time in the process
+store_lock = threading.RLock()
+
+
+# file name of a segment
+def segment_name(n):
+    return 'segment_{:06d}.jsonl'.format(n)
+
+
+# review text store
+# every append writes new lines (json [sub, text]) to the active segment, the index keeps sub -> (segment, offset, length)
+# text of a subject -> all its entries in append order, joined with ' '
+# ids of appended reviews are kept (also after compaction) -> the same review is never appended twice
+class TextStore:
+    def __init__(self, path=path_text_store):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.connection = sqlite3.connect(os.path.join(path, FILE_INDEX), timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS entry (sub TEXT, segment INTEGER, offset INTEGER, '
+                                    'length INTEGER)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS entry_sub ON entry (sub, segment, offset)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS review (id TEXT PRIMARY KEY)')
+
+    def close(self):
+        self.connection.close()
+
+    def segment_path(self, n):
+        return os.path.join(self.path, segment_name(n))
+
+    # numbers of the existing segments
+    def segments(self):
+        return sorted(int(i[len('segment_'):-len('.jsonl')]) for i in os.listdir(self.path)
+                      if i.startswith('segment_') and i.endswith('.jsonl'))
+
+    # active segment (last one, new one if it is full)
+    def active_segment(self):
+        segments = self.segments()
+        if len(segments) == 0:
+            return 0
+        n = segments[-1]
+        if os.path.getsize(self.segment_path(n)) >= SEGMENT_BYTES:
+            return n + 1
+        return n
+
+    # review ids which are already in the store
+    def known_ids(self, ids):
+        known = set()
+        ids = list(ids)
+        # sqlite limits the number of variables per statement
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            known.update(i[0] for i in self.connection.execute('SELECT id FROM review WHERE id IN ({})'
+                                                               .format(','.join('?' * len(chunk))), chunk))
+        return known
+
+    # append texts (list of (sub, text) or (sub, text, review id)), empty texts are skipped
+    # reviews with a known id are skipped (page fetched again after an interrupted update)
+    def append(self, items):
+        items = [(item[0], item[1], item[2] if len(item) > 2 else None) for item in items
+                 if isinstance(item[1], str) and item[1].strip() != '']
+        if len(items) == 0:
+            return
+        with store_lock:
+            known = self.known_ids(i[2] for i in items if i[2] is not None)
+            items_new = []
+            for sub, text, review in items:
+                if review is not None:
+                    if review in known:
+                        continue
+                    known.add(review)
+                items_new.append((sub, text, review))
+            if len(items_new) == 0:
+                return
+            n = self.active_segment()
+            rows = []
+            with open(self.segment_path(n), 'ab') as f:
+                offset = f.tell()
+                for sub, text, review in items_new:
+                    line = (json.dumps([sub, text], ensure_ascii=False) + '\n').encode('UTF8')
+                    f.write(line)
+                    rows.append((sub, n, offset, len(line)))
+                    offset += len(line)
+                f.flush()
+                os.fsync(f.fileno())
+            # index last -> lines without index entry (crash) are never read
+            # entries and review ids in one transaction
+            with self.connection:
+                self.connection.executemany('INSERT INTO entry (sub, segment, offset, length) VALUES (?, ?, ?, ?)',
+                                            rows)
+                self.connection.executemany('INSERT INTO review (id) VALUES (?)',
+                                            [(review,) for sub, text, review in items_new if review is not None])
+
+    # index entries of subjects (None -> all), ordered by sub and append order
+    def entries(self, subs=None):
+        if subs is None:
+            return self.connection.execute('SELECT sub, segment, offset, length FROM entry '
+                                           'ORDER BY sub, segment, offset').fetchall()
+        rows = []
+        subs = list(subs)
+        # sqlite limits the number of variables per statement
+        for start in range(0, len(subs), 500):
+            chunk = subs[start:start + 500]
+            rows += self.connection.execute('SELECT sub, segment, offset, length FROM entry WHERE sub IN ({})'
+                                            .format(','.join('?' * len(chunk))), chunk).fetchall()
+        return sorted(rows)
+
+    # stream (sub, text) of subjects (None -> all), one subject at a time
+    def iter_texts(self, subs=None):
+        with store_lock:
+            entries = self.entries(subs)
+            files = {}
+            try:
+                sub_current, texts = None, []
+                for sub, segment, offset, length in entries:
+                    if sub != sub_current and sub_current is not None:
+                        yield sub_current, ' '.join(texts)
+                        texts = []
+                    sub_current = sub
+                    if segment not in files:
+                        files[segment] = open(self.segment_path(segment), 'rb')
+                    files[segment].seek(offset)
+                    texts.append(json.loads(files[segment].read(length).decode('UTF8'))[1])
+                if sub_current is not None:
+                    yield sub_current, ' '.join(texts)
+            finally:
+                for f in files.values():
+                    f.close()
+
+    # dataframe with sub and opinion (subs None -> all subjects)
+    def read(self, subs=None):
+        return pd.DataFrame(list(self.iter_texts(subs)), columns=['sub', 'opinion'])
+
+    # check if compaction is worth it (many entries per subject)
+    def needs_compaction(self):
+        n_entries, n_subjects = self.connection.execute('SELECT COUNT(*), COUNT(DISTINCT sub) FROM entry').fetchone()
+        return n_entries > COMPACT_RATIO * max(n_subjects, 1)
+
+    # rewrite all texts into new segments with one entry per subject, old segments are removed
+    def compact(self):
+        with store_lock:
+            segments_old = self.segments()
+            n = segments_old[-1] + 1 if len(segments_old) > 0 else 0
+            rows = []
+            f = open(self.segment_path(n), 'wb')
+            try:
+                for sub, text in self.iter_texts():
+                    if f.tell() >= SEGMENT_BYTES:
+                        f.flush()
+                        os.fsync(f.fileno())
+                        f.close()
+                        n += 1
+                        f = open(self.segment_path(n), 'wb')
+                    line = (json.dumps([sub, text], ensure_ascii=False) + '\n').encode('UTF8')
+                    rows.append((sub, n, f.tell(), len(line)))
+                    f.write(line)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                f.close()
+            # swap index in one transaction, then the old segments are not referenced anymore
+            with self.connection:
+                self.connection.execute('DELETE FROM entry')
+                self.connection.executemany('INSERT INTO entry (sub, segment, offset, length) VALUES (?, ?, ?, ?)',
+                                            rows)
+            for segment in segments_old:
+                os.remove(self.segment_path(segment))
+            print('text store compacted -> ' + str(len(rows)) + ' subject(s)')
+
+
+# check if store exists
+def store_exists(path=path_text_store):
+    return os.path.exists(os.path.join(path, FILE_INDEX))
+
+
+# open store (first use -> texts of the old csv are imported)
+def open_store(path=path_text_store):
+    if store_exists(path) == False and os.path.exists(file_path_text):
+        store = TextStore(path)
+        df = pd.read_csv(file_path_text)
+        store.append(zip(df['sub'].astype(str), df['opinion']))
+        print('text csv imported into the text store')
+        return store
+    return TextStore(path)
+
+
+# compaction in a background thread (own connection), just if it is worth it
+def compact_in_background(path=path_text_store):
+    def run():
+        store = TextStore(path)
+        try:
+            if store.needs_compaction():
+                store.compact()
+        finally:
+            store.close()
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+# one-shot import of the text csv
+if __name__ == '__main__':
+    open_store().close()
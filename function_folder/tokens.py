@@ -0,0 +1,150 @@
+import hashlib
+import json
+import os
+import sqlite3
+from collections import Counter
+from configparser import ConfigParser
+from functools import lru_cache
+import nltk
+from nltk.corpus import stopwords
+from nltk.tokenize import word_tokenize
+from nltk import WordNetLemmatizer
+from unidecode import unidecode
+
+# load config
+config = ConfigParser()
+config.read('config/config.ini')
+
+# load path
+file_path_token_cache = config['path']['path_token_cache']
+# maximum number of memoised lemmas
+LEMMA_CACHE = int(config['tokens']['lemma_cache'])
+
+# nltk resources -> path inside nltk_data
+NLTK_RESOURCES = {'punkt': 'tokenizers/punkt',
+                  'stopwords': 'corpora/stopwords',
+                  'wordnet': 'corpora/wordnet'}
+
+# stopwords and lemmatizer (created on first use, shared by all texts)
+stop_words = None
+lemmatizer = None
+
+
+# check the nltk resources on disk (no network), just missing ones are downloaded
+def ensure_nltk_data():
+    for name, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            print('nltk resource ' + name + ' missing -> download')
+            nltk.download(name, quiet=True)
+
+
+def stop_word_set():
+    global stop_words
+    if stop_words is None:
+        stop_words = frozenset(stopwords.words('english'))
+    return stop_words
+
+
+# lemma of a token (memoised -> every distinct word is lemmatised once)
+@lru_cache(maxsize=LEMMA_CACHE)
+def lemma(word):
+    global lemmatizer
+    if lemmatizer is None:
+        lemmatizer = WordNetLemmatizer()
+    return lemmatizer.lemmatize(word)
+
+
+# normalise opinion -> list of tokens
+def normalise_opinion(text):
+    # text to lower + unidecode
+    text = unidecode(text.lower())
+    # tokenize, just keep words with letters (no punctuation, numbers, etc.), remove stopwords
+    stop = stop_word_set()
+    return [lemma(i) for i in word_tokenize(text) if i.isalpha() and i not in stop]
+
+
+# cache key of a text
+def text_hash(text):
+    return hashlib.sha1(text.encode('UTF8')).hexdigest()
+
+
+# persisted tokens and global term counts
+# tokens -> token list per text hash (just changed texts are tokenised again)
+# subject -> text hash per review subject of the corpus
+# term_count -> occurrences of each term in the corpus (updated with the changed subjects)
+class TokenStore:
+    def __init__(self, path=file_path_token_cache):
+        directory = os.path.dirname(path)
+        if directory != '':
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS tokens (text_hash TEXT PRIMARY KEY, tokens TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS subject (sub TEXT PRIMARY KEY, text_hash TEXT)')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS term_count (term TEXT PRIMARY KEY, n INTEGER)')
+
+    def close(self):
+        self.connection.close()
+
+    def select(self, sql, keys):
+        keys = list(keys)
+        rows = []
+        # sqlite limits the number of variables per statement
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows += self.connection.execute(sql.format(','.join('?' * len(chunk))), chunk).fetchall()
+        return rows
+
+    # token lists of texts (list) -> list in the same order, new texts are tokenised and saved
+    def tokens(self, texts):
+        hashes = [text_hash(text) for text in texts]
+        known = {key: json.loads(value)
+                 for key, value in self.select('SELECT text_hash, tokens FROM tokens WHERE text_hash IN ({})', set(hashes))}
+        new = {}
+        for key, text in zip(hashes, texts):
+            if key not in known and key not in new:
+                new[key] = normalise_opinion(text)
+        with self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO tokens (text_hash, tokens) VALUES (?, ?)',
+                                        [(key, json.dumps(value)) for key, value in new.items()])
+        known.update(new)
+        print(str(len(new)) + ' text(s) tokenised, ' + str(len(set(hashes)) - len(new)) + ' from token cache')
+        return [known[key] for key in hashes], hashes
+
+    # sync term counts with the corpus (all review subjects + text hashes)
+    # changed subjects -> old tokens are subtracted, new tokens added, missing subjects are removed
+    # partial=True -> subs are just the changed subjects, the other subjects keep their counts
+    def sync(self, subs, hashes, partial=False):
+        if partial:
+            current = dict(self.select('SELECT sub, text_hash FROM subject WHERE sub IN ({})', set(subs)))
+        else:
+            current = dict(self.connection.execute('SELECT sub, text_hash FROM subject').fetchall())
+        corpus = dict(zip(subs, hashes))
+        removed = [current[sub] for sub in current if corpus.get(sub) != current[sub]]
+        added = [key for sub, key in corpus.items() if current.get(sub) != key]
+        if len(removed) == 0 and len(added) == 0:
+            return
+        tokens = dict((key, json.loads(value)) for key, value in
+                      self.select('SELECT text_hash, tokens FROM tokens WHERE text_hash IN ({})', set(removed + added)))
+        delta = Counter()
+        for key in added:
+            delta.update(tokens[key])
+        for key in removed:
+            delta.subtract(tokens.get(key, []))
+        with self.connection:
+            self.connection.executemany('INSERT INTO term_count (term, n) VALUES (?, ?) '
+                                        'ON CONFLICT(term) DO UPDATE SET n = n + excluded.n',
+                                        [(term, n) for term, n in delta.items() if n != 0])
+            self.connection.execute('DELETE FROM term_count WHERE n <= 0')
+            self.connection.executemany('DELETE FROM subject WHERE sub = ?',
+                                        [(sub,) for sub in current if sub not in corpus])
+            self.connection.executemany('INSERT OR REPLACE INTO subject (sub, text_hash) VALUES (?, ?)',
+                                        [(sub, key) for sub, key in corpus.items() if current.get(sub) != key])
+        print(str(len(added)) + ' subject(s) changed in term counts')
+
+    # terms which occur just once in the corpus
+    def occurring_once(self):
+        return {term for (term,) in self.connection.execute('SELECT term FROM term_count WHERE n = 1')}
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# modules read config/config.ini relative to the working directory -> tests run from the repo root
+PATH_REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(PATH_REPO)
+sys.path.insert(0, PATH_REPO)
+# local stand-ins for the mangrove api and nominatim
+sys.path.insert(0, os.path.join(PATH_REPO, 'benchmarks'))
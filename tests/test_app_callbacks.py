@@ -0,0 +1,36 @@
+import dash
+import app
+from function_folder import dataset
+from function_folder import jobs
+from function_folder import result_store
+
+
+# finished update (also in another worker) -> new data version -> dropdown_category is filled again
+def test_finished_update_sends_the_data_version(monkeypatch):
+    monkeypatch.setattr(jobs, 'read_state', lambda: {'status': 'running', 'stage': 'nlp', 'message': ''})
+    assert app.cb_text_job(1, None)[2] is dash.no_update
+    monkeypatch.setattr(jobs, 'read_state', lambda: {'status': 'done', 'stage': 'warm', 'message': ''})
+    version = app.cb_text_job(2, None)[2]
+    assert version == str(dataset.holder.version)
+    get_version = dataset.holder.get_version
+    monkeypatch.setattr(dataset.holder, 'get_version', lambda: get_version() + ('new',))
+    assert app.cb_text_job(3, None)[2] != version
+    assert len(app.cb_dropdown_category(version)) > 0
+
+
+# key of an older version -> its stored result, or the filter on the current datasets with a new key
+def test_key_resolves_by_its_version():
+    key = app.cb_store_business('All', 'All', 'All')
+    current = app.filtered_business(key)
+    # version is a list after the round trip through the browser
+    key_browser = dict(key, version=list(key['version']))
+    assert app.resolve_business(key_browser)[1] is current
+    key_old = dict(key, version=['old'])
+    old = current.head(1)
+    result_store.store.put((('old',), 'All', 'All', 'All'), old)
+    key_resolved, df = app.resolve_business(key_old)
+    assert key_resolved == key_old and df is old
+    key_gone = dict(key, version=['gone'])
+    key_new, df = app.resolve_business(key_gone)
+    assert key_new['version'] == dataset.holder.version
+    assert df is current
@@ -0,0 +1,12 @@
+import statistics
+import import_time
+
+
+# new processes -> the web app imports no pipeline module, loads no data before the first callback
+# and the median import stays below the budget of benchmarks/import_time.py
+def test_import_is_fast_and_loads_no_data():
+    results = [import_time.run_once() for i in range(3)]
+    for result in results:
+        assert result['modules'] == []
+        assert result['loaded'] == []
+    assert statistics.median(result['import'] for result in results) < import_time.BUDGET
@@ -0,0 +1,133 @@
+import time
+from http.server import BaseHTTPRequestHandler
+import pytest
+import stand_in
+from function_folder import geocode
+
+# review subjects known to the stand-in
+SUBJECTS = [{'sub': 'geo:46.8,9.5?q=Gansplatz&u=30', 'name': 'Gansplatz', 'lat': 46.8, 'lon': 9.5,
+             'category': 'restaurant', 'country': 'Switzerland', 'state': 'Grisons'},
+            {'sub': 'geo:52.5,13.4?q=Kiosk&u=30', 'name': 'Kiosk', 'lat': 52.5, 'lon': 13.4,
+             'category': 'cafe', 'country': 'Germany', 'state': 'Berlin'}]
+
+
+# stand-in nominatim which counts its requests
+def counting_server(handler):
+    class Counting(handler):
+        requests = 0
+
+        def do_GET(self):
+            Counting.requests += 1
+            super().do_GET()
+    return Counting, stand_in.start(Counting) + '/search'
+
+
+# nominatim which answers with status or after delay seconds
+def failing_server(status=500, delay=0.0):
+    class Failing(BaseHTTPRequestHandler):
+        requests = 0
+
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            Failing.requests += 1
+            time.sleep(delay)
+            try:
+                self.send_response(status)
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'[]')
+            except ConnectionError:
+                # client gave up (timeout)
+                pass
+    return Failing, stand_in.start(Failing) + '/search'
+
+
+def test_token_bucket_spreads_requests():
+    bucket = geocode.TokenBucket(rate=20)
+    start = time.monotonic()
+    for i in range(11):
+        bucket.acquire()
+    # first token is available at once, the other 10 need 1 / rate seconds each
+    assert time.monotonic() - start >= 10 / 20 * 0.9
+
+
+def test_search_many_keeps_rate(tmp_path):
+    handler, url = counting_server(stand_in.nominatim_handler(SUBJECTS))
+    geocoder = geocode.Geocoder(url=url, rate=20, workers=4, path_cache=str(tmp_path / 'geocode.sqlite'))
+    queries = [('subject ' + str(i), 9.5 + i, 46.8) for i in range(9)]
+    start = time.monotonic()
+    answers = geocoder.search_many(queries)
+    assert time.monotonic() - start >= 8 / 20 * 0.9
+    assert len(answers) == 9
+    assert handler.requests == 9
+
+
+def test_cache_hit_makes_no_request(tmp_path):
+    handler, url = counting_server(stand_in.nominatim_handler(SUBJECTS))
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    answer = geocoder.search('Gansplatz', 9.5, 46.8)
+    assert answer['result'][0]['type'] == 'restaurant'
+    assert answer['result'][0]['address']['state'] == 'Grisons'
+    assert geocoder.search('Gansplatz', 9.5, 46.8) == answer
+    # cache is persistent -> a new geocoder (new process) does not ask again
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    assert geocoder.search('Gansplatz', 9.5, 46.8) == answer
+    assert handler.requests == 1
+
+
+def test_miss_is_cached_until_negative_ttl(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode, 'NEGATIVE_TTL', 0.3)
+    handler, url = counting_server(stand_in.nominatim_handler(SUBJECTS))
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    assert geocoder.search('Nowhere', 0.0, 0.0) == {'result': []}
+    assert geocoder.search('Nowhere', 0.0, 0.0) == {'result': []}
+    assert handler.requests == 1
+    time.sleep(0.4)
+    geocoder.search('Nowhere', 0.0, 0.0)
+    assert handler.requests == 2
+
+
+def test_client_error_is_cached_negatively(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode, 'NEGATIVE_TTL', 0.3)
+    handler, url = failing_server(status=400)
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    answer = geocoder.search('Gansplatz', 9.5, 46.8)
+    assert 'error' in answer and '400' in answer['error']
+    assert geocoder.search('Gansplatz', 9.5, 46.8) == answer
+    assert handler.requests == 1
+    time.sleep(0.4)
+    geocoder.search('Gansplatz', 9.5, 46.8)
+    assert handler.requests == 2
+
+
+# server errors and rate limits -> asked again with the next search
+@pytest.mark.parametrize('status', [503, 429])
+def test_transient_error_is_not_cached(tmp_path, status):
+    handler, url = failing_server(status=status)
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    answer = geocoder.search('Gansplatz', 9.5, 46.8)
+    assert 'error' in answer and str(status) in answer['error']
+    geocoder.search('Gansplatz', 9.5, 46.8)
+    assert handler.requests == 2
+
+
+def test_timeout_returns_error(tmp_path, monkeypatch):
+    monkeypatch.setattr(geocode, 'TIMEOUT', 0.2)
+    handler, url = failing_server(status=200, delay=1.0)
+    geocoder = geocode.Geocoder(url=url, rate=1000, workers=1, path_cache=str(tmp_path / 'geocode.sqlite'))
+    start = time.monotonic()
+    answer = geocoder.search('Gansplatz', 9.5, 46.8)
+    assert 'error' in answer
+    assert time.monotonic() - start < 1.0
+    assert geocoder.cache.get(geocoder.cache_key('Gansplatz', 9.5, 46.8)) is None
+
+
+@pytest.mark.parametrize('ttl, expired', [(None, False), (60, False), (0.1, True)])
+def test_sqlite_cache_ttl(tmp_path, ttl, expired):
+    from function_folder.sqlite_cache import SqliteCache
+    cache = SqliteCache(str(tmp_path / 'cache.sqlite'), 'test')
+    cache.set('key', {'result': [1]}, ttl=ttl)
+    time.sleep(0.2)
+    assert (cache.get('key') is None) == expired
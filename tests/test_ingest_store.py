@@ -0,0 +1,37 @@
+import pandas as pd
+from function_folder import ingest_store
+
+
+def make_page(subs, iat):
+    kpi = pd.DataFrame({'sub': subs, 'rating': [80.0] * len(subs), 'iat_original': [iat] * len(subs),
+                        'iat': ['2021-01-01 00:00:00'] * len(subs)})
+    rs = pd.DataFrame({'sub': subs, 'name': subs, 'category': 'restaurant', 'city': 'Chur', 'state': 'Grisons',
+                       'country': 'Switzerland', 'lat': 46.8, 'lon': 9.5, 'review_count': 1, 'rating': 80.0})
+    return kpi, rs
+
+
+# page without english reviews -> watermark moves on, version stays (no export, no new series)
+def test_empty_page_keeps_version(tmp_path):
+    store = ingest_store.IngestStore(str(tmp_path / 'store.sqlite'))
+    store.ingest(*make_page(['a', 'b'], 100), watermark={'iat': 100, 'signatures': ['s1']})
+    assert store.get_meta('version') == 1
+    kpi, rs = make_page([], 200)
+    store.ingest(kpi, rs, watermark={'iat': 200, 'signatures': ['s2']})
+    assert store.get_meta('version') == 1
+    assert store.get_meta('watermark') == {'iat': 200, 'signatures': ['s2']}
+    store.ingest(*make_page(['a'], 300), watermark={'iat': 300, 'signatures': ['s3']})
+    assert store.get_meta('version') == 2
+    assert store.subjects(['a'])['review_count'].tolist() == [2]
+
+
+# new kpi rows for the nlp stage and all subjects for the snapshot come from the store
+def test_kpi_since_and_business(tmp_path):
+    store = ingest_store.IngestStore(str(tmp_path / 'store.sqlite'))
+    store.ingest(*make_page(['b', 'a'], 100))
+    store.ingest(*make_page(['c', 'a'], 200))
+    assert store.kpi(100)['sub'].tolist() == ['c', 'a']
+    assert len(store.kpi()) == 4
+    business = store.business()
+    assert business.columns.tolist() == ingest_store.COLUMNS_RS
+    assert business['sub'].tolist() == ['a', 'b', 'c']
+    assert business['review_count'].tolist() == [2, 1, 1]
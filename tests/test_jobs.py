@@ -0,0 +1,31 @@
+import subprocess
+import sys
+import pytest
+from function_folder import jobs
+
+
+@pytest.fixture
+def job_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, 'file_path_job_state', str(tmp_path / 'job.json'))
+    monkeypatch.setattr(jobs, 'file_path_job_lock', str(tmp_path / 'job.lock'))
+
+
+# pid of a process which has ended
+def dead_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+
+def test_read_state_checks_the_pid(job_files):
+    jobs.write_state({'status': 'running', 'stage': 'nlp', 'message': '', 'pid': jobs.os.getpid()})
+    assert jobs.read_state()['status'] == 'running'
+    jobs.write_state({'status': 'running', 'stage': 'nlp', 'message': '', 'pid': dead_pid()})
+    assert jobs.read_state()['status'] == 'interrupted'
+
+
+# polling the state never takes the job lock -> a refresh requested at the same time gets it
+def test_read_state_takes_no_lock(job_files, monkeypatch):
+    jobs.write_state({'status': 'running', 'stage': 'nlp', 'message': '', 'pid': jobs.os.getpid()})
+    monkeypatch.setattr(jobs, 'acquire_lock', lambda: pytest.fail('read_state took the job lock'))
+    assert jobs.read_state()['status'] == 'running'
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+from function_folder import kpi_series
+
+
+def make_kpi(rng, n, subjects, iat_start):
+    return pd.DataFrame({'sub': ['sub' + str(i) for i in rng.integers(0, subjects, n)],
+                         'rating': rng.integers(0, 101, n).astype(float),
+                         'iat_original': iat_start + np.sort(rng.integers(0, 1000, n))})
+
+
+def assert_same_series(result, expected):
+    assert sorted(result.subjects) == sorted(expected.subjects)
+    for sub in expected.subjects:
+        pd.testing.assert_frame_equal(result.get(sub, 0), expected.get(sub, 0))
+
+
+# batches appended to the affected subjects -> same series as a build over all rows
+def test_update_matches_build(tmp_path):
+    rng = np.random.default_rng(0)
+    batches = [make_kpi(rng, 500, 40, 0)] + [make_kpi(rng, 30, 50, 1000 * i) for i in range(1, 5)]
+    # review with the same iat as an older review of its subject
+    batches.append(pd.DataFrame({'sub': ['sub0'], 'rating': [5.0], 'iat_original': [batches[0]['iat_original'].max()]}))
+    series = kpi_series.build_series(batches[0], 500)
+    for rowid, batch in enumerate(batches[1:]):
+        series = kpi_series.update_series(series, batch, 501 + rowid)
+        kpi_series.save_series(series, str(tmp_path / 'series'))
+        series = kpi_series.load_series(str(tmp_path / 'series'))
+    assert series.kpi_rowid == 500 + len(batches) - 1
+    assert_same_series(series, kpi_series.build_series(pd.concat(batches, ignore_index=True)))
@@ -0,0 +1,25 @@
+import pytest
+from function_folder import language
+from function_folder.sqlite_cache import SqliteCache
+
+
+@pytest.mark.parametrize('text, expected', [('', 'en'),
+                                            ('!!! 100', 'Other'),
+                                            ('ok!', language.SHORT_LANGUAGE),
+                                            ('Top', language.SHORT_LANGUAGE),
+                                            ('Great pizza', None)])
+def test_short_circuit(text, expected):
+    assert language.short_circuit(text) == expected
+
+
+# short texts never reach langdetect (and are not cached)
+def test_short_texts_are_not_detected(tmp_path, monkeypatch):
+    detected = []
+
+    def detect(text):
+        detected.append(text)
+        return 'de'
+    monkeypatch.setattr(language, 'detect', detect)
+    monkeypatch.setattr(language, 'cache_instance', SqliteCache(str(tmp_path / 'language.sqlite'), 'language'))
+    assert language.detect_many(['ok!', 'Top', '', 'Sehr gutes Essen']) == ['en', 'en', 'en', 'de']
+    assert detected == ['Sehr gutes Essen']
@@ -0,0 +1,111 @@
+import pytest
+import requests
+import stand_in
+from function_folder import mangrove_api
+
+
+# reviews with the given iats (the subject name is the number of the review)
+def make_reviews(iats):
+    return [{'signature': 'signature' + str(i),
+             'scheme': 'geo',
+             'payload': {'sub': 'geo:46.8,9.5?q=review' + str(i) + '&u=30', 'rating': 80, 'iat': iat,
+                         'opinion': ''},
+             'geo': {'coordinates': {'lat': 46.8, 'lon': 9.5}}} for i, iat in enumerate(iats)]
+
+
+# stand-in mangrove api which counts its requests and fails the first n_fail of them with status
+def server(reviews, n_fail=0, status=503):
+    handler = stand_in.mangrove_handler(reviews)
+
+    class Counting(handler):
+        requests = 0
+
+        def do_GET(self):
+            Counting.requests += 1
+            if Counting.requests <= n_fail:
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            super().do_GET()
+    return Counting, stand_in.start(Counting) + '/reviews'
+
+
+# all pages -> (list of review names in order, watermarks after the pages)
+def collect(client, watermark):
+    names, watermarks = [], []
+    for df, watermark in client.pages(watermark):
+        names.extend(df['payload.sub'].str.partition('?q=')[2].str.partition('&u=')[0].tolist())
+        watermarks.append(watermark)
+    return names, watermarks
+
+
+def start_watermark():
+    return {'iat': 0, 'signatures': []}
+
+
+# several reviews per iat, groups cross the page boundaries (page size 3)
+IATS = [10, 20, 20, 30, 30, 30, 40, 50, 50, 60, 60, 60, 70]
+
+
+def test_pages_with_shared_iat_have_no_loss_and_no_duplicates():
+    reviews = make_reviews(IATS)
+    handler, url = server(reviews)
+    names, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=3), start_watermark())
+    assert sorted(names) == sorted('review' + str(i) for i in range(len(IATS)))
+    assert len(names) == len(set(names))
+    assert watermarks[-1]['iat'] == 70
+
+
+def test_resume_from_saved_watermark():
+    reviews = make_reviews(IATS)
+    handler, url = server(reviews)
+    client = mangrove_api.MangroveClient(url=url, page_size=3)
+    pages = client.pages(start_watermark())
+    names = []
+    # update stops after two pages (e.g. killed), the saved watermark is inside the group of iat 30
+    for i in range(2):
+        df, watermark = next(pages)
+        names.extend(df['payload.sub'].tolist())
+    assert watermark['iat'] == 30
+    names_rest, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=3), watermark)
+    names = [name.partition('?q=')[2].partition('&u=')[0] for name in names] + names_rest
+    assert sorted(names) == sorted('review' + str(i) for i in range(len(IATS)))
+    # nothing new -> no pages
+    assert collect(mangrove_api.MangroveClient(url=url, page_size=3), watermarks[-1]) == ([], [])
+
+
+def test_new_reviews_with_iat_of_watermark():
+    handler, url = server(make_reviews([10, 20, 20]))
+    names, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=3), start_watermark())
+    # one more review with iat 20 arrives after the update
+    handler, url = server(make_reviews([10, 20, 20, 20]))
+    names, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=3), watermarks[-1])
+    assert names == ['review3']
+
+
+def test_page_size_zero_loads_everything_in_one_request():
+    reviews = make_reviews(IATS)
+    handler, url = server(reviews)
+    names, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=0), start_watermark())
+    assert sorted(names) == sorted('review' + str(i) for i in range(len(IATS)))
+    assert len(watermarks) == 1
+    assert handler.requests == 1
+
+
+def test_retry_with_backoff_on_server_errors(monkeypatch):
+    monkeypatch.setattr(mangrove_api, 'BACKOFF', 0.01)
+    handler, url = server(make_reviews(IATS), n_fail=2, status=503)
+    names, watermarks = collect(mangrove_api.MangroveClient(url=url, page_size=0), start_watermark())
+    assert len(names) == len(IATS)
+    assert handler.requests == 3
+
+
+def test_retries_exhausted_raise(monkeypatch):
+    monkeypatch.setattr(mangrove_api, 'BACKOFF', 0.01)
+    monkeypatch.setattr(mangrove_api, 'RETRIES', 2)
+    handler, url = server(make_reviews(IATS), n_fail=10, status=500)
+    with pytest.raises(requests.exceptions.RequestException):
+        collect(mangrove_api.MangroveClient(url=url, page_size=3), start_watermark())
+    # first request + 2 retries
+    assert handler.requests == 3
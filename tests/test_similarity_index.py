@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+from function_folder import figure
+from function_folder import similarity_index
+
+
+def make_index():
+    neighbours = np.array([[1, 2, 3], [0, 2, 3], [0, 1, 3], [0, 1, 2]], dtype=np.int32)
+    scores = np.array([[0.9, 0.8, 0.7], [0.9, 0.6, 0.5], [0.8, 0.6, 0.4], [0.7, 0.5, 0.4]], dtype=np.float16)
+    return similarity_index.SimilarityIndex(['a', 'b', 'c', 'd'], neighbours, scores)
+
+
+# duplicated subs in the filtered business dataframe -> first row, scalar ratings
+def test_query_with_lookup_of_duplicated_subs():
+    df = pd.DataFrame({'sub': ['b', 'b', 'c', 'd'], 'name': ['B', 'B2', 'C', 'D'], 'rating': [80, 10, 20, 60]})
+    lookup = figure.SubjectLookup(df)
+    assert lookup.names == {'b': 'B', 'c': 'C', 'd': 'D'}
+    result = make_index().query('a', n=3, ratings=lookup.ratings, rating_range=(50, 100))
+    assert [sub for sub, score in result] == ['b', 'd']
+    assert make_index().query('a', n=3, ratings=lookup.ratings, rating_range=(90, 100)) == []
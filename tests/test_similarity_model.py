@@ -0,0 +1,112 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from collections import Counter
+from function_folder import preprocess
+from function_folder import similarity_index
+from function_folder import similarity_model
+
+K = 3
+
+
+# random token lists (zipf distributed words like review texts)
+def make_texts(rng, n, start=0, vocabulary=2000):
+    p = 1 / np.arange(1, vocabulary + 1) ** 1.1
+    p /= p.sum()
+    return {'sub' + str(i): ['word' + str(j) for j in rng.choice(vocabulary, size=rng.integers(5, 120), p=p)]
+            for i in range(start, start + n)}
+
+
+def update(texts, subs, path):
+    df = pd.DataFrame({'sub': subs, 'opinion': [texts[sub] for sub in subs]})
+    similarity_model.update(df, str(path / 'model'), str(path / 'index'))
+
+
+# full path -> words which occur just once are dropped (like preprocess.normalise), tf-idf over all subjects
+def full_index(texts):
+    counts = Counter(word for words in texts.values() for word in words)
+    df = pd.DataFrame({'sub': list(texts), 'opinion': [[i for i in words if counts[i] > 1] for words in texts.values()]})
+    vectors = preprocess.feature_extraction(df)
+    return similarity_index.build_index(vectors, df['sub'].tolist()), vectors
+
+
+# incremental model over several batches (new and changed subjects, corpus grows by less than rebuild_ratio)
+def test_incremental_matches_full_rebuild(tmp_path):
+    rng = np.random.default_rng(0)
+    texts = make_texts(rng, 300)
+    update(texts, list(texts), tmp_path)
+    n_start = len(texts)
+    for batch in range(3):
+        new = make_texts(rng, 9, start=len(texts))
+        changed = rng.choice(n_start, 5, replace=False)
+        for i in changed:
+            texts['sub' + str(i)] = texts['sub' + str(i)] + make_texts(rng, 1)['sub0']
+        texts.update(new)
+        update(texts, list(new) + ['sub' + str(i) for i in changed], tmp_path)
+    model = similarity_model.load_model(str(tmp_path / 'model'))
+    assert model.needs_rebuild() == False
+    incremental = similarity_index.load_index(str(tmp_path / 'index'))
+    full, vectors = full_index(texts)
+    assert incremental.subjects == full.subjects
+    for sub in full.subjects:
+        expected = full.query(sub, K)
+        result = incremental.query(sub, K)
+        assert len(result) == len(expected)
+        # scores per rank
+        for (sub_result, score_result), (sub_expected, score_expected) in zip(result, expected):
+            assert abs(score_result - score_expected) <= similarity_model.TOLERANCE
+        # ids -> other neighbours just where the full scores are within the tolerance of the k-th best
+        row = vectors[full.position[sub]]
+        for sub_result, score_result in result:
+            score = row.dot(vectors[full.position[sub_result]].T).toarray()[0, 0]
+            assert score >= expected[-1][1] - similarity_model.TOLERANCE
+
+
+# delta files on disk -> same model as in memory
+def test_load_model_applies_deltas(tmp_path):
+    rng = np.random.default_rng(1)
+    texts = make_texts(rng, 50)
+    update(texts, list(texts), tmp_path)
+    model = similarity_model.load_model(str(tmp_path / 'model'))
+    texts['sub0'] = texts['sub1']
+    texts.update(make_texts(rng, 2, start=50))
+    subs = ['sub0', 'sub50', 'sub51']
+    rows = model.set_counts(subs, similarity_model.term_counts([texts[sub] for sub in subs]))
+    model.set_vectors(rows, model.weight_rows(rows))
+    similarity_model.save_delta(model, rows, str(tmp_path / 'model'))
+    loaded = similarity_model.load_model(str(tmp_path / 'model'))
+    assert loaded.subjects == model.subjects
+    assert (loaded.counts != model.counts).nnz == 0
+    assert (loaded.vectors != model.vectors).nnz == 0
+    assert (loaded.doc_freq == model.doc_freq).all()
+    assert (loaded.total == model.total).all()
+
+
+# save of the whole model interrupted -> previous model (and its deltas) stays readable
+def test_interrupted_save_keeps_previous_model(tmp_path, monkeypatch):
+    rng = np.random.default_rng(2)
+    texts = make_texts(rng, 20)
+    update(texts, list(texts), tmp_path)
+    model = similarity_model.load_model(str(tmp_path / 'model'))
+    subjects = list(model.subjects)
+    model.set_counts(['sub20'], similarity_model.term_counts([texts['sub0']]))
+    save_npz = similarity_model.sp.save_npz
+
+    def crash(path, matrix):
+        if 'vectors' in path:
+            raise OSError('disk full')
+        save_npz(path, matrix)
+    monkeypatch.setattr(similarity_model.sp, 'save_npz', crash)
+    with pytest.raises(OSError):
+        similarity_model.save_model(model, str(tmp_path / 'model'))
+    loaded = similarity_model.load_model(str(tmp_path / 'model'))
+    assert loaded.subjects == subjects
+    assert loaded.counts.shape[0] == loaded.vectors.shape[0] == len(subjects)
+    # next save -> new model, files of the interrupted save are removed
+    monkeypatch.setattr(similarity_model.sp, 'save_npz', save_npz)
+    similarity_model.save_model(model, str(tmp_path / 'model'))
+    loaded = similarity_model.load_model(str(tmp_path / 'model'))
+    assert loaded.subjects == subjects + ['sub20']
+    assert sorted(os.listdir(str(tmp_path / 'model'))) == ['counts_000002.npz', 'meta.json', 'subjects_000002.json',
+                                                            'vectors_000002.npz']
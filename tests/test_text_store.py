@@ -0,0 +1,25 @@
+from function_folder import text_store
+
+
+def test_append_joins_texts_in_order(tmp_path):
+    store = text_store.TextStore(str(tmp_path))
+    store.append([('a', 'one'), ('b', 'two'), ('a', ''), ('a', 'three')])
+    assert list(store.iter_texts()) == [('a', 'one three'), ('b', 'two')]
+
+
+# page fetched again after an interrupted update (texts appended, ingest not committed)
+def test_append_skips_known_reviews(tmp_path):
+    store = text_store.TextStore(str(tmp_path))
+    page = [('a', 'one', 'signature0'), ('b', 'two', 'signature1')]
+    store.append(page)
+    store.append(page + [('a', 'three', 'signature2'), ('a', 'three', 'signature2')])
+    assert list(store.iter_texts()) == [('a', 'one three'), ('b', 'two')]
+    # the ids are kept when the entries are merged
+    store.compact()
+    store.append(page)
+    assert list(store.iter_texts()) == [('a', 'one three'), ('b', 'two')]
+    store.close()
+    # and when the store is opened again
+    store = text_store.TextStore(str(tmp_path))
+    store.append(page)
+    assert len(store.entries()) == 2
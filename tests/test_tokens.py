@@ -0,0 +1,27 @@
+import json
+from function_folder import tokens
+
+
+# token store with known token lists (no nltk needed)
+def make_store(path, texts):
+    store = tokens.TokenStore(str(path / 'tokens.sqlite'))
+    with store.connection:
+        store.connection.executemany('INSERT INTO tokens (text_hash, tokens) VALUES (?, ?)',
+                                     [(key, json.dumps(value)) for key, value in texts.items()])
+    return store
+
+
+# changed subjects only (incremental mode) -> same words occur once as after a sync of the whole corpus
+def test_partial_sync_matches_full_sync(tmp_path):
+    texts = {'a1': ['pizza', 'lake'], 'b1': ['pizza', 'view'], 'c1': ['view', 'boat'],
+             'a2': ['pizza', 'lake', 'boat'], 'd1': ['castle']}
+    store = make_store(tmp_path, texts)
+    store.sync(['a', 'b', 'c'], ['a1', 'b1', 'c1'])
+    assert store.occurring_once() == {'lake', 'boat'}
+    store.sync(['a', 'd'], ['a2', 'd1'], partial=True)
+    partial = store.occurring_once()
+    store.close()
+    (tmp_path / 'full').mkdir()
+    store = make_store(tmp_path / 'full', texts)
+    store.sync(['a', 'b', 'c', 'd'], ['a2', 'b1', 'c1', 'd1'])
+    assert partial == store.occurring_once() == {'lake', 'castle'}